@@ -25,6 +25,7 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 from src import general
+import planner
 
 
 def parse_cla() -> argparse.Namespace:
@@ -62,6 +63,49 @@ def parse_cla() -> argparse.Namespace:
         + "YYYY-MM-DD_hh-mm format.",
     )
 
+    parser.add_argument(
+        "--keep-last",
+        metavar="count",
+        dest="keep_last",
+        type=int,
+        help="Flush every run but the newest count runs. Combined with -f or -d, protects the "
+        + "newest count runs from them.",
+    )
+
+    parser.add_argument(
+        "--keep-daily",
+        metavar="days",
+        dest="keep_daily",
+        type=int,
+        help="Flush every run but the newest run of each of the last days days. Combined with -f "
+        + "or -d, protects those runs from them.",
+    )
+
+    parser.add_argument(
+        "--max-total-size",
+        metavar="size",
+        dest="max_total_size",
+        help="Flush the oldest runs until the remaining runs take up at most size, e.g. 200GB. "
+        + "The newest run is never flushed.",
+    )
+
+    parser.add_argument(
+        "--flush-workers",
+        metavar="count",
+        dest="flush_workers",
+        type=int,
+        default=8,
+        help="Number of threads measuring and deleting run directories when flushing. "
+        + "Defaults to 8.",
+    )
+
+    parser.add_argument(
+        "--list-runs",
+        action="store_true",
+        dest="list_runs",
+        help="Print every run in the working directory with its start time and size, then exit.",
+    )
+
     parser.add_argument(
         "-p",
         "--print-tests",
@@ -113,6 +157,260 @@ def parse_cla() -> argparse.Namespace:
         + "should be a float between 0.0 (exclusive) and 1.0 (inclusive).",
     )
 
+    parser.add_argument(
+        "--stage-mode",
+        choices=["link", "copy"],
+        default="link",
+        dest="stage_mode",
+        help="How test files are placed into execute directories. 'link' (default) stores each "
+        + "test file once in a content-addressed store in the working directory and hardlinks "
+        + "it into every run, falling back to copies across filesystems. 'copy' copies every "
+        + "file into every run.",
+    )
+
+    parser.add_argument(
+        "--stage-workers",
+        metavar="count",
+        dest="stage_workers",
+        type=int,
+        default=4,
+        help="Number of tests to stage into execution directories at the same time, while "
+        + "previously staged tests are submitted. Defaults to 4.",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        metavar="count",
+        dest="chunk_size",
+        type=int,
+        help="Submit each test in chunks of at most this many jobs. Defaults to 1000 when "
+        + "--max-idle or --max-idle-per-resource is given, otherwise each test is submitted at "
+        + "once.",
+    )
+
+    parser.add_argument(
+        "--max-idle",
+        metavar="count",
+        dest="max_idle",
+        type=int,
+        help="Hold back further chunks while at least this many exerciser jobs are idle in the "
+        + "schedd queue.",
+    )
+
+    parser.add_argument(
+        "--max-idle-per-resource",
+        metavar="count",
+        dest="max_idle_per_resource",
+        type=int,
+        help="Hold back further jobs for a resource while at least this many exerciser jobs "
+        + "targeting that resource are idle in the schedd queue.",
+    )
+
+    parser.add_argument(
+        "--poll-interval",
+        metavar="seconds",
+        dest="poll_interval",
+        type=int,
+        default=60,
+        help="Number of seconds to wait before checking the queue again while submission is "
+        + "held back. Defaults to 60.",
+    )
+
+    parser.add_argument(
+        "--snapshot-ttl",
+        metavar="seconds",
+        dest="snapshot_ttl",
+        type=int,
+        default=300,
+        help="Reuse a cached resource snapshot from the working directory if it is younger than "
+        + "this many seconds, instead of querying the collector. 0 always queries. Defaults to "
+        + "300.",
+    )
+
+    parser.add_argument(
+        "--snapshot-attrs",
+        metavar="attr[,attr...]",
+        dest="snapshot_attrs",
+        help="Comma separated slot attributes to also record in the resource snapshot. The "
+        + "number of slots with each value of them is kept per resource and printed by -s.",
+    )
+
+    parser.add_argument(
+        "--snapshot-diff",
+        nargs=2,
+        metavar=("old", "new"),
+        dest="snapshot_diff",
+        help="Prints the resources that appeared, disappeared, or changed size between two saved "
+        + "snapshots, without querying the collector. Each snapshot can be given as a snapshot "
+        + "file, the timestamp of an exerciser run, the name of a cached snapshot, or 'latest'.",
+    )
+
+    parser.add_argument(
+        "--collector",
+        metavar="[name=]host[,host...]",
+        dest="collector",
+        action="append",
+        help="Specify a pool to query for resources, as a comma-separated list of its collectors. "
+        + "Every collector is queried at the same time, and the pool is answered by the first "
+        + "one to answer without an error. A host of file:path answers from a JSON file of slot "
+        + "ads. Can be given more than once to merge the resources of several pools. Defaults "
+        + "to the OSPool central manager.",
+    )
+
+    parser.add_argument(
+        "--collector-timeout",
+        metavar="seconds",
+        dest="collector_timeout",
+        type=int,
+        default=30,
+        help="Skip pools none of whose collectors answered within this many seconds. Defaults "
+        + "to 30.",
+    )
+
+    parser.add_argument(
+        "--metrics-textfile-dir",
+        metavar="directory_path",
+        dest="metrics_textfile_dir",
+        help="Also write the run's phase metrics to pool_exerciser.prom in this directory, for "
+        + "the Prometheus node exporter's textfile collector.",
+    )
+
+    parser.add_argument(
+        "--retry",
+        metavar="YYYY-MM-DD_hh-mm",
+        dest="retry",
+        help="Instead of submitting a new run, resubmit only the samples of the run with this "
+        + "timestamp whose latest attempt failed or aborted. Can be limited to specific tests.",
+    )
+
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        dest="daemon",
+        help="Keep running, and run every test on its own schedule (see --schedule and "
+        + "--daemon-interval). Each run gets its own execution directory, and its jobs are "
+        + "submitted in chunks spread evenly over --spread seconds. Stop with Ctrl-C or SIGTERM.",
+    )
+
+    parser.add_argument(
+        "--schedule",
+        metavar="test_name=seconds",
+        dest="schedule",
+        action="append",
+        default=[],
+        help="In daemon mode, run this test every this many seconds. Can be given once per test.",
+    )
+
+    parser.add_argument(
+        "--daemon-interval",
+        metavar="seconds",
+        dest="daemon_interval",
+        type=int,
+        default=3600,
+        help="In daemon mode, run tests without a --schedule every this many seconds. Defaults "
+        + "to 3600.",
+    )
+
+    parser.add_argument(
+        "--spread",
+        metavar="seconds",
+        dest="spread",
+        type=int,
+        help="In daemon mode, spread the submission of each run's jobs evenly over this many "
+        + "seconds. Defaults to the interval of the test.",
+    )
+
+    parser.add_argument(
+        "--heartbeat-interval",
+        metavar="seconds",
+        dest="heartbeat_interval",
+        type=int,
+        default=60,
+        help="In daemon mode, refresh the heartbeat in the status file at least every this many "
+        + "seconds. Defaults to 60.",
+    )
+
+    parser.add_argument(
+        "--cancel-after-failures",
+        metavar="count",
+        dest="cancel_after_failures",
+        type=int,
+        help="After submitting, follow the run's shared log and remove the idle jobs of a test "
+        + "on a resource once this many of its jobs there have failed or aborted.",
+    )
+
+    parser.add_argument(
+        "--cancel-after-successes",
+        metavar="count",
+        dest="cancel_after_successes",
+        type=int,
+        help="After submitting, follow the run's shared log and remove the idle jobs of a test "
+        + "on a resource once this many of its jobs there have passed.",
+    )
+
+    parser.add_argument(
+        "--watch",
+        metavar="YYYY-MM-DD_hh-mm",
+        dest="watch",
+        help="Instead of submitting a new run, follow the run with this timestamp and apply the "
+        + "--cancel-after-failures and --cancel-after-successes thresholds to it.",
+    )
+
+    parser.add_argument(
+        "--watch-interval",
+        metavar="seconds",
+        dest="watch_interval",
+        type=int,
+        default=60,
+        help="Number of seconds between checks of the shared log while watching a run. "
+        + "Defaults to 60.",
+    )
+
+    parser.add_argument(
+        "--sampling",
+        dest="sampling",
+        choices=["machine", "resource"],
+        default="resource",
+        help="How the samples of each resource are placed. machine spreads them over distinct "
+        + "machines (or glideins) of the resource; resource only constrains them to the "
+        + "resource. Defaults to resource.",
+    )
+
+    parser.add_argument(
+        "--placement-grace",
+        metavar="seconds",
+        dest="placement_grace",
+        type=int,
+        default=1800,
+        help="Number of seconds a sample waits for the machine it was placed on before it may "
+        + "run on any machine of its resource. Defaults to 1800.",
+    )
+
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan",
+        help="Print the number of jobs each test would submit, the cpus, memory and disk they "
+        + "request, and the input bytes they transfer, then exit without submitting.",
+    )
+
+    parser.add_argument(
+        "--max-jobs",
+        metavar="count",
+        dest="max_jobs",
+        type=int,
+        help="Largest number of jobs a run may submit across all tests. The resource sample size "
+        + "is scaled down until the run fits.",
+    )
+
+    parser.add_argument(
+        "--max-transfer-bytes",
+        metavar="size",
+        dest="max_transfer_bytes",
+        help="Largest number of input bytes a run may transfer to its jobs, e.g. 500GB. The "
+        + "resource sample size is scaled down until the run fits.",
+    )
+
     return parser.parse_args()
 
 
@@ -129,6 +427,72 @@ def process_cla(args: argparse.Namespace):
         print("Error: Resource sample size must be between 0.0 (exclusive) and 1.0 (inclusive)")
         sys.exit(1)
 
+    if args.metrics_textfile_dir is not None and not os.path.isdir(args.metrics_textfile_dir):
+        print(f"Error: Specified metrics directory {args.metrics_textfile_dir} does not exist")
+        sys.exit(1)
+
+    if args.snapshot_ttl < 0:
+        print("Error: Snapshot TTL must not be negative")
+        sys.exit(1)
+
+    if args.stage_workers < 1:
+        print("Error: Number of stage workers must be at least 1")
+        sys.exit(1)
+
+    if args.daemon and (args.retry is not None or args.watch is not None):
+        print("Error: Cannot select --daemon together with --retry or --watch")
+        sys.exit(1)
+
+    if args.retry is not None and args.watch is not None:
+        print("Error: Cannot select both --retry and --watch options at the same time")
+        sys.exit(1)
+
+    if args.watch is not None and args.cancel_after_failures is None and (
+        args.cancel_after_successes is None
+    ):
+        print("Error: --watch needs --cancel-after-failures or --cancel-after-successes")
+        sys.exit(1)
+
+    if args.max_total_size is not None:
+        max_total_size = planner.parse_size(args.max_total_size)
+        if max_total_size is None:
+            print(f"Error: Invalid size '{args.max_total_size}' provided to --max-total-size")
+            sys.exit(1)
+        args.max_total_size = max_total_size
+
+    if args.max_transfer_bytes is not None:
+        max_transfer_bytes = planner.parse_size(args.max_transfer_bytes)
+        if max_transfer_bytes is None:
+            print(
+                f"Error: Invalid size '{args.max_transfer_bytes}' provided to --max-transfer-bytes"
+            )
+            sys.exit(1)
+        args.max_transfer_bytes = max_transfer_bytes
+
+    for option in (
+        "chunk_size",
+        "max_idle",
+        "max_idle_per_resource",
+        "poll_interval",
+        "cancel_after_failures",
+        "cancel_after_successes",
+        "watch_interval",
+        "daemon_interval",
+        "spread",
+        "heartbeat_interval",
+        "max_jobs",
+        "max_transfer_bytes",
+        "placement_grace",
+        "keep_last",
+        "keep_daily",
+        "flush_workers",
+        "collector_timeout",
+    ):
+        value = getattr(args, option)
+        if value is not None and value < 1:
+            print(f"Error: --{option.replace('_', '-')} must be at least 1")
+            sys.exit(1)
+
     # process tests arg
     # split the list around commas and remove duplicates
     for item in args.tests:
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: local stand-in for the parts of the htcondor2 bindings the exerciser uses, so the exerciser
+    and monitor can be run and benchmarked without a pool. install() makes it importable as
+    htcondor2. event logs read by this module are JSON lines files written by write_event_log()
+"""
+
+import enum
+import json
+import random
+import sys
+import time
+
+
+class JobEventType(enum.Enum):
+    SUBMIT = 0
+    EXECUTE = 1
+    JOB_TERMINATED = 5
+    JOB_ABORTED = 9
+
+
+class AdTypes(enum.Enum):
+    StartDaemon = 14
+
+
+class JobEvent:
+    """
+    Usage: a single event read from a fake event log
+    """
+
+    __slots__ = ("type", "cluster", "proc", "timestamp", "attrs")
+
+    def __init__(self, record: dict):
+        self.type = JobEventType[record["t"]]
+        self.cluster = record["c"]
+        self.proc = record["p"]
+        self.timestamp = record["ts"]
+        self.attrs = record.get("a", {})
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def __contains__(self, key):
+        return key in self.attrs
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+
+class JobEventLog:
+    """
+    Usage: reads a fake event log, remembering its offset. pickles its offset like the real one
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.offset = 0
+
+    def events(self, stop_after: int = None):
+        """
+        Usage: iterate through new events, waiting up to stop_after seconds for more (None waits
+            forever, 0 never waits)
+        """
+        deadline = None if stop_after is None else time.monotonic() + stop_after
+        with open(self.filename, "r") as f:
+            while True:
+                f.seek(self.offset)
+                line = f.readline()
+                if line.endswith("\n"):
+                    self.offset = f.tell()
+                    yield JobEvent(json.loads(line))
+                    continue
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                time.sleep(0.1)
+
+    def close(self):
+        pass
+
+
+class Submit(dict):
+    """
+    Usage: submit description. the text of the submit file is parsed as key = value lines
+    """
+
+    def __init__(self, text: str = ""):
+        super().__init__()
+        for line in text.splitlines():
+            if "=" in line:
+                key, value = line.split("=", 1)
+                self[key.strip()] = value.strip()
+
+    def setSubmitMethod(self, method: int, allow_reserved: bool = False):
+        self["SubmitMethod"] = method
+
+    def issue_credentials(self):
+        return None
+
+
+class SubmitResult:
+    def __init__(self, cluster: int, num_procs: int):
+        self._cluster = cluster
+        self._num_procs = num_procs
+
+    def cluster(self) -> int:
+        return self._cluster
+
+    def num_procs(self) -> int:
+        return self._num_procs
+
+
+class Schedd:
+    """
+    Usage: schedd that accepts every submission and keeps nothing but counters. jobs are reported
+        idle until they are removed
+    """
+
+    next_cluster = 1
+
+    def __init__(self, *args, **kwargs):
+        self.submitted = 0
+
+    def submit(self, job, count: int = 0, itemdata=None, **kwargs) -> SubmitResult:
+        num_procs = sum(1 for _ in itemdata) if itemdata is not None else max(count, 1)
+        self.submitted += num_procs
+        cluster = Schedd.next_cluster
+        Schedd.next_cluster += 1
+        return SubmitResult(cluster, num_procs)
+
+    def query(self, constraint: str = None, projection: list = None, **kwargs) -> list:
+        return []
+
+    def act(self, action, job_spec, **kwargs):
+        return None
+
+
+class Collector:
+    """
+    Usage: collector answering every query with synthetic slot ads. the number of ads and
+        resources is set with configure_collector()
+    """
+
+    num_ads = 1000
+    num_resources = 100
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def query(self, ad_type=None, constraint=None, projection=None, **kwargs) -> list:
+        ads = []
+        for i in range(Collector.num_ads):
+            resource = i % Collector.num_resources
+            ad = {
+                "GLIDEIN_ResourceName": f"RESOURCE_{resource:05}",
+                "GLIDEIN_Site": f"SITE_{resource // 4:05}",
+                "OSG_INSTITUTION_ID": f"INSTITUTION_{resource // 16:05}",
+                "Machine": f"host{i % max(Collector.num_ads // 2, 1):06}.resource{resource:05}",
+            }
+            if projection:
+                ad = {attr: ad[attr] for attr in projection if attr in ad}
+            ads.append(ad)
+        return ads
+
+
+def configure_collector(num_ads: int, num_resources: int):
+    """
+    Usage: set the size of the synthetic collector responses
+    """
+    Collector.num_ads = num_ads
+    Collector.num_resources = num_resources
+
+
+def install():
+    """
+    Usage: make this module importable as htcondor2
+    """
+    sys.modules["htcondor2"] = sys.modules[__name__]
+
+
+def write_event_log(
+    path: str,
+    num_resources: int,
+    num_events: int,
+    tests: list = None,
+    failure_rate: float = 0.05,
+    abort_rate: float = 0.05,
+    seed: int = 0,
+) -> int:
+    """
+    Usage: write a synthetic shared exerciser log in the format read by JobEventLog
+    @param path: file to write
+    @param num_resources: number of distinct resources the jobs target
+    @param num_events: approximate number of events to write
+    @param tests: names of the tests that were submitted, one cluster each
+    @param failure_rate: fraction of jobs that terminate with a nonzero exit code
+    @param abort_rate: fraction of jobs that are aborted
+    @param seed: seed of the random outcomes, so logs are reproducible
+    @return: number of events written
+    """
+    rng = random.Random(seed)
+    tests = tests or ["checksum"]
+    # every job writes a submit, execute and terminate event, or a submit and abort event
+    jobs_per_test = max(num_events // (3 * len(tests)), 1)
+    timestamp = 1700000000
+    written = 0
+
+    with open(path, "w") as f:
+        for cluster, test in enumerate(tests, start=1):
+            for proc in range(jobs_per_test):
+                resource = f"RESOURCE_{proc % num_resources:05}"
+                # resource names come from the pool, and may hold the separators of the notes
+                if proc % num_resources == num_resources - 1:
+                    resource += ",ZONE:1"
+                sample = proc // num_resources
+                record = {
+                    "t": "SUBMIT",
+                    "c": cluster,
+                    "p": proc,
+                    "ts": timestamp,
+                    "a": {"LogNotes": f"exerciser_info:{test},{resource},{sample},0"},
+                }
+                f.write(json.dumps(record) + "\n")
+                written += 1
+        for cluster, test in enumerate(tests, start=1):
+            for proc in range(jobs_per_test):
+                timestamp += 1
+                outcome = rng.random()
+                if outcome < abort_rate:
+                    record = {"t": "JOB_ABORTED", "c": cluster, "p": proc, "ts": timestamp}
+                    f.write(json.dumps(record) + "\n")
+                    written += 1
+                    continue
+                record = {"t": "EXECUTE", "c": cluster, "p": proc, "ts": timestamp}
+                f.write(json.dumps(record) + "\n")
+                return_value = 1 if outcome < abort_rate + failure_rate else 0
+                record = {
+                    "t": "JOB_TERMINATED",
+                    "c": cluster,
+                    "p": proc,
+                    "ts": timestamp + rng.randint(10, 600),
+                    "a": {"ReturnValue": return_value, "TerminatedNormally": True},
+                }
+                f.write(json.dumps(record) + "\n")
+                written += 2
+
+    return written
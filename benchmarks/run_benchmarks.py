@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: offline benchmarks of the exerciser's hot paths (get_resources, execute_tests with and
+    without throttled submission, test staging, and monitor.status) against a fake htcondor2
+    backend. writes the duration and peak memory of each benchmark as JSON, and optionally
+    compares them against a previous result file
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+import fake_htcondor2
+
+# the fake backend has to be in place before any exerciser module imports htcondor2
+fake_htcondor2.install()
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), "src"))
+import general
+import monitor
+import snapshot
+import staging
+
+
+def parse_cla() -> argparse.Namespace:
+    """
+    Usage: command line argument parser
+    @return: parsed arguments in argparse.Namespace object
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--resources",
+        metavar="count",
+        dest="resources",
+        type=int,
+        default=1000,
+        help="Number of distinct resources in the synthetic pool and event log. Defaults to 1000.",
+    )
+
+    parser.add_argument(
+        "--slots",
+        metavar="count",
+        dest="slots",
+        type=int,
+        default=20000,
+        help="Number of slot ads returned by the fake collector. Defaults to 20000.",
+    )
+
+    parser.add_argument(
+        "--events",
+        metavar="count",
+        dest="events",
+        type=int,
+        default=100000,
+        help="Approximate number of events in the synthetic shared log. Defaults to 100000.",
+    )
+
+    parser.add_argument(
+        "--sample-size",
+        metavar="size",
+        dest="sample_size",
+        type=float,
+        default=0.25,
+        help="Resource sample size used for submission planning. Defaults to 0.25.",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        metavar="count",
+        dest="chunk_size",
+        type=int,
+        default=1000,
+        help="Chunk size of the throttled submission benchmark. Defaults to 1000.",
+    )
+
+    parser.add_argument(
+        "--stage-files",
+        metavar="count",
+        dest="stage_files",
+        type=int,
+        default=4,
+        help="Number of input files in the synthetic test that is staged. Defaults to 4.",
+    )
+
+    parser.add_argument(
+        "--stage-file-size",
+        metavar="MiB",
+        dest="stage_file_size",
+        type=int,
+        default=64,
+        help="Size in MiB of each input file of the synthetic test. Defaults to 64.",
+    )
+
+    parser.add_argument(
+        "--stage-runs",
+        metavar="count",
+        dest="stage_runs",
+        type=int,
+        default=5,
+        help="Number of execute dirs the synthetic test is staged into. Defaults to 5.",
+    )
+
+    parser.add_argument(
+        "--no-memory",
+        action="store_false",
+        dest="memory",
+        help="Skip the second, traced pass of each benchmark that measures peak memory.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="file_path",
+        dest="output",
+        default="bench_results.json",
+        help="File to write the results to. Defaults to bench_results.json.",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        metavar="file_path",
+        dest="baseline",
+        help="Results file of a previous run to compare against. Exits with status 1 if any "
+        + "benchmark regressed by more than --tolerance.",
+    )
+
+    parser.add_argument(
+        "--tolerance",
+        metavar="fraction",
+        dest="tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed slowdown or memory growth relative to --baseline. Defaults to 0.25.",
+    )
+
+    return parser.parse_args()
+
+
+def measure(name: str, run, track_memory: bool, unit: str = "items") -> dict:
+    """
+    Usage: time a benchmark, then run it again under tracemalloc to find its peak memory. the
+        benchmark's own output is discarded
+    @param name: name of the benchmark in the results
+    @param run: callable performing the benchmark once, returning the number of units handled
+    @param track_memory: whether to do the traced pass
+    @param unit: what run() counts, e.g. "jobs" or "bytes"
+    @return: dict with the results of the benchmark
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        count = run()
+        seconds = time.perf_counter() - start
+
+        peak_bytes = None
+        if track_memory:
+            tracemalloc.start()
+            run()
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    result = {
+        "name": name,
+        "seconds": seconds,
+        "count": count,
+        "unit": unit,
+        "per_second": count / seconds if seconds > 0 else None,
+        "peak_bytes": peak_bytes,
+    }
+    print(
+        f"{name}: {seconds:.3f}s for {count} {unit}"
+        + (f", peak {peak_bytes / 2**20:.1f} MiB" if peak_bytes is not None else "")
+    )
+    return result
+
+
+def bench_get_resources(args: argparse.Namespace):
+    """
+    Usage: query the fake collector for the resources of the pool with general.get_resources(),
+        which summarizes the ads into a snapshot
+    """
+    fake_htcondor2.configure_collector(args.slots, args.resources)
+    collector = snapshot.get_collector()
+
+    def run():
+        general.get_resources(collector)
+        return args.slots
+
+    return run
+
+
+def make_test(tests_dir: str, name: str, input_files: int = 0, input_size: int = 0) -> Path:
+    """
+    Usage: create a synthetic test dir with a submit file, an executable, and input files
+    @param input_files: number of input files
+    @param input_size: size in MiB of each input file
+    @return: Path to the test dir
+    """
+    test_dir = Path(os.path.join(tests_dir, name))
+    if test_dir.exists():
+        return test_dir
+    os.makedirs(test_dir)
+    with open(os.path.join(test_dir, f"{name}.sub"), "w") as f:
+        f.write(f"executable = {name}.exe\nqueue\n")
+    with open(os.path.join(test_dir, f"{name}.exe"), "w") as f:
+        f.write("#!/bin/sh\necho Test Success\n")
+    chunk = os.urandom(2**20)
+    for i in range(input_files):
+        with open(os.path.join(test_dir, f"input_{i}.dat"), "wb") as f:
+            for _ in range(input_size):
+                f.write(chunk)
+    return test_dir
+
+
+def bench_execute_tests(args: argparse.Namespace, work_dir: Path, throttle: dict = None):
+    """
+    Usage: plan and submit a run of one small test over the whole synthetic pool with
+        general.execute_tests(), from a snapshot taken beforehand. with a throttle, the jobs go
+        through submit_items() in chunks, holding back items for resources at their idle limit
+    """
+    fake_htcondor2.configure_collector(args.slots, args.resources)
+    pool_snapshot = snapshot.take_snapshot(snapshot.get_collector())
+    resources = snapshot.resource_counts(pool_snapshot)
+    tests_dir = Path(os.path.join(work_dir, "tests_submit"))
+    make_test(tests_dir, "submit")
+    working_dir = Path(
+        os.path.join(work_dir, "working_throttled" if throttle is not None else "working_submit")
+    )
+    os.makedirs(working_dir, exist_ok=True)
+
+    def run():
+        general.execute_tests(
+            tests_dir,
+            working_dir,
+            ["submit"],
+            args.sample_size,
+            throttle=throttle,
+            pool_snapshot=pool_snapshot,
+            placement={"grace": 1800},
+        )
+        return general.count_items(resources, args.sample_size)
+
+    return run
+
+
+def bench_staging(args: argparse.Namespace, work_dir: Path, stage_mode: str):
+    """
+    Usage: stage a synthetic test with large input files into several execute dirs
+    """
+    test_dir = make_test(
+        os.path.join(work_dir, "tests"), "synthetic", args.stage_files, args.stage_file_size
+    )
+    working_dir = os.path.join(work_dir, f"working_{stage_mode}")
+    runs = [0]
+
+    def run():
+        store = staging.open_store(working_dir) if stage_mode == "link" else None
+        for _ in range(args.stage_runs):
+            runs[0] += 1
+            timestamp_dir = os.path.join(working_dir, f"run_{runs[0]:04}")
+            os.makedirs(timestamp_dir)
+            general.create_test_execute_dir(timestamp_dir, test_dir, store)
+        return args.stage_runs * args.stage_files * args.stage_file_size * 2**20
+
+    return run
+
+
+def bench_status(args: argparse.Namespace, work_dir: Path):
+    """
+    Usage: report on a synthetic run from scratch with monitor.status(), the way the monitor does
+        without a checkpoint
+    """
+    timestamp_dir = Path(os.path.join(work_dir, "2024-01-01_00-00"))
+    os.makedirs(os.path.join(timestamp_dir, "checksum"), exist_ok=True)
+    shared_log = os.path.join(timestamp_dir, "shared_exerciser.log")
+    num_events = fake_htcondor2.write_event_log(shared_log, args.resources, args.events)
+
+    def run():
+        monitor.status(timestamp_dir, 0, rebuild=True)
+        return num_events
+
+    return run
+
+
+def compare(results: list, baseline_file: Path, tolerance: float) -> bool:
+    """
+    Usage: compare results against a previous results file, printing every regression
+    @return: True if no benchmark regressed by more than tolerance
+    """
+    with open(baseline_file, "r") as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+
+    ok = True
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous is None:
+            continue
+        for field in ("seconds", "peak_bytes"):
+            if result[field] is None or not previous.get(field):
+                continue
+            change = result[field] / previous[field] - 1
+            if change > tolerance:
+                ok = False
+                print(f"Regression: {result['name']} {field} grew by {change:.0%}")
+    return ok
+
+
+def main():
+    """
+    Usage: run every benchmark and write the results
+    """
+    args = parse_cla()
+
+    with tempfile.TemporaryDirectory(prefix="exerciser_bench_") as work_dir:
+        # the throttle holds every resource to one idle job, so each chunk spreads over the
+        # resources and the rest of their items are held back for later chunks
+        throttle = {
+            "chunk_size": args.chunk_size,
+            "max_idle": None,
+            "max_idle_per_resource": 1,
+            "poll_interval": 0,
+        }
+        results = [
+            measure("get_resources", bench_get_resources(args), args.memory, "slots"),
+            measure("execute_tests", bench_execute_tests(args, work_dir), args.memory, "jobs"),
+            measure(
+                "execute_tests_throttled",
+                bench_execute_tests(args, work_dir, throttle),
+                args.memory,
+                "jobs",
+            ),
+            measure("staging_copy", bench_staging(args, work_dir, "copy"), args.memory, "bytes"),
+            measure("staging_link", bench_staging(args, work_dir, "link"), args.memory, "bytes"),
+            measure("monitor_status", bench_status(args, work_dir), args.memory, "events"),
+        ]
+
+    output = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
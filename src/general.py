@@ -27,32 +27,42 @@ import shutil
 from datetime import datetime
 import argparse
 from math import ceil
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+import time
+import heapq
+import json
+import signal
+import staging
+import snapshot
+import metrics
+import watcher
+import monitor
+import planner
+import sampling
+import retention
 
+# name of the timestamp dir of a run. older runs were named to the minute, "%Y-%m-%d_%H-%M"
+RUN_ID_FORMAT = "%Y-%m-%d_%H-%M-%S"
 
-def get_resources() -> dict:
+# status file of the daemon mode, in the working dir. hidden, so it is never mistaken for a run
+DAEMON_STATUS_FILE = ".daemon_status.json"
+
+# number of jobs the daemon mode submits at once when no --chunk-size is given
+DAEMON_CHUNK_SIZE = 100
+
+
+def get_resources(collector=None) -> dict:
     """
     Usage: query the collector for a list of resources currently in the OSPool
+    @param collector: collector to query, as returned by snapshot.get_collector(). defaults to
+                      the OSPool central manager
     @return: dictionary whose keys are the names of all unique GLIDEIN_ResourceName s
-             currently visible in the OSPool
+             currently visible in the OSPool, and whose values are their slot counts
     """
-    collector = htcondor2.Collector("cm-1.ospool.osg-htc.org")
-    resources = collector.query(
-        ad_type=htcondor2.AdTypes.StartDaemon,
-        constraint="!isUndefined(GLIDEIN_ResourceName)",
-        projection=["GLIDEIN_ResourceName"],
-    )
-
-    unique_resources = dict()
-
-    # eliminate repeat resources to produce a unique list
-    # using a dictionary to count number of occurrences, but this count is unused at the moment
-    for resource in resources:
-        if resource["GLIDEIN_ResourceName"] in unique_resources:
-            unique_resources[resource["GLIDEIN_ResourceName"]] += 1
-        else:
-            unique_resources[resource["GLIDEIN_ResourceName"]] = 1
-
-    return unique_resources
+    if collector is None:
+        collector = snapshot.get_collector()
+    return snapshot.resource_counts(snapshot.take_snapshot(collector))
 
 
 def run_exerciser(args: argparse.Namespace):
@@ -80,13 +90,28 @@ def run_exerciser(args: argparse.Namespace):
             print(f"Error: Specified test directory {tests_dir} does not exist")
             sys.exit(1)
 
+    collector = snapshot.get_collector(args.collector, args.collector_timeout)
+    snapshot_attrs = parse_attrs(args.snapshot_attrs)
+    run_metrics = metrics.new_metrics(args.metrics_textfile_dir)
+
+    # --snapshot-diff option
+    # compares two saved snapshots without querying the collector
+    if args.snapshot_diff is not None:
+        old_ref, new_ref = args.snapshot_diff
+        snapshot.print_diff(
+            snapshot.find_snapshot(working_dir, old_ref),
+            snapshot.find_snapshot(working_dir, new_ref),
+        )
+        sys.exit(0)
+
     # -s option
     # prints the list of currenlt available resources to the command line
     if args.snapshot:
         print("Here is a list of all currently available resources:")
-        resources = get_resources()
-        for resource in resources.keys():
-            print(resource)
+        pool_snapshot = get_pool_snapshot(
+            working_dir, args.snapshot_ttl, collector, run_metrics, snapshot_attrs
+        )
+        snapshot.print_snapshot(pool_snapshot)
         print("End of resource list")
         sys.exit(0)
 
@@ -99,26 +124,254 @@ def run_exerciser(args: argparse.Namespace):
         print("End of test list")
         sys.exit(0)
 
-    # -f option
-    # clears the working_dir
-    if args.flush_all:
-        print("Flushing entire working directory")
-        for item in working_dir.iterdir():
-            shutil.rmtree(item)
-    # -d option
-    # clears the working_dir by the provided date
-    elif args.flush_by_date is not None:
-        print("Flushing working directory by date")
-        format_date = parse_date(args.flush_by_date)
-        for subdir in working_dir.iterdir():
-            subdir_date = datetime.strptime(subdir.name, "%Y-%m-%d_%H-%M")
-            if subdir_date < format_date:
-                shutil.rmtree(subdir)
+    # -f, -d, --keep-last, --keep-daily and --max-total-size options
+    # moves the runs the retention policy drops out of the working_dir right away, and deletes
+    # them in a background thread while the other options (e.g. a new run) go ahead
+    retention_policy = get_retention_policy(args)
+    if retention_policy is not None:
+        retention.start_flush(working_dir, retention_policy, args.flush_workers)
+
+    # --list-runs option
+    # prints the run index of the working_dir, then exits
+    if args.list_runs:
+        retention.print_runs(retention.index_runs(working_dir, args.flush_workers))
+        sys.exit(0)
+
+    # --retry option
+    # resubmits the failed and aborted samples of an earlier run instead of submitting a new one
+    if args.retry is not None:
+        retry_dir = os.path.join(working_dir, args.retry)
+        if not os.path.exists(os.path.join(retry_dir, "shared_exerciser.log")):
+            print(f"Error: Specified exerciser execution directory {args.retry} has no shared log")
+            sys.exit(1)
+        retry_failed(retry_dir, args.tests, get_throttle(args))
+        sys.exit(0)
+
+    # --watch option
+    # follows a run that was submitted earlier, cancelling decided resources, instead of
+    # submitting a new one
+    cancel_policy = get_cancel_policy(args)
+    if args.watch is not None:
+        watch_dir = os.path.join(working_dir, args.watch)
+        if not os.path.exists(os.path.join(watch_dir, "shared_exerciser.log")):
+            print(f"Error: Specified exerciser execution directory {args.watch} has no shared log")
+            sys.exit(1)
+        watcher.watch_run(watch_dir, cancel_policy)
+        sys.exit(0)
+
+    # --daemon option
+    # keeps running tests on their schedules instead of submitting a single run
+    if args.daemon:
+        schedule = parse_schedule(args.schedule)
+        if schedule is None:
+            print("Error: --schedule must be given as test_name=seconds, with at least 1 second")
+            sys.exit(1)
+        run_daemon(
+            tests_dir,
+            working_dir,
+            args.tests,
+            args.resource_sample_size,
+            {
+                "schedule": schedule,
+                "default_interval": args.daemon_interval,
+                "spread": args.spread,
+                "placement": get_placement(args),
+                "chunk_size": args.chunk_size or DAEMON_CHUNK_SIZE,
+                "max_idle": args.max_idle,
+                "max_idle_per_resource": args.max_idle_per_resource,
+                "poll_interval": args.poll_interval,
+                "snapshot_ttl": args.snapshot_ttl,
+                "snapshot_attrs": snapshot_attrs,
+                "heartbeat": args.heartbeat_interval,
+                "metrics_textfile_dir": args.metrics_textfile_dir,
+            },
+            collector,
+            args.stage_mode,
+        )
+        sys.exit(0)
+
+    # --plan, --max-jobs and --max-transfer-bytes options
+    # cost the run before submitting it, scaling the sample size down to fit the budget
+    sample_percent = args.resource_sample_size
+    pool_snapshot = None
+    if args.plan or args.max_jobs is not None or args.max_transfer_bytes is not None:
+        pool_snapshot = get_pool_snapshot(
+            working_dir, args.snapshot_ttl, collector, run_metrics, snapshot_attrs
+        )
+        sample_percent = plan_sample_size(
+            tests_dir,
+            args.tests,
+            snapshot.resource_counts(pool_snapshot),
+            sample_percent,
+            args.max_jobs,
+            args.max_transfer_bytes,
+            args.plan,
+        )
+        if args.plan:
+            return
 
     # -b option
     # controls whether the excersier runs. set to True by default
     if args.run:
-        execute_tests(tests_dir, working_dir, args.tests, args.resource_sample_size)
+        if pool_snapshot is None:
+            pool_snapshot = get_pool_snapshot(
+                working_dir, args.snapshot_ttl, collector, run_metrics, snapshot_attrs
+            )
+        timestamp_dir = execute_tests(
+            tests_dir,
+            working_dir,
+            args.tests,
+            sample_percent,
+            args.stage_mode,
+            args.stage_workers,
+            get_throttle(args),
+            pool_snapshot,
+            run_metrics,
+            get_placement(args),
+        )
+        # with a cancellation threshold, stay around until the run finishes, removing the idle
+        # samples of resources whose outcome is already decided
+        if cancel_policy is not None:
+            watcher.watch_run(timestamp_dir, cancel_policy)
+
+
+def get_pool_snapshot(
+    working_dir: Path, ttl: int, collector, run_metrics: dict, attrs: list = None
+) -> dict:
+    """
+    Usage: get the snapshot of the pool to plan a run from, timing the collector query
+    @param working_dir: directory for storing info on exerciser runs
+    @param ttl: max age in seconds of a cached snapshot that may be reused
+    @param collector: collector to query, as returned by snapshot.get_collector()
+    @param run_metrics: metrics recorder of the run
+    @param attrs: extra slot attributes the snapshot must hold
+    @return: snapshot dict as returned by snapshot.get_snapshot()
+    """
+    with metrics.phase(run_metrics, "collector_query") as counts:
+        try:
+            pool_snapshot = snapshot.get_snapshot(working_dir, ttl, collector, attrs)
+        except RuntimeError as err:
+            print(f"Error: {err}")
+            sys.exit(1)
+        counts["items"] = len(pool_snapshot["resources"])
+    return pool_snapshot
+
+
+def plan_sample_size(
+    tests_dir: Path,
+    test_list: list,
+    resources: dict,
+    sample_percent: float,
+    max_jobs: int = None,
+    max_transfer_bytes: int = None,
+    print_only: bool = False,
+) -> float:
+    """
+    Usage: fit the sample size of a run into the job and transfer budget, printing the plan
+    @param tests_dir: directory containing all exerciser tests
+    @param test_list: list parsed from args of all the tests to run
+    @param resources: dict of resource names to the number of slots they have
+    @param sample_percent: requested sample size
+    @param max_jobs: largest number of jobs the run may submit, or None for no limit
+    @param max_transfer_bytes: largest number of input bytes the run may transfer, or None
+    @param print_only: if True, print the plan of the run (the run is not going to be submitted)
+    @return: sample size to run with
+    """
+    test_dirs = list(iter_tests_with_sub(tests_dir, test_list))
+    fitted_percent = planner.fit_sample(
+        test_dirs, resources, sample_percent, max_jobs, max_transfer_bytes
+    )
+    if fitted_percent is None:
+        print(
+            "Error: Even one job per resource exceeds the budget set by --max-jobs and "
+            + "--max-transfer-bytes"
+        )
+        sys.exit(1)
+    if fitted_percent < sample_percent:
+        print(
+            f"Warning: Sample size reduced from {sample_percent:.4g} to {fitted_percent:.4g} to "
+            + "fit the budget"
+        )
+
+    if print_only:
+        planner.print_plan(planner.plan_run(test_dirs, resources, fitted_percent))
+    return fitted_percent
+
+
+def get_throttle(args: argparse.Namespace) -> dict:
+    """
+    Usage: collect the submission throttling options from the command line
+    @param args: program arguments as returned by parse_cla() in __main__
+    @return: dict of throttle settings for submit_items(), or None to submit each test at once
+    """
+    if args.max_idle is None and args.max_idle_per_resource is None and args.chunk_size is None:
+        return None
+
+    return {
+        "chunk_size": args.chunk_size if args.chunk_size is not None else 1000,
+        "max_idle": args.max_idle,
+        "max_idle_per_resource": args.max_idle_per_resource,
+        "poll_interval": args.poll_interval,
+    }
+
+
+def get_placement(args: argparse.Namespace) -> dict:
+    """
+    Usage: collect the sample placement options from the command line
+    @param args: program arguments as returned by parse_cla() in __main__
+    @return: dict of placement settings for sampling.plan_placements(), or None to only constrain
+             samples to their resource
+    """
+    if args.sampling != "machine":
+        return None
+
+    return {"grace": args.placement_grace}
+
+
+def get_retention_policy(args: argparse.Namespace) -> dict:
+    """
+    Usage: collect the flushing and retention options from the command line
+    @param args: program arguments as returned by parse_cla() in __main__
+    @return: retention policy for retention.start_flush(), or None to keep every run
+    """
+    policy = {
+        "all": args.flush_all,
+        "before": parse_date(args.flush_by_date) if args.flush_by_date is not None else None,
+        "keep_last": args.keep_last,
+        "keep_daily": args.keep_daily,
+        "max_size": args.max_total_size,
+    }
+    # a max size of 0 is a valid policy, so options are checked for being set, not for truth
+    if not policy["all"] and all(policy[key] is None for key in policy if key != "all"):
+        return None
+    return policy
+
+
+def get_cancel_policy(args: argparse.Namespace) -> dict:
+    """
+    Usage: collect the early cancellation options from the command line
+    @param args: program arguments as returned by parse_cla() in __main__
+    @return: dict of cancellation settings for watcher.watch_run(), or None to not watch the run
+    """
+    if args.cancel_after_failures is None and args.cancel_after_successes is None:
+        return None
+
+    return {
+        "failures": args.cancel_after_failures,
+        "successes": args.cancel_after_successes,
+        "interval": args.watch_interval,
+    }
+
+
+def parse_attrs(attrs_from_cla: str) -> list:
+    """
+    Usage: split the comma separated attributes of the --snapshot-attrs option
+    @param attrs_from_cla: attributes as entered at the command line, or None
+    @return: list of the attribute names, empty if none were given
+    """
+    if attrs_from_cla is None:
+        return []
+    return [attr.strip() for attr in attrs_from_cla.split(",") if attr.strip() != ""]
 
 
 def parse_date(date_from_cla: str) -> str:
@@ -155,64 +408,366 @@ def parse_date(date_from_cla: str) -> str:
     return format_date
 
 
-def execute_tests(tests_dir: Path, working_dir: Path, test_list: list, sample_percent: float):
+def execute_tests(
+    tests_dir: Path,
+    working_dir: Path,
+    test_list: list,
+    sample_percent: float,
+    stage_mode: str = "link",
+    stage_workers: int = 4,
+    throttle: dict = None,
+    pool_snapshot: dict = None,
+    run_metrics: dict = None,
+    placement: dict = None,
+):
     """
     Usage: builds working file system and submits tests
     @param tests_dir: directory containing all exerciser tests
     @param working_dir: directory for storing info on exerciser runs
     @param test_list: list parsed from args of all the tests to run
     @param sample_percent: percent of machines to send tests to in each resource
+    @param stage_mode: "link" to stage test files from the content-addressed test store, or
+                       "copy" to copy them into every execute dir
+    @param stage_workers: number of tests to stage into execute dirs at the same time
+    @param throttle: dict of throttle settings as returned by get_throttle(). if provided, jobs
+                     are submitted in chunks held back while too many exerciser jobs are idle
+    @param pool_snapshot: snapshot of the pool's resources to plan the run from, as returned by
+                          snapshot.get_snapshot(). queried from the collector if not provided
+    @param run_metrics: metrics recorder as returned by metrics.new_metrics(). the duration, item
+                        counts and bytes of each phase are written into the timestamp dir
+    @param placement: dict of placement settings as returned by get_placement(). if provided, the
+                      samples of each resource are spread over its distinct machines
+    @return: str path to the timestamp dir of the run
     """
-    # create top level working dir for exerciser run
-    curr_time = datetime.now().strftime("%Y-%m-%d_%H-%M")
-    timestamp_dir = os.path.join(working_dir, curr_time)
-    if not os.path.exists(timestamp_dir):
-        os.makedirs(timestamp_dir)
-
-        # create text file with list of currently available ResourceNames
-        with open(
-            os.path.join(timestamp_dir, "resource_list.txt"), "w"
-        ) as resource_list:
-            resources = get_resources()
-            for resource in resources.keys():
-                resource_list.write(f"{resource}\n")
-    else:
-        # need to wait 1 min to allow for unique dir names
-        print("Error: Please wait at least 1 minute between succesive runs")
-        sys.exit(1)
+    # create top level working dir for exerciser run, with a list of the resources it targets
+    timestamp_dir = new_run_dir(working_dir)
+    if pool_snapshot is None:
+        pool_snapshot = snapshot.take_snapshot(snapshot.get_collector())
+    resources = write_run_resources(timestamp_dir, pool_snapshot)
+    placements = get_run_placements(timestamp_dir, pool_snapshot, sample_percent, placement)
 
     # where the magic happens!
-    # loop through every test returned by iter_tests, create execution dirs for them using
-    # create_test_execute_dir, prepare them with generate_sub_object, and then submit them to the
-    # OSPool!
+    # stage every test returned by iter_tests into an execution dir with create_test_execute_dir
+    # in a pool of worker threads, and as each one is staged prepare it with generate_sub_object
+    # and submit it to the OSPool!
     # i.e. verify that the requested tests exist, make spaces for them to run, modify them into
     # exerciser jobs, and send them to the pool
-    for test in iter_tests(tests_dir, test_list):
-        execute_dir, sub_file = create_test_execute_dir(timestamp_dir, test)
-        abs_timestamp_dir = os.path.abspath(timestamp_dir)
+    # staging the next tests overlaps with submitting the ones already staged, and every test is
+    # submitted through the same schedd handle with credentials issued only once
+    if run_metrics is None:
+        run_metrics = metrics.new_metrics()
+    abs_timestamp_dir = os.path.abspath(timestamp_dir)
+    store = staging.open_store(working_dir) if stage_mode == "link" else None
+    schedd = htcondor2.Schedd()
+    credentials_issued = False
+    submitted_tests = []
+
+    with ThreadPoolExecutor(max_workers=stage_workers) as pool:
+        staged_tests = [
+            (test, pool.submit(stage_test, timestamp_dir, test, store, run_metrics))
+            for test in iter_tests(tests_dir, test_list)
+        ]
+        for test, staged in staged_tests:
+            execute_dir, sub_file = staged.result()
+            with metrics.phase(run_metrics, "generate_sub_object", test.name):
+                job = generate_sub_object(sub_file, test.name, abs_timestamp_dir)
 
-        root_dir = os.getcwd()
-        schedd = htcondor2.Schedd()
+            if not credentials_issued:
+                with metrics.phase(run_metrics, "issue_credentials"):
+                    job.issue_credentials()
+                credentials_issued = True
 
-        os.chdir(execute_dir)
-        job = generate_sub_object(sub_file, test.name, abs_timestamp_dir)
+            with metrics.phase(run_metrics, "submit", test.name) as counts:
+                item_data = iter_item_data(resources, sample_percent, placements)
+                if throttle is None:
+                    schedd.submit(job, itemdata=item_data)
+                    counts["items"] = count_items(resources, sample_percent)
+                else:
+                    counts["items"] = submit_items(schedd, job, item_data, throttle)
+            submitted_tests.append(test.name)
+
+    if store is not None:
+        staging.save_store(store)
+
+    # report how long each submission took, and the wall time of the whole run
+    for test_name in submitted_tests:
+        submit_phase = metrics.get_phase(run_metrics, "submit", test_name)
+        print(
+            f"Submitted {test_name} test ({submit_phase['items']} jobs) "
+            + f"in {submit_phase['seconds']:.2f}s"
+        )
+    print(
+        f"Submitted {len(submitted_tests)} tests in "
+        + f"{time.monotonic() - run_metrics['start_monotonic']:.2f}s total"
+    )
+    metrics.write_metrics(run_metrics, timestamp_dir)
+    return timestamp_dir
+
+
+def retry_failed(timestamp_dir: Path, test_list: list, throttle: dict = None):
+    """
+    Usage: resubmit every (test, resource, sample) of an earlier run whose latest attempt failed or
+           aborted, reusing the run's execute dirs and shared log
+    @param timestamp_dir: top level dir of the exerciser run to retry
+    @param test_list: list parsed from args of the tests to retry. all tests if empty
+    @param throttle: dict of throttle settings as returned by get_throttle(), or None to submit
+                     each test at once
+    """
+    # the monitor's aggregates already know the latest attempt at every sample
+    state = monitor.load_run(Path(timestamp_dir))
+    retries = {}
+    for (test, resource, sample), (attempt, cluster, proc, job_state) in sorted(
+        monitor.get_final_jobs(state).items()
+    ):
+        if job_state not in (monitor.FAILED, monitor.ABORTED):
+            continue
+        if len(test_list) > 0 and test not in test_list:
+            continue
+        retries.setdefault(test, []).append(
+            {
+                "ResourceName": resource,
+                "resource_dir": f"results/{resource}",
+                "sample_dir": f"results/{resource}/sample_{sample:03}",
+                "SampleNumber": str(sample),
+                "Attempt": str(attempt + 1),
+            }
+        )
+
+    if len(retries) == 0:
+        print("No failed or aborted samples to retry")
+        return
+
+    abs_timestamp_dir = os.path.abspath(timestamp_dir)
+    schedd = htcondor2.Schedd()
+    credentials_issued = False
+    for test, item_data in retries.items():
+        execute_dir = os.path.join(abs_timestamp_dir, test)
+        sub_files = []
+        if os.path.isdir(execute_dir):
+            sub_files = [name for name in os.listdir(execute_dir) if name.endswith(".sub")]
+        if len(sub_files) != 1:
+            print(f'Warning: No staged submit file for test "{test}". Skipping its retries')
+            continue
+        job = generate_sub_object(os.path.join(execute_dir, sub_files[0]), test, abs_timestamp_dir)
+
+        if not credentials_issued:
+            job.issue_credentials()
+            credentials_issued = True
 
-        item_data = []
+        if throttle is None:
+            schedd.submit(job, itemdata=iter(item_data))
+        else:
+            submit_items(schedd, job, iter(item_data), throttle)
+        print(f"Resubmitted {len(item_data)} failed or aborted samples of the {test} test")
+
+
+def get_run_placements(
+    timestamp_dir: Path, pool_snapshot: dict, sample_percent: float, placement: dict
+) -> dict:
+    """
+    Usage: plan where the samples of a run go, and print how many of them were spread over
+           distinct machines
+    @param timestamp_dir: top level dir of the exerciser run
+    @param pool_snapshot: snapshot of the pool's resources the run is planned from
+    @param sample_percent: percent of machines to send tests to in each resource
+    @param placement: dict of placement settings as returned by get_placement(), or None
+    @return: dict returned by sampling.plan_placements(), or None if samples aren't placed
+    """
+    if placement is None:
+        return None
+
+    placements = sampling.plan_placements(
+        pool_snapshot, sample_percent, os.path.basename(timestamp_dir), placement["grace"]
+    )
+    num_samples = sum(len(resource) for resource in placements.values())
+    print(
+        f"Spread {sampling.count_pinned(placements)} of {num_samples} samples per test over "
+        + "distinct machines"
+    )
+    return placements
+
+
+def new_run_dir(working_dir: Path) -> str:
+    """
+    Usage: create the timestamp dir of a new run. runs are named after their start time to the
+           second, with a counter appended if another run already took that name, so runs
+           started at the same time (e.g. by the daemon) never collide
+    @param working_dir: directory for storing info on exerciser runs
+    @return: str path to the new timestamp dir
+    """
+    run_id = datetime.now().strftime(RUN_ID_FORMAT)
+    counter = 1
+    while True:
+        name = run_id if counter == 1 else f"{run_id}_{counter}"
+        timestamp_dir = os.path.join(working_dir, name)
+        try:
+            # creating the dir is the check, so two processes can't both claim a name
+            os.makedirs(timestamp_dir)
+            return timestamp_dir
+        except FileExistsError:
+            counter += 1
+
+
+def write_run_resources(timestamp_dir: Path, pool_snapshot: dict) -> dict:
+    """
+    Usage: create text file with list of currently available ResourceNames, and keep the full
+           snapshot (with slot counts) the run was planned from
+    @param timestamp_dir: top level dir of the exerciser run
+    @param pool_snapshot: snapshot of the pool's resources as returned by snapshot.get_snapshot()
+    @return: dict of resource names to the number of slots they have
+    """
+    resources = snapshot.resource_counts(pool_snapshot)
+    with open(os.path.join(timestamp_dir, "resource_list.txt"), "w") as resource_list:
         for resource in resources.keys():
-            resource_size = resources[resource]
-            sample_size = ceil(resource_size * sample_percent)
-            for i in range(sample_size):
-                item = {
+            resource_list.write(f"{resource}\n")
+    snapshot.save_snapshot(pool_snapshot, os.path.join(timestamp_dir, snapshot.RUN_SNAPSHOT_FILE))
+    return resources
+
+
+def stage_test(timestamp_dir: Path, test_dir: Path, store: dict, run_metrics: dict) -> tuple:
+    """
+    Usage: create the execute dir of a test, recording how long it took and how much was staged
+    @param timestamp_dir: parent of execute dir
+    @param test_dir: src dir to stage from
+    @param store: test store as returned by staging.open_store(), or None to copy
+    @param run_metrics: metrics recorder of the run
+    @return: tuple which stores the execute dir, and submit file for the test
+    """
+    with metrics.phase(run_metrics, "stage", test_dir.name) as counts:
+        execute_dir, sub_file = create_test_execute_dir(timestamp_dir, test_dir, store)
+        counts["bytes"] = metrics.dir_size(execute_dir)
+    return (execute_dir, sub_file)
+
+
+def iter_item_data(resources: dict, sample_percent: float, placements: dict = None):
+    """
+    Usage: lazily generate the itemdata used to submit one test to every resource in the pool
+    @param resources: dict of resource names to the number of slots they have, as returned by
+                      get_resources()
+    @param sample_percent: percent of machines to send tests to in each resource
+    @param placements: dict of resource names to the placement expression of each sample, as
+                       returned by sampling.plan_placements(). samples are only constrained to
+                       their resource if not provided
+    @return: generator of one dict of submit macros per job. samples are interleaved across
+             resources (sample 0 of every resource, then sample 1, ...) so that a chunk of items
+             spreads over many resources instead of piling onto one
+    """
+    sample_sizes = {
+        resource: ceil(resource_size * sample_percent)
+        for resource, resource_size in resources.items()
+    }
+    for i in range(max(sample_sizes.values(), default=0)):
+        for resource, sample_size in sample_sizes.items():
+            if i < sample_size:
+                yield {
                     "ResourceName": resource,
                     "resource_dir": f"results/{resource}",
                     "sample_dir": f"results/{resource}/sample_{i:03}",
-                    "SampleNumber": str(i)
+                    "SampleNumber": str(i),
+                    "Attempt": "0",
+                    "Placement": get_placement_expr(placements, resource, i),
                 }
-                item_data.append(item)
 
-        job.issue_credentials()
-        schedd.submit(job, itemdata=iter(item_data))
-        os.chdir(root_dir)
+
+def get_placement_expr(placements: dict, resource: str, sample: int) -> str:
+    """
+    Usage: look up the placement expression of one sample
+    @return: the expression, or sampling.UNPINNED if the sample isn't placed
+    """
+    if placements is None or resource not in placements:
+        return sampling.UNPINNED
+    resource_placements = placements[resource]
+    return resource_placements[sample] if sample < len(resource_placements) else sampling.UNPINNED
+
+
+def count_items(resources: dict, sample_percent: float) -> int:
+    """
+    Usage: count the jobs iter_item_data() generates, without generating them
+    @param resources: dict of resource names to the number of slots they have
+    @param sample_percent: percent of machines to send tests to in each resource
+    @return: total number of jobs for one test
+    """
+    return planner.count_jobs(resources, sample_percent)
+
+
+def count_idle_jobs(schedd: htcondor2.Schedd) -> tuple:
+    """
+    Usage: count the idle exerciser jobs in the schedd queue, from this and any other run
+    @param schedd: schedd to query
+    @return: tuple of the total number of idle exerciser jobs and a Counter of them by resource
+    """
+    idle_jobs = schedd.query(
+        constraint="EXERCISER_Job == true && JobStatus == 1",
+        projection=["EXERCISER_ResourceName"],
+    )
+    idle_by_resource = Counter(job.get("EXERCISER_ResourceName") for job in idle_jobs)
+    return (len(idle_jobs), idle_by_resource)
+
+
+def submit_items(schedd: htcondor2.Schedd, job: htcondor2.Submit, item_data, throttle: dict) -> int:
+    """
+    Usage: submit a test in bounded chunks, holding back further chunks while the number of idle
+           exerciser jobs is at the global limit, and holding back items for a resource while its
+           idle exerciser jobs are at the per resource limit
+    @param schedd: schedd to submit to
+    @param job: Submit object of the test as returned by generate_sub_object()
+    @param item_data: iterable of itemdata dicts, as returned by iter_item_data()
+    @param throttle: dict of throttle settings as returned by get_throttle()
+    @return: number of jobs submitted
+    """
+    chunk_size = throttle["chunk_size"]
+    max_idle = throttle["max_idle"]
+    max_per_resource = throttle["max_idle_per_resource"]
+
+    pending = iter(item_data)
+    exhausted = False
+    # items for resources at their idle limit, waiting for a later chunk
+    held = {}
+    num_held = 0
+    num_submitted = 0
+
+    while True:
+        total_idle, idle_by_resource = count_idle_jobs(schedd)
+        room = chunk_size if max_idle is None else min(chunk_size, max_idle - total_idle)
+
+        chunk = []
+        # items held back earlier go first, as long as their resource has room again
+        for resource in list(held.keys()):
+            while (
+                len(chunk) < room
+                and held[resource]
+                and (max_per_resource is None or idle_by_resource[resource] < max_per_resource)
+            ):
+                chunk.append(held[resource].popleft())
+                idle_by_resource[resource] += 1
+                num_held -= 1
+            if not held[resource]:
+                del held[resource]
+
+        # then new items, only generated as they are needed. stop pulling new items once a chunk
+        # worth of them is held back, so a queue full of idle jobs doesn't buffer the whole test
+        while not exhausted and len(chunk) < room and num_held < chunk_size:
+            item = next(pending, None)
+            if item is None:
+                exhausted = True
+                break
+            resource = item["ResourceName"]
+            if max_per_resource is not None and idle_by_resource[resource] >= max_per_resource:
+                held.setdefault(resource, deque()).append(item)
+                num_held += 1
+            else:
+                chunk.append(item)
+                idle_by_resource[resource] += 1
+
+        if len(chunk) > 0:
+            schedd.submit(job, itemdata=iter(chunk))
+            num_submitted += len(chunk)
+        elif exhausted and num_held == 0:
+            break
+        else:
+            time.sleep(throttle["poll_interval"])
+
+    return num_submitted
 
 
 def iter_tests(tests_dir: Path, test_list: list):
@@ -238,11 +793,13 @@ def iter_tests(tests_dir: Path, test_list: list):
                 )
 
 
-def create_test_execute_dir(timestamp_dir: Path, test_dir: Path) -> tuple:
+def create_test_execute_dir(timestamp_dir: Path, test_dir: Path, store: dict = None) -> tuple:
     """
     Usage: prepares the execute dir by copying files from test_dir.
     @param timestamp_dir: parent of execute dir, which is the dst of file copy
     @param test_dir: src dir to copy from
+    @param store: test store as returned by staging.open_store(). if provided, files other than
+                  the submit file are linked from the store instead of copied
     @return: tuple which stores the execute dir, and submit file for the test
     """
     # create execution dir for specified test
@@ -267,11 +824,16 @@ def create_test_execute_dir(timestamp_dir: Path, test_dir: Path) -> tuple:
                         f'Error: There can only be one .sub file in the test dir "{test_dir}"'
                     )
                     sys.exit(1)
+            elif store is not None:
+                staging.stage_file(store, item, execute_dir)
             else:
                 shutil.copy(item, execute_dir)
         # copy an entire dir tree
         elif item.is_dir():
-            shutil.copytree(item, os.path.join(execute_dir, item.name))
+            if store is not None:
+                staging.stage_tree(store, item, os.path.join(execute_dir, item.name))
+            else:
+                shutil.copytree(item, os.path.join(execute_dir, item.name))
         # copy symlink
         elif item.is_symlink():
             shutil.copy(item, execute_dir)
@@ -306,8 +868,27 @@ def generate_sub_object(sub_file: Path, test_name: str, timestamp_dir: str) -> h
 
     job.setSubmitMethod(99, True)
 
-    # add requirement to land on target ResourceName
-    req_expr = 'TARGET.GLIDEIN_ResourceName == "$(ResourceName)"'
+    # resolve the job's files against its execute dir rather than the current working dir, so
+    # tests can be prepared and submitted without changing directory
+    execute_dir = os.path.dirname(os.path.abspath(sub_file))
+    initial_dir = job.get("initialdir")
+    if initial_dir is None:
+        job["initialdir"] = execute_dir
+    elif not os.path.isabs(initial_dir):
+        job["initialdir"] = os.path.join(execute_dir, initial_dir)
+    # unlike the other files of a job, the executable isn't relative to initialdir
+    executable = job.get("executable")
+    transfer_executable = str(job.get("transfer_executable", "true")).lower()
+    if (
+        executable is not None
+        and not os.path.isabs(executable)
+        and transfer_executable not in ("false", "no")
+    ):
+        job["executable"] = os.path.join(execute_dir, executable)
+
+    # add requirement to land on target ResourceName, and on the machine the sample was placed on.
+    # jobs submitted without a placement (e.g. retries) may run on any machine of the resource
+    req_expr = 'TARGET.GLIDEIN_ResourceName == "$(ResourceName)" && $(Placement:true)'
     req = job.get("Requirements")
     job["Requirements"] = req_expr if req is None else req_expr + f" && ({req})"
 
@@ -328,14 +909,329 @@ def generate_sub_object(sub_file: Path, test_name: str, timestamp_dir: str) -> h
     job["dagman_log"] = os.path.join(timestamp_dir, "shared_exerciser.log")
 
     # create submit notes to identify job by the testname and expected resource
-    job["submit_event_notes"] = f"exerciser_info:{test_name},$(ResourceName),$(SampleNumber)"
+    job["submit_event_notes"] = (
+        f"{watcher.LOG_NOTES_PREFIX}:{test_name},$(ResourceName),$(SampleNumber),$(Attempt)"
+    )
 
     # add execute attributes
-    job["ulog_execute_attrs"] = "GLIDEIN_ResourceName"
+    job["ulog_execute_attrs"] = "GLIDEIN_ResourceName, Machine"
 
     # add pool exerciser identifier attributes
     job["My.EXERCISER_Job"] = "true"
-    job["My.EXERCISER_TestName"] = test_name
+    job["My.EXERCISER_TestName"] = f'"{test_name}"'
+    job["My.EXERCISER_Run"] = f'"{os.path.basename(timestamp_dir)}"'
     job["My.EXERCISER_SampleNum"] = "$(SampleNumber)"
+    job["My.EXERCISER_Attempt"] = "$(Attempt)"
+    job["My.EXERCISER_ResourceName"] = '"$(ResourceName)"'
 
     return job
+
+
+def parse_schedule(entries: list) -> dict:
+    """
+    Usage: parse the --schedule options
+    @param entries: list of "test=seconds" strs
+    @return: dict of test name -> interval in seconds, or None if an entry is malformed
+    """
+    schedule = {}
+    for entry in entries:
+        test, _, seconds = entry.partition("=")
+        try:
+            schedule[test] = int(seconds)
+        except ValueError:
+            return None
+        if test == "" or schedule[test] < 1:
+            return None
+    return schedule
+
+
+def run_daemon(
+    tests_dir: Path,
+    working_dir: Path,
+    test_list: list,
+    sample_percent: float,
+    settings: dict,
+    collector,
+    stage_mode: str = "link",
+):
+    """
+    Usage: run tests on their schedules until stopped with Ctrl-C or SIGTERM
+    @param tests_dir: directory containing all exerciser tests
+    @param working_dir: directory for storing info on exerciser runs
+    @param test_list: list parsed from args of the tests to run. all tests if empty
+    @param sample_percent: percent of machines to send tests to in each resource
+    @param settings: dict with the "schedule" of per test intervals, the "default_interval" of
+                     the other tests, the "spread" window in seconds (None for a test's whole
+                     interval), the "chunk_size", "max_idle", "max_idle_per_resource" and
+                     "poll_interval" of submission, the sample "placement", the "snapshot_ttl"
+                     and "snapshot_attrs" of pool snapshots, the "heartbeat" interval and the
+                     "metrics_textfile_dir"
+    @param collector: collector to take pool snapshots from, as returned by snapshot.get_collector()
+    @param stage_mode: "link" to stage test files from the content-addressed test store, or
+                       "copy" to copy them into every execute dir
+    """
+    tests = list(iter_tests_with_sub(tests_dir, test_list))
+    if len(tests) == 0:
+        print("Error: No tests to run in daemon mode")
+        return
+
+    # SIGTERM (e.g. from systemd) stops the daemon the same way Ctrl-C does
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+
+    schedd = htcondor2.Schedd()
+    status = {
+        "pid": os.getpid(),
+        "started": time.time(),
+        "heartbeat": time.time(),
+        "state": "running",
+        "snapshot_time": None,
+        "pending_chunks": 0,
+        "tests": {},
+    }
+    daemon = {
+        "tests_dir": tests_dir,
+        "working_dir": working_dir,
+        "sample_percent": sample_percent,
+        "settings": settings,
+        "collector": collector,
+        "stage_mode": stage_mode,
+        "schedd": schedd,
+        "pool_snapshot": None,
+        "status": status,
+        # heap of (due time, sequence number, action, payload). the sequence number keeps actions
+        # due at the same time in the order they were scheduled
+        "queue": [],
+        "sequence": 0,
+    }
+
+    # stagger the first run of each test over its interval, so tests don't all start together
+    now = time.time()
+    for index, test in enumerate(tests):
+        interval = get_test_interval(settings, test.name)
+        schedule_daemon_action(daemon, now + index * interval / len(tests), "run", test)
+        status["tests"][test.name] = {
+            "interval": interval,
+            "runs": 0,
+            "jobs_submitted": 0,
+            "last_run": None,
+            "last_run_id": None,
+            "next_run": now + index * interval / len(tests),
+            "last_error": None,
+        }
+
+    print(f"Exerciser daemon started for {len(tests)} tests. Status in {DAEMON_STATUS_FILE}")
+    try:
+        while True:
+            write_daemon_status(daemon)
+            due, _, action, payload = daemon["queue"][0]
+            wait = due - time.time()
+            if wait > 0:
+                time.sleep(min(wait, settings["heartbeat"]))
+                continue
+            heapq.heappop(daemon["queue"])
+            if action == "run":
+                start_scheduled_run(daemon, payload, due)
+            else:
+                submit_chunk(daemon, payload)
+            # the daemon's output usually goes to a log file, which would otherwise be buffered
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        status["state"] = "stopped"
+        write_daemon_status(daemon)
+        print("Exerciser daemon stopped")
+
+
+def iter_tests_with_sub(tests_dir: Path, test_list: list):
+    """
+    Usage: filter the tests returned by iter_tests() down to dirs holding a submit file
+    @return: generator of the test dirs the daemon schedules
+    """
+    for test in iter_tests(tests_dir, test_list):
+        if test.is_dir() and any(item.suffix == ".sub" for item in test.iterdir()):
+            yield test
+
+
+def get_test_interval(settings: dict, test_name: str) -> int:
+    """
+    Usage: look up how often a test is run
+    @return: interval between runs of the test in seconds
+    """
+    return settings["schedule"].get(test_name, settings["default_interval"])
+
+
+def schedule_daemon_action(daemon: dict, due: float, action: str, payload):
+    """
+    Usage: add an action to the daemon's queue
+    @param daemon: daemon state as created by run_daemon()
+    @param due: unix time the action is due at
+    @param action: "run" to start a run of a test, or "chunk" to submit a chunk of jobs
+    @param payload: test dir for "run", or chunk dict for "chunk"
+    """
+    daemon["sequence"] += 1
+    heapq.heappush(daemon["queue"], (due, daemon["sequence"], action, payload))
+    if action == "chunk":
+        daemon["status"]["pending_chunks"] += 1
+
+
+def get_daemon_snapshot(daemon: dict) -> dict:
+    """
+    Usage: get the pool snapshot kept in memory, taking a new one once it is older than the
+           snapshot TTL
+    """
+    pool_snapshot = daemon["pool_snapshot"]
+    if pool_snapshot is None or time.time() - pool_snapshot["time"] > daemon["settings"][
+        "snapshot_ttl"
+    ]:
+        pool_snapshot = snapshot.get_snapshot(
+            daemon["working_dir"],
+            daemon["settings"]["snapshot_ttl"],
+            daemon["collector"],
+            daemon["settings"]["snapshot_attrs"],
+        )
+        daemon["pool_snapshot"] = pool_snapshot
+        daemon["status"]["snapshot_time"] = pool_snapshot["time"]
+    return pool_snapshot
+
+
+def start_scheduled_run(daemon: dict, test_dir: Path, due: float):
+    """
+    Usage: start a run of one test. the test is staged into a new timestamp dir, and its jobs are
+           split into chunks that are scheduled evenly over the spread window. the next run of the
+           test is scheduled one interval after this one was due
+    @param daemon: daemon state as created by run_daemon()
+    @param test_dir: dir of the test to run
+    @param due: unix time the run was due at
+    """
+    settings = daemon["settings"]
+    test_status = daemon["status"]["tests"][test_dir.name]
+    interval = get_test_interval(settings, test_dir.name)
+    schedule_daemon_action(daemon, due + interval, "run", test_dir)
+    test_status["next_run"] = due + interval
+
+    try:
+        run_metrics = metrics.new_metrics(settings["metrics_textfile_dir"])
+        with metrics.phase(run_metrics, "collector_query"):
+            pool_snapshot = get_daemon_snapshot(daemon)
+        timestamp_dir = new_run_dir(daemon["working_dir"])
+        resources = write_run_resources(timestamp_dir, pool_snapshot)
+
+        store = None
+        if daemon["stage_mode"] == "link":
+            store = staging.open_store(daemon["working_dir"])
+        execute_dir, sub_file = stage_test(timestamp_dir, test_dir, store, run_metrics)
+        if store is not None:
+            staging.save_store(store)
+        with metrics.phase(run_metrics, "generate_sub_object", test_dir.name):
+            job = generate_sub_object(
+                sub_file, test_dir.name, os.path.abspath(timestamp_dir)
+            )
+        with metrics.phase(run_metrics, "issue_credentials"):
+            job.issue_credentials()
+    except Exception as err:
+        test_status["last_error"] = f"{datetime.now().isoformat(timespec='seconds')}: {err}"
+        print(f"Warning: Could not start a run of the {test_dir.name} test: {err}")
+        return
+
+    placements = None
+    if settings["placement"] is not None:
+        placements = sampling.plan_placements(
+            pool_snapshot,
+            daemon["sample_percent"],
+            os.path.basename(timestamp_dir),
+            settings["placement"]["grace"],
+        )
+    items = list(iter_item_data(resources, daemon["sample_percent"], placements))
+    chunk_size = settings["chunk_size"]
+    num_chunks = max(1, ceil(len(items) / chunk_size))
+    spread = settings["spread"] if settings["spread"] is not None else interval
+    run = {
+        "test": test_dir.name,
+        "timestamp_dir": timestamp_dir,
+        "job": job,
+        "metrics": run_metrics,
+        "chunks_left": num_chunks,
+    }
+    for index in range(num_chunks):
+        chunk = {"run": run, "items": items[index * chunk_size : (index + 1) * chunk_size]}
+        schedule_daemon_action(daemon, time.time() + index * spread / num_chunks, "chunk", chunk)
+
+    test_status["runs"] += 1
+    test_status["last_run"] = time.time()
+    test_status["last_run_id"] = os.path.basename(timestamp_dir)
+    print(
+        f"Started run {test_status['last_run_id']} of the {test_dir.name} test: {len(items)} "
+        + f"jobs in {num_chunks} chunks over {spread}s"
+    )
+
+
+def submit_chunk(daemon: dict, chunk: dict):
+    """
+    Usage: submit one chunk of a run's jobs. like submit_items(), the items beyond the global idle
+           limit, and those for resources at the per resource idle limit, are held back. they are
+           scheduled again as a chunk of their own after the poll interval
+    @param daemon: daemon state as created by run_daemon()
+    @param chunk: chunk dict as scheduled by start_scheduled_run()
+    """
+    settings = daemon["settings"]
+    status = daemon["status"]
+    run = chunk["run"]
+    test_status = status["tests"][run["test"]]
+    status["pending_chunks"] -= 1
+
+    try:
+        items = chunk["items"]
+        max_idle = settings["max_idle"]
+        max_per_resource = settings["max_idle_per_resource"]
+        if max_idle is not None or max_per_resource is not None:
+            num_idle, idle_by_resource = count_idle_jobs(daemon["schedd"])
+            room = len(items) if max_idle is None else max_idle - num_idle
+            ready = []
+            held = []
+            for item in items:
+                resource = item["ResourceName"]
+                if len(ready) < room and (
+                    max_per_resource is None or idle_by_resource[resource] < max_per_resource
+                ):
+                    ready.append(item)
+                    idle_by_resource[resource] += 1
+                else:
+                    held.append(item)
+            if len(held) > 0:
+                # the held back items count as one more chunk of the run until they are handled
+                run["chunks_left"] += 1
+                schedule_daemon_action(
+                    daemon,
+                    time.time() + settings["poll_interval"],
+                    "chunk",
+                    {"run": run, "items": held},
+                )
+            items = ready
+        if len(items) > 0:
+            with metrics.phase(run["metrics"], "submit", run["test"]) as counts:
+                daemon["schedd"].submit(run["job"], itemdata=iter(items))
+                counts["items"] = len(items)
+            test_status["jobs_submitted"] += len(items)
+    except Exception as err:
+        test_status["last_error"] = f"{datetime.now().isoformat(timespec='seconds')}: {err}"
+        print(f"Warning: Could not submit a chunk of run {run['timestamp_dir']}: {err}")
+
+    # the run's metrics are complete once its last chunk has been handled
+    run["chunks_left"] -= 1
+    if run["chunks_left"] == 0:
+        metrics.write_metrics(run["metrics"], run["timestamp_dir"])
+
+
+def write_daemon_status(daemon: dict):
+    """
+    Usage: refresh the heartbeat and write the status file, for alerting on a stuck or dead daemon
+    @param daemon: daemon state as created by run_daemon()
+    """
+    status = daemon["status"]
+    status["heartbeat"] = time.time()
+    status["next_action"] = daemon["queue"][0][0] if len(daemon["queue"]) > 0 else None
+    metrics.write_atomic(
+        os.path.join(daemon["working_dir"], DAEMON_STATUS_FILE), json.dumps(status, indent=2)
+    )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: SQLite store of per-job outcomes and timings across exerciser runs, indexed by resource,
+    test and run time, so trends can be queried without re-reading old shared logs
+"""
+
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+import os
+
+HISTORY_FILE = ".history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    run_time REAL NOT NULL,
+    log_size INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id TEXT NOT NULL,
+    run_time REAL NOT NULL,
+    cluster INTEGER NOT NULL,
+    proc INTEGER NOT NULL,
+    test TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    sample INTEGER,
+    state TEXT NOT NULL,
+    submit_time REAL,
+    execute_time REAL,
+    end_time REAL,
+    PRIMARY KEY (run_id, cluster, proc)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_resource ON jobs (resource, run_time);
+CREATE INDEX IF NOT EXISTS jobs_by_test ON jobs (test, run_time);
+CREATE INDEX IF NOT EXISTS jobs_by_time ON jobs (run_time);
+"""
+
+# aggregate columns shared by the trend queries. queue wait and runtime are averaged over the
+# jobs that have the timestamps to compute them
+TREND_COLUMNS = """
+    run_id,
+    run_time,
+    COUNT(*),
+    SUM(state = 'succeeded'),
+    SUM(state = 'failed'),
+    SUM(state = 'aborted'),
+    SUM(state IN ('submitted', 'executed')),
+    AVG(CASE WHEN execute_time > 0 THEN execute_time - submit_time END),
+    AVG(CASE WHEN end_time > 0 AND execute_time > 0 THEN end_time - execute_time END)
+"""
+
+
+def open_history(working_dir: Path) -> sqlite3.Connection:
+    """
+    Usage: open (creating if needed) the history store of a working dir
+    @param working_dir: directory for storing info on exerciser runs
+    @return: sqlite3 connection to the store
+    """
+    conn = sqlite3.connect(os.path.join(working_dir, HISTORY_FILE))
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def needs_ingest(conn: sqlite3.Connection, run_id: str, log_size: int) -> bool:
+    """
+    Usage: check whether a run's shared log has grown since it was last ingested
+    @param conn: connection returned by open_history()
+    @param run_id: name of the run's timestamp dir
+    @param log_size: current size of the run's shared log
+    @return: True if the run has never been ingested, or its log has changed since
+    """
+    row = conn.execute("SELECT log_size FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    return row is None or row[0] != log_size
+
+
+def ingest_run(
+    conn: sqlite3.Connection,
+    run_id: str,
+    run_time: float,
+    log_size: int,
+    jobs,
+):
+    """
+    Usage: store the current outcome of every job of a run. jobs are keyed by (run, cluster, proc)
+           and replaced on every ingest, so ingesting the same run again is harmless
+    @param conn: connection returned by open_history()
+    @param run_id: name of the run's timestamp dir
+    @param run_time: start time of the run as a unix timestamp
+    @param log_size: size of the shared log the jobs were read from
+    @param jobs: iterable of (cluster, proc, test, resource, sample, state, submit_time,
+                 execute_time, end_time) tuples
+    """
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((run_id, run_time) + tuple(job) for job in jobs),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+            (run_id, run_time, log_size, datetime.now().timestamp()),
+        )
+
+
+def query_trend(conn: sqlite3.Connection, column: str, value: str, since: float = 0) -> list:
+    """
+    Usage: summarize the jobs of one resource or test in every run since a point in time
+    @param conn: connection returned by open_history()
+    @param column: "resource" or "test"
+    @param value: name of the resource or test
+    @param since: only include runs started at or after this unix timestamp
+    @return: list of (run_id, run_time, jobs, succeeded, failed, aborted, pending,
+             avg queue wait, avg runtime) tuples, oldest run first
+    """
+    if column not in ("resource", "test"):
+        raise ValueError(f"Cannot query history by {column}")
+    return conn.execute(
+        f"SELECT {TREND_COLUMNS} FROM jobs WHERE {column} = ? AND run_time >= ? "
+        + "GROUP BY run_id ORDER BY run_time",
+        (value, since),
+    ).fetchall()
+
+
+def print_trend(label: str, rows: list):
+    """
+    Usage: print the rows returned by query_trend()
+    @param label: description of what was queried, e.g. "resource X"
+    @param rows: rows returned by query_trend()
+    """
+    if len(rows) == 0:
+        print(f"No history found for {label}")
+        return
+
+    print(f"History of {label} over {len(rows)} runs:")
+    for run_id, run_time, jobs, succeeded, failed, aborted, pending, queue, runtime in rows:
+        finished = succeeded + failed + aborted
+        pass_rate = f"{succeeded / finished:.0%}" if finished > 0 else "-"
+        queue = f"{queue:.0f}s" if queue is not None else "-"
+        runtime = f"{runtime:.0f}s" if runtime is not None else "-"
+        print(
+            f"\t{run_id}: {jobs} jobs, {succeeded} passed, {failed} failed, "
+            + f"{aborted} system failures, {pending} unfinished, {pass_rate} pass rate, "
+            + f"avg queue wait {queue}, avg runtime {runtime}"
+        )
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: per-phase timing of exerciser runs, exported as JSON and as a Prometheus textfile
+    collector file
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_JSON_FILE = "exerciser_metrics.json"
+METRICS_PROM_FILE = "exerciser_metrics.prom"
+PROM_PREFIX = "pool_exerciser"
+
+
+def new_metrics(textfile_dir: Path = None) -> dict:
+    """
+    Usage: create an empty metrics recorder for one exerciser run
+    @param textfile_dir: dir watched by the node exporter's textfile collector. if provided, the
+                         Prometheus metrics are also written there
+    @return: dict holding the recorded phases and a lock so phases can be recorded from threads
+    """
+    return {
+        "start": time.time(),
+        "start_monotonic": time.monotonic(),
+        "textfile_dir": textfile_dir,
+        # (phase, test) -> {"seconds", "calls", "items", "bytes"}
+        "phases": {},
+        "lock": threading.Lock(),
+    }
+
+
+def record(
+    metrics: dict,
+    phase_name: str,
+    seconds: float,
+    test: str = "",
+    items: int = 0,
+    num_bytes: int = 0,
+):
+    """
+    Usage: add one measurement of a phase to the recorder
+    @param metrics: recorder as returned by new_metrics(), or None to record nothing
+    @param phase_name: name of the phase, e.g. "stage" or "submit"
+    @param seconds: duration of the phase
+    @param test: name of the test the phase was for, or "" for phases of the whole run
+    @param items: number of items (e.g. jobs or resources) the phase handled
+    @param num_bytes: number of bytes the phase handled
+    """
+    if metrics is None:
+        return
+    with metrics["lock"]:
+        entry = metrics["phases"].get((phase_name, test))
+        if entry is None:
+            entry = {"seconds": 0.0, "calls": 0, "items": 0, "bytes": 0}
+            metrics["phases"][(phase_name, test)] = entry
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        entry["items"] += items
+        entry["bytes"] += num_bytes
+
+
+@contextmanager
+def phase(metrics: dict, phase_name: str, test: str = ""):
+    """
+    Usage: time the body of a with statement as one measurement of a phase. the body can set
+           the "items" and "bytes" fields of the yielded dict to record what it handled
+    @param metrics: recorder as returned by new_metrics(), or None to record nothing
+    @param phase_name: name of the phase
+    @param test: name of the test the phase was for, or "" for phases of the whole run
+    """
+    counts = {"items": 0, "bytes": 0}
+    start = time.monotonic()
+    try:
+        yield counts
+    finally:
+        record(
+            metrics, phase_name, time.monotonic() - start, test, counts["items"], counts["bytes"]
+        )
+
+
+def get_phase(metrics: dict, phase_name: str, test: str = "") -> dict:
+    """
+    Usage: look up the totals recorded for a phase
+    @return: dict with the seconds, calls, items and bytes of the phase, or None if never recorded
+    """
+    with metrics["lock"]:
+        return metrics["phases"].get((phase_name, test))
+
+
+def write_metrics(metrics: dict, timestamp_dir: Path):
+    """
+    Usage: write the recorded phases as JSON and Prometheus text into the timestamp dir, and into
+           the textfile collector dir if one was configured
+    @param metrics: recorder as returned by new_metrics()
+    @param timestamp_dir: top level dir of the exerciser run
+    """
+    wall_seconds = time.monotonic() - metrics["start_monotonic"]
+    with metrics["lock"]:
+        phases = [
+            {"phase": phase_name, "test": test, **entry}
+            for (phase_name, test), entry in sorted(metrics["phases"].items())
+        ]
+
+    run_id = os.path.basename(os.path.normpath(timestamp_dir))
+    summary = {
+        "run": run_id,
+        "start": metrics["start"],
+        "wall_seconds": wall_seconds,
+        "phases": phases,
+    }
+    write_atomic(os.path.join(timestamp_dir, METRICS_JSON_FILE), json.dumps(summary, indent=2))
+
+    prom_text = format_prometheus(summary)
+    write_atomic(os.path.join(timestamp_dir, METRICS_PROM_FILE), prom_text)
+    if metrics["textfile_dir"] is not None:
+        write_atomic(os.path.join(metrics["textfile_dir"], f"{PROM_PREFIX}.prom"), prom_text)
+
+
+def format_prometheus(summary: dict) -> str:
+    """
+    Usage: format a metrics summary in the Prometheus text exposition format
+    @param summary: summary dict as written by write_metrics()
+    @return: str contents of a .prom file
+    """
+    # runs are not used as a label, since every run would start a new series. the JSON file in
+    # the timestamp dir keeps the per run detail
+    lines = [
+        f"# HELP {PROM_PREFIX}_run_start_timestamp_seconds Start time of the last exerciser run.",
+        f"# TYPE {PROM_PREFIX}_run_start_timestamp_seconds gauge",
+        f"{PROM_PREFIX}_run_start_timestamp_seconds {summary['start']:.3f}",
+        f"# HELP {PROM_PREFIX}_run_wall_seconds Wall time of the last exerciser run.",
+        f"# TYPE {PROM_PREFIX}_run_wall_seconds gauge",
+        f"{PROM_PREFIX}_run_wall_seconds {summary['wall_seconds']:.3f}",
+    ]
+
+    fields = (
+        ("seconds", "Time spent in each phase of the last exerciser run."),
+        ("calls", "Number of times each phase ran in the last exerciser run."),
+        ("items", "Number of items each phase handled in the last exerciser run."),
+        ("bytes", "Number of bytes each phase handled in the last exerciser run."),
+    )
+    for field, help_text in fields:
+        name = f"{PROM_PREFIX}_phase_{field}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for entry in summary["phases"]:
+            labels = f'phase="{entry["phase"]}",test="{entry["test"]}"'
+            lines.append(f"{name}{{{labels}}} {entry[field]}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path: Path, text: str):
+    """
+    Usage: write a file through a temp file, so readers such as the node exporter never see it
+           half written
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def dir_size(path: Path) -> int:
+    """
+    Usage: total size in bytes of the files in a dir tree
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(root, name)).st_size
+    return total
@@ -27,6 +27,46 @@ from pathlib import Path
 import os
 from datetime import datetime
 import argparse
+import pickle
+import json
+import csv
+from array import array
+import snapshot
+import sketch
+import history
+import probes
+import outputs
+import triage
+import watcher
+import metrics
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+
+
+# name of the file, stored next to the shared log, which holds the aggregated monitor state and
+# the position in the shared log that the state was built up to
+CHECKPOINT_FILE = "monitor_checkpoint.pickle"
+CHECKPOINT_VERSION = 9
+
+# name of the file, stored next to the shared log, which holds the machine-readable report of the
+# run, tagged with the size and mtime of the shared log it was built from
+SUMMARY_FILE = "monitor_summary.json"
+SUMMARY_VERSION = 2
+
+# states a job of an exerciser test can be in. the index of each state is used to address the
+# per test and per resource counters. cancelled jobs were removed by the exerciser's watcher
+# because the outcome of their test on their resource was already decided
+JOB_STATES = ("submitted", "executed", "succeeded", "failed", "aborted", "cancelled")
+SUBMITTED, EXECUTED, SUCCEEDED, FAILED, ABORTED, CANCELLED = range(len(JOB_STATES))
+
+# marks a proc in a cluster's arrays that no submit event has been seen for yet
+NO_RESOURCE = 0xFFFFFFFF
+NO_STATE = 0xFF
+
+# latencies measured from event timestamps: queue wait (submit to execute), runtime (execute to
+# termination), and time to abort (submit to abort)
+LATENCY_METRICS = ("queue", "runtime", "abort")
+LATENCY_LABELS = {"queue": "queue wait", "runtime": "runtime", "abort": "time to abort"}
 
 
 def parse_cla() -> argparse.Namespace:
@@ -58,8 +98,188 @@ def parse_cla() -> argparse.Namespace:
         "--timestamp",
         metavar="YYYY-MM-DD_hh-mm",
         dest="timestamp",
-        help="Specify the timestamp of an exerciser run to target with the monitor. Must include "
-        + "entire YYYY-MM-DD_hh-mm string."
+        help="Specify the timestamp of an exerciser run to target with the monitor. Must be the "
+        + "entire name of the run's dir, e.g. YYYY-MM-DD_hh-mm-ss (or YYYY-MM-DD_hh-mm for runs "
+        + "made by older versions)."
+    )
+
+    parser.add_argument(
+        "-r",
+        "--rebuild",
+        action="store_true",
+        dest="rebuild",
+        help="Ignore any saved monitor checkpoint and rebuild the status of the run from the "
+        + "start of the shared log.",
+    )
+
+    parser.add_argument(
+        "-l",
+        "--latency",
+        action="store_true",
+        dest="latency",
+        help="Print the queue wait, runtime, and time to abort distributions of each test, and "
+        + "rank the slowest resources.",
+    )
+
+    parser.add_argument(
+        "--slowest",
+        metavar="count",
+        dest="slowest",
+        type=int,
+        default=10,
+        help="Number of slowest resources to list with --latency. Defaults to 10.",
+    )
+
+    parser.add_argument(
+        "--rank-by",
+        choices=LATENCY_METRICS,
+        default="queue",
+        dest="rank_by",
+        help="Latency to rank the slowest resources by (p90) with --latency. Defaults to queue.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        dest="follow",
+        help="Keep the shared log open and redraw the status of the run as new events arrive, "
+        + "until interrupted with Ctrl-C.",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--interval",
+        metavar="seconds",
+        dest="interval",
+        type=int,
+        default=10,
+        help="Number of seconds between status redraws in --follow mode. Defaults to 10.",
+    )
+
+    parser.add_argument(
+        "--ingest",
+        action="store_true",
+        dest="ingest",
+        help="Store the per-job outcomes and timings of the monitored run in the history store of "
+        + "the working directory.",
+    )
+
+    parser.add_argument(
+        "--ingest-all",
+        action="store_true",
+        dest="ingest_all",
+        help="Store the per-job outcomes and timings of every run in the working directory whose "
+        + "shared log changed since it was last ingested, then exit.",
+    )
+
+    parser.add_argument(
+        "--history-resource",
+        metavar="resource_name",
+        dest="history_resource",
+        help="Print the per-run history of a resource from the history store, then exit.",
+    )
+
+    parser.add_argument(
+        "--history-test",
+        metavar="test_name",
+        dest="history_test",
+        help="Print the per-run history of a test from the history store, then exit.",
+    )
+
+    parser.add_argument(
+        "--since",
+        metavar="YYYY-MM-DD",
+        dest="since",
+        help="Only include runs started on or after this date in history queries.",
+    )
+
+    parser.add_argument(
+        "--runs",
+        metavar="pattern",
+        dest="runs",
+        help="Analyze every run whose timestamp matches this glob pattern (e.g. '2024-08-0*') in "
+        + "parallel, and print a combined report with a column per run.",
+    )
+
+    parser.add_argument(
+        "--from",
+        metavar="YYYY-MM-DD_hh-mm",
+        dest="from_timestamp",
+        help="Analyze every run from this timestamp on (inclusive) in parallel, and print a "
+        + "combined report. Can be combined with --to and --runs.",
+    )
+
+    parser.add_argument(
+        "--to",
+        metavar="YYYY-MM-DD_hh-mm",
+        dest="to_timestamp",
+        help="Analyze every run up to this timestamp (inclusive) in parallel, and print a "
+        + "combined report. Can be combined with --from and --runs.",
+    )
+
+    parser.add_argument(
+        "--probes",
+        action="store_true",
+        dest="probes",
+        help="Aggregate the results written by the performance probe tests per resource, and "
+        + "list the resources that perform well below the rest of the pool.",
+    )
+
+    parser.add_argument(
+        "--probe-threshold",
+        metavar="fraction",
+        dest="probe_threshold",
+        type=float,
+        default=probes.DEFAULT_THRESHOLD,
+        help="Flag resources whose median probe result is below this fraction of the pool median. "
+        + f"Defaults to {probes.DEFAULT_THRESHOLD}.",
+    )
+
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        dest="triage",
+        help="Group the failed jobs of the run by the normalized text of their .err files, and "
+        + "print each group with the resources it affects, largest first.",
+    )
+
+    parser.add_argument(
+        "--triage-limit",
+        metavar="count",
+        dest="triage_limit",
+        type=int,
+        default=10,
+        help="Maximum number of failure groups printed by --triage. Defaults to 10.",
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="format",
+        choices=["text", "json", "csv"],
+        default="text",
+        help="Output format of the run's status. json and csv print the per test and per resource "
+        + "job counts, and are served from the run's summary file while its shared log is "
+        + "unchanged. Defaults to text.",
+    )
+
+    parser.add_argument(
+        "--rollup",
+        action="store_true",
+        dest="rollup",
+        help="Roll the job outcomes and latencies of the run up the pool hierarchy, and print one "
+        + "line per institution, worst first. -v adds their sites, -vv their resources.",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--workers",
+        metavar="count",
+        dest="workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes used to analyze runs in parallel. Defaults to the number "
+        + "of CPUs.",
     )
 
     return parser.parse_args()
@@ -85,15 +305,55 @@ def main():
         print("Error: Couldn't find working dir. Ensure you are in source directory")
         sys.exit(1)
 
+    # history options
+    # query or fill the history store without monitoring a single run
+    if args.history_resource is not None or args.history_test is not None:
+        since = 0
+        if args.since is not None:
+            try:
+                since = datetime.strptime(args.since, "%Y-%m-%d").timestamp()
+            except ValueError:
+                print(f"Error: Invalid date '{args.since}' provided from --since")
+                sys.exit(1)
+        conn = history.open_history(working_dir)
+        if args.history_resource is not None:
+            rows = history.query_trend(conn, "resource", args.history_resource, since)
+            history.print_trend(f"resource {args.history_resource}", rows)
+        if args.history_test is not None:
+            rows = history.query_trend(conn, "test", args.history_test, since)
+            history.print_trend(f"test {args.history_test}", rows)
+        sys.exit(0)
+
+    if args.ingest_all:
+        ingest_all(working_dir)
+        sys.exit(0)
+
     if len(os.listdir(working_dir)) == 0:
         print("Working directory is empty, nothing to monitor")
         sys.exit(0)
 
+    # multi-run options
+    # analyzes a range or glob of runs in parallel instead of a single run
+    if args.runs is not None or args.from_timestamp is not None or args.to_timestamp is not None:
+        if args.workers < 1:
+            print("Error: Number of workers must be at least 1")
+            sys.exit(1)
+        run_dirs = select_runs(working_dir, args.runs, args.from_timestamp, args.to_timestamp)
+        if len(run_dirs) == 0:
+            print("No runs matched the specified timestamps")
+            sys.exit(0)
+        summaries = summarize_runs(run_dirs, args.workers, args.rebuild)
+        print_multi_run(summaries, args.latency)
+        sys.exit(0)
+
     # -t option
     # specifies exerciser run to analyze. if no timestamp is provided, analyzes most recent run
     if args.timestamp is None:
         target_dir = None
         for current_dir in working_dir.iterdir():
+            # hidden dirs such as the test store are not exerciser runs
+            if current_dir.name.startswith("."):
+                continue
             if target_dir is None:
                 target_dir = current_dir
             elif target_dir.name < current_dir.name:
@@ -105,178 +365,1289 @@ def main():
             sys.exit(1)
         target_dir = Path(target_dir)
 
-    status(target_dir, args.verbosity)
+    if target_dir is None:
+        print("Working directory is empty, nothing to monitor")
+        sys.exit(0)
+
+    if args.interval <= 0:
+        print("Error: Follow interval must be a positive number of seconds")
+        sys.exit(1)
+
+    if args.probe_threshold <= 0:
+        print("Error: Probe threshold must be a positive fraction")
+        sys.exit(1)
+
+    # --format option
+    # machine-readable reports only hold the status of the run, nothing else is printed
+    if args.format != "text":
+        text_only = ("follow", "latency", "ingest", "triage", "rollup", "probes")
+        selected = [option for option in text_only if getattr(args, option)]
+        if len(selected) > 0:
+            print(f"Error: Cannot select --{selected[0]} with --format {args.format}")
+            sys.exit(1)
+        report = get_report(target_dir, args.rebuild)
+        if args.format == "json":
+            print(json.dumps(report, indent=2))
+        else:
+            write_report_csv(report, sys.stdout)
+        sys.exit(0)
+
+    latency = {"slowest": args.slowest, "rank_by": args.rank_by} if args.latency else None
+    if args.follow:
+        follow(target_dir, args.verbosity, args.interval, args.rebuild, latency)
+    else:
+        state = status(target_dir, args.verbosity, args.rebuild, latency)
+        if args.ingest:
+            ingest_state(history.open_history(working_dir), target_dir, state)
+        if args.triage:
+            print_triage(state, args.verbosity, args.triage_limit)
+        if args.rollup:
+            print_rollup(target_dir, state, args.verbosity)
+        if args.probes:
+            report = probes.aggregate_probe_results(
+                probes.collect_probe_results(target_dir), args.probe_threshold
+            )
+            probes.print_probe_report(report, args.verbosity, args.probe_threshold)
 
 
-def status(timestamp_dir: Path, verbosity: int):
+def status(timestamp_dir: Path, verbosity: int, rebuild: bool = False, latency: dict = None):
     """
     Usage: observe the shared log for an exerciser test run and print status information
     @param timestamp_dir: Path object to the root dir of an exerciser run
     @param verbosity: int specifying how verbose the print stmts should be
+    @param rebuild: if True, ignore any saved checkpoint and read the shared log from the start
+    @param latency: dict with the slowest and rank_by options of the latency report, or None to
+                    skip the latency report
+    @return: aggregated state of the run
+    """
+    print_run_header(timestamp_dir)
+    # the log is stat'ed before it is read, so the summary is never tagged with a newer log than
+    # its counts were read from
+    log_stat = os.stat(get_shared_log(timestamp_dir))
+    state = load_run(timestamp_dir, rebuild)
+    save_summary(timestamp_dir, build_report(timestamp_dir, state, log_stat))
+
+    print_status(state, verbosity)
+    print_final_states(state)
+    print_outputs(state, verbosity)
+    print_coverage(timestamp_dir, state, verbosity)
+    if latency is not None:
+        print_latency(state, latency["slowest"], latency["rank_by"])
+    return state
+
+
+def load_run(timestamp_dir: Path, rebuild: bool = False) -> dict:
+    """
+    Usage: bring the aggregated state of a run up to date with its shared log, resuming from and
+           updating its checkpoint
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param rebuild: if True, ignore any saved checkpoint and read the shared log from the start
+    @return: aggregated state of the run
+    """
+    shared_log = get_shared_log(timestamp_dir)
+    state, event_log = open_state(timestamp_dir, shared_log, rebuild)
+    process_events(state, event_log.events(0))
+    attach_outputs(state, timestamp_dir)
+    save_checkpoint(timestamp_dir, shared_log, state, event_log)
+    return state
+
+
+def follow(
+    timestamp_dir: Path,
+    verbosity: int,
+    interval: int,
+    rebuild: bool = False,
+    latency: dict = None,
+):
+    """
+    Usage: keep the shared log open, fold events into the status as they arrive, and redraw the
+           status every interval seconds until interrupted
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param verbosity: int specifying how verbose the print stmts should be
+    @param interval: number of seconds between redraws of the status
+    @param rebuild: if True, ignore any saved checkpoint and read the shared log from the start
+    @param latency: dict with the slowest and rank_by options of the latency report, or None to
+                    skip the latency report
+    """
+    shared_log = get_shared_log(timestamp_dir)
+    state, event_log = open_state(timestamp_dir, shared_log, rebuild)
+    pool_snapshot = snapshot.load_snapshot(os.path.join(timestamp_dir, snapshot.RUN_SNAPSHOT_FILE))
+
+    # only clear the screen between redraws when writing to a terminal, so the output can still
+    # be piped into a file without escape codes
+    clear_screen = sys.stdout.isatty()
+
+    try:
+        while True:
+            # the iterator hands back events as soon as they are written, and stops once interval
+            # seconds have passed since it was created
+            process_events(state, event_log.events(interval))
+            attach_outputs(state, timestamp_dir)
+
+            if clear_screen:
+                print("\033[H\033[J", end="")
+            print_run_header(timestamp_dir)
+            print_status(state, verbosity)
+            print_final_states(state)
+            print_outputs(state, verbosity)
+            print_coverage(timestamp_dir, state, verbosity, pool_snapshot)
+            if latency is not None:
+                print_latency(state, latency["slowest"], latency["rank_by"])
+            sys.stdout.flush()
+
+            save_checkpoint(timestamp_dir, shared_log, state, event_log)
+    except KeyboardInterrupt:
+        save_checkpoint(timestamp_dir, shared_log, state, event_log)
+        print("Stopped following shared log")
+
+
+def select_runs(
+    working_dir: Path, pattern: str = None, from_timestamp: str = None, to_timestamp: str = None
+) -> list:
+    """
+    Usage: find the runs of a working dir matching a glob pattern and timestamp range
+    @param working_dir: directory holding the timestamp dirs of exerciser runs
+    @param pattern: glob pattern the timestamp must match, or None for any
+    @param from_timestamp: earliest timestamp to include, or None for no lower bound
+    @param to_timestamp: latest timestamp to include, or None for no upper bound
+    @return: sorted list of Path objects to the timestamp dirs with a shared log
+    """
+    run_dirs = []
+    for current_dir in working_dir.iterdir():
+        name = current_dir.name
+        if name.startswith(".") or not current_dir.is_dir():
+            continue
+        if pattern is not None and not fnmatch(name, pattern):
+            continue
+        # timestamps sort chronologically as strings. an end bound also matches every run that
+        # starts with it, so --to 2024-08-01 includes all of that day
+        if from_timestamp is not None and name < from_timestamp:
+            continue
+        if to_timestamp is not None and name > to_timestamp and not name.startswith(to_timestamp):
+            continue
+        if os.path.exists(os.path.join(current_dir, "shared_exerciser.log")):
+            run_dirs.append(current_dir)
+    return sorted(run_dirs)
+
+
+def summarize_run(timestamp_dir: Path, rebuild: bool = False) -> dict:
+    """
+    Usage: bring a run up to date and reduce it to what the combined report needs. runs in a
+           worker process, so only the small summary is sent back
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param rebuild: if True, ignore any saved checkpoint and read the shared log from the start
+    @return: dict with the run name, and for each test its job totals and latency sketches
+    """
+    state = load_run(Path(timestamp_dir), rebuild)
+    tests = {}
+    for known, test_dicts in ((True, state["expected_tests"]), (False, state["unknown_tests"])):
+        for test, test_dict in test_dicts.items():
+            tests[test] = {
+                "known": known,
+                "totals": list(test_dict["totals"]),
+                "latency": test_dict["latency"],
+            }
+    return {"run": Path(timestamp_dir).name, "tests": tests}
+
+
+def summarize_runs(run_dirs: list, workers: int, rebuild: bool = False) -> list:
+    """
+    Usage: summarize several runs in parallel, one shared log per worker process
+    @param run_dirs: list of Path objects to the timestamp dirs of the runs
+    @param workers: number of worker processes
+    @param rebuild: if True, ignore any saved checkpoints
+    @return: list of summaries as returned by summarize_run(), in the order of run_dirs
+    """
+    if workers == 1 or len(run_dirs) == 1:
+        return [summarize_run(run_dir, rebuild) for run_dir in run_dirs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(run_dirs))) as pool:
+        return list(pool.map(summarize_run, run_dirs, [rebuild] * len(run_dirs)))
+
+
+def print_multi_run(summaries: list, latency: bool = False):
+    """
+    Usage: print a combined report of several runs, with a column per run and a total column
+    @param summaries: list of summaries as returned by summarize_run()
+    @param latency: if True, also print each test's latency distributions merged over all runs
+    """
+    columns = [summary["run"] for summary in summaries] + ["total"]
+    width = max(len(column) for column in columns) + 2
+    label_width = max(len(state_name) for state_name in JOB_STATES) + 4
+
+    tests = []
+    for summary in summaries:
+        for test in summary["tests"].keys():
+            if test not in tests:
+                tests.append(test)
+
+    print(f"Combined report of {len(summaries)} runs")
+    for test in tests:
+        print(f"{test} test:")
+        print(" " * label_width + "".join(column.rjust(width) for column in columns))
+        for index, state_name in enumerate(JOB_STATES):
+            cells = []
+            total = 0
+            for summary in summaries:
+                test_summary = summary["tests"].get(test)
+                count = test_summary["totals"][index] if test_summary is not None else 0
+                total += count
+                cells.append(str(count) if test_summary is not None else "-")
+            cells.append(str(total))
+            print(f"    {state_name}".ljust(label_width) + "".join(c.rjust(width) for c in cells))
+
+        if latency:
+            for metric in LATENCY_METRICS:
+                merged = sketch.new_sketch()
+                for summary in summaries:
+                    if test in summary["tests"]:
+                        sketch.merge(merged, summary["tests"][test]["latency"][metric])
+                if merged["count"] > 0:
+                    summary_text = format_latency(sketch.summarize(merged))
+                    print(f"    {LATENCY_LABELS[metric]} over all runs: {summary_text}")
+
+
+def build_report(timestamp_dir: Path, state: dict, log_stat: os.stat_result) -> dict:
+    """
+    Usage: reduce the state of a run to its machine-readable report
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param state: aggregated state of the exerciser run
+    @param log_stat: os.stat() of the shared log taken before the state was read from it. a log
+                     appended to while it was read then looks changed to load_summary()
+    @return: dict with the run name and time, the size and mtime of the shared log the state was
+             built from, the job states, and for every test whether it was expected, its job
+             counts in total and per resource, and the resources where jobs failed or aborted.
+             the job counts of every resource over all tests are under "resources", and the data
+             its jobs reported reading under "transfers"
+    """
+    run_time = parse_run_time(timestamp_dir)
+    report = {
+        "version": SUMMARY_VERSION,
+        "run": Path(timestamp_dir).name,
+        "run_time": run_time.isoformat() if run_time is not None else None,
+        "log_size": log_stat.st_size,
+        "log_mtime": log_stat.st_mtime_ns,
+        "states": list(JOB_STATES),
+        "tests": {},
+        "resources": {},
+    }
+
+    for known, tests in ((True, state["expected_tests"]), (False, state["unknown_tests"])):
+        for test, test_dict in tests.items():
+            test_report = {
+                "known": known,
+                "totals": dict(zip(JOB_STATES, test_dict["totals"])),
+                "resources": {},
+                "failed": [],
+                "aborted": [],
+            }
+            for resource_id, counters in sorted(
+                test_dict["resources"].items(), key=lambda item: state["resources"][item[0]]
+            ):
+                resource = state["resources"][resource_id]
+                test_report["resources"][resource] = dict(zip(JOB_STATES, counters))
+                if counters[FAILED] > 0:
+                    test_report["failed"].append(resource)
+                if counters[ABORTED] > 0:
+                    test_report["aborted"].append(resource)
+
+                resource_totals = report["resources"].setdefault(
+                    resource, dict.fromkeys(JOB_STATES, 0)
+                )
+                for state_name, count in zip(JOB_STATES, counters):
+                    resource_totals[state_name] += count
+            report["tests"][test] = test_report
+
+    report["resources"] = dict(sorted(report["resources"].items()))
+    report["transfers"] = get_resource_transfers(state)
+    return report
+
+
+def save_summary(timestamp_dir: Path, report: dict):
+    """
+    Usage: write the report of a run into its timestamp dir, through a temp file so readers never
+           see it half written
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param report: dict as returned by build_report()
+    """
+    summary_file = os.path.join(timestamp_dir, SUMMARY_FILE)
+    try:
+        metrics.write_atomic(summary_file, json.dumps(report, separators=(",", ":")))
+    except OSError as err:
+        print(f"Warning: Could not save monitor summary {summary_file}: {err}")
+
+
+def load_summary(timestamp_dir: Path, shared_log: str) -> dict:
+    """
+    Usage: load the report of a run saved by save_summary(), if its shared log hasn't changed
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param shared_log: str path to the shared log of the exerciser run
+    @return: report dict, or None if there is none or it was built from an older log
+    """
+    try:
+        with open(os.path.join(timestamp_dir, SUMMARY_FILE), "r") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    log_stat = os.stat(shared_log)
+    if (
+        report.get("version") != SUMMARY_VERSION
+        or report.get("log_size") != log_stat.st_size
+        or report.get("log_mtime") != log_stat.st_mtime_ns
+    ):
+        return None
+    return report
+
+
+def get_report(timestamp_dir: Path, rebuild: bool = False) -> dict:
+    """
+    Usage: get the report of a run, from its summary file while the shared log is unchanged, and
+           otherwise by bringing its state up to date and saving a new summary
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param rebuild: if True, ignore any saved summary and checkpoint
+    @return: report dict as returned by build_report()
+    """
+    shared_log = get_shared_log(timestamp_dir)
+    if not rebuild:
+        report = load_summary(timestamp_dir, shared_log)
+        if report is not None:
+            return report
+
+    log_stat = os.stat(shared_log)
+    report = build_report(timestamp_dir, load_run(timestamp_dir, rebuild), log_stat)
+    save_summary(timestamp_dir, report)
+    return report
+
+
+def write_report_csv(report: dict, out):
+    """
+    Usage: write a report as CSV, with one row per test and resource, and a row with the totals of
+           each test (whose resource column is empty)
+    @param report: dict as returned by build_report()
+    @param out: file object to write to
+    """
+    writer = csv.writer(out)
+    writer.writerow(["run", "test", "known", "resource"] + report["states"])
+    for test, test_report in report["tests"].items():
+        rows = [("", test_report["totals"])] + list(test_report["resources"].items())
+        for resource, counts in rows:
+            writer.writerow(
+                [report["run"], test, int(test_report["known"]), resource]
+                + [counts[state_name] for state_name in report["states"]]
+            )
+
+
+def get_shared_log(timestamp_dir: Path) -> str:
+    """
+    Usage: find the shared log of an exerciser run, exiting if it does not exist
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @return: str path to the shared log
     """
     shared_log = os.path.join(timestamp_dir, "shared_exerciser.log")
     if not os.path.exists(shared_log):
         print(f"Error: Shared log does not exist for test run {timestamp_dir}")
         sys.exit(1)
+    return shared_log
 
-    # print time info for exerciser run being analyzed, and the current time
-    run_time = datetime.strptime(timestamp_dir.name, "%Y-%m-%d_%H-%M")
+
+def print_run_header(timestamp_dir: Path):
+    """
+    Usage: print time info for exerciser run being analyzed, and the current time
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    """
+    run_time = parse_run_time(timestamp_dir)
     curr_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"Evaluating run from: {run_time}")
     print(f"Current time is: {curr_time}")
 
+
+def open_state(timestamp_dir: Path, shared_log: str, rebuild: bool) -> tuple:
+    """
+    Usage: resume from the checkpoint of a previous monitor invocation if there is a usable one,
+           otherwise start from an empty state at the beginning of the shared log
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param shared_log: str path to the shared log of the exerciser run
+    @param rebuild: if True, ignore any saved checkpoint
+    @return: tuple of the aggregated state and the JobEventLog to continue reading from
+    """
+    checkpoint = None if rebuild else load_checkpoint(timestamp_dir, shared_log)
+    if checkpoint is None:
+        state = new_state(timestamp_dir)
+        event_log = JobEventLog(shared_log)
+    else:
+        state, event_log = checkpoint
+        add_expected_tests(state, timestamp_dir)
+    return (state, event_log)
+
+
+def new_test_dict() -> dict:
+    """
+    Usage: create an empty subdict used to store info on the status of a single test
+    @return: dict with a job counter for every state in JOB_STATES, both in total and per resource
+    """
+    return {
+        # total number of jobs of the test that reached each state
+        "totals": array("Q", [0] * len(JOB_STATES)),
+        # resource id -> number of jobs on that resource that reached each state
+        "resources": {},
+        # latency metric -> sketch of that latency over all jobs of the test
+        "latency": {metric: sketch.new_sketch() for metric in LATENCY_METRICS},
+    }
+
+
+def new_state(timestamp_dir: Path) -> dict:
+    """
+    Usage: create the empty aggregated state of an exerciser run, before any events are read
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @return: dict holding the resource table and the expected_tests, unknown_tests, and
+             clusters dicts
+    """
+    # resource names are stored once in the resources list, and everything else refers to them
+    # by their index in that list (their resource id)
     # 2 dicts to store info on the status of the exerciser run
     # 1 for expected tests (appears in working dir)
     # 1 for unkown tests (doesn't appear in working dir, but does appear in shared log)
-    # both are dicts of dicts. each subdict stores info for a single test
-    # subdict fields are: submitted_resources, executed_resources,
-    # succeeded_resources, failed_resources, aborted_resources
-    expected_tests = {}
-    unknown_tests = {}
+    # both are dicts of dicts. each subdict stores the job counters for a single test
+    # clusters dict to store mapping of event cluster to test, and the resource id, sample number,
+    # current state, and submit, execute and end times of each proc in compact arrays indexed by
+    # proc
+    # resource_latency maps a resource id to a sketch of each latency over all of its jobs, and
+    # resource_machines maps it to the set of machines its jobs executed on
+    # output_cache holds every parsed .out/.err file of the run's results dirs, and job_outputs
+    # maps (cluster, proc) to the verdict and error text found in the job's sample dir
+    state = {
+        "resources": [],
+        "resource_ids": {},
+        "resource_latency": {},
+        "resource_machines": {},
+        "expected_tests": {},
+        "unknown_tests": {},
+        "clusters": {},
+        "output_cache": {},
+        "job_outputs": {},
+    }
+    add_expected_tests(state, timestamp_dir)
+    return state
+
+
+def add_expected_tests(state: dict, timestamp_dir: Path):
+    """
+    Usage: add a subdict to expected_tests for every test dir not yet known to the state
+    @param state: aggregated state of the exerciser run as returned by new_state()
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    """
     for item in timestamp_dir.iterdir():
         # every dir represents a test
-        if item.is_dir():
-            test_dict = {
-                "submitted_resources": [],
-                "executed_resources": [],
-                "succeeded_resources": [],
-                "failed_resources": [],
-                "aborted_resources": [],
-            }
-            expected_tests[item.name] = test_dict
+        if item.is_dir() and item.name not in state["expected_tests"]:
+            state["expected_tests"][item.name] = new_test_dict()
+
+
+def get_resource_id(state: dict, resource: str) -> int:
+    """
+    Usage: look up the id of a resource name, adding it to the resource table if it is new
+    @param state: aggregated state of the exerciser run
+    @param resource: GLIDEIN_ResourceName of the resource
+    @return: int index of the resource in state["resources"]
+    """
+    resource_id = state["resource_ids"].get(resource)
+    if resource_id is None:
+        resource_id = len(state["resources"])
+        resource = sys.intern(resource)
+        state["resources"].append(resource)
+        state["resource_ids"][resource] = resource_id
+    return resource_id
+
+
+def get_test_dict(state: dict, cluster_info: dict) -> dict:
+    """
+    Usage: find the subdict of the test that a cluster belongs to
+    @param state: aggregated state of the exerciser run
+    @param cluster_info: entry of the clusters dict for the cluster
+    @return: test subdict from expected_tests or unknown_tests
+    """
+    tests = state["expected_tests"] if cluster_info["known"] else state["unknown_tests"]
+    test_dict = tests.get(cluster_info["testname"])
+    if test_dict is None:
+        test_dict = new_test_dict()
+        tests[cluster_info["testname"]] = test_dict
+    return test_dict
+
+
+def record_job_state(state: dict, cluster_info: dict, proc: int, job_state: int):
+    """
+    Usage: move a single job into a new state, updating the counters of its test and resource
+    @param state: aggregated state of the exerciser run
+    @param cluster_info: entry of the clusters dict for the cluster of the job
+    @param proc: proc id of the job within its cluster
+    @param job_state: index into JOB_STATES of the state the job reached
+    """
+    resource_id = cluster_info["resources"][proc]
+    test_dict = get_test_dict(state, cluster_info)
+
+    counters = test_dict["resources"].get(resource_id)
+    if counters is None:
+        counters = array("L", [0] * len(JOB_STATES))
+        test_dict["resources"][resource_id] = counters
+
+    counters[job_state] += 1
+    test_dict["totals"][job_state] += 1
+    cluster_info["states"][proc] = job_state
+
+
+def record_latency(state: dict, cluster_info: dict, proc: int, metric: str, seconds: float):
+    """
+    Usage: add a latency of a single job to the sketches of its test and resource
+    @param state: aggregated state of the exerciser run
+    @param cluster_info: entry of the clusters dict for the cluster of the job
+    @param proc: proc id of the job within its cluster
+    @param metric: one of LATENCY_METRICS
+    @param seconds: measured latency
+    """
+    resource_id = cluster_info["resources"][proc]
+    sketch.add(get_test_dict(state, cluster_info)["latency"][metric], seconds)
+
+    resource_latency = state["resource_latency"].get(resource_id)
+    if resource_latency is None:
+        resource_latency = {metric: sketch.new_sketch() for metric in LATENCY_METRICS}
+        state["resource_latency"][resource_id] = resource_latency
+    sketch.add(resource_latency[metric], seconds)
+
+
+def process_events(state: dict, events):
+    """
+    Usage: fold events from the shared log into the aggregated state of the exerciser run
+    @param state: aggregated state of the exerciser run as returned by new_state()
+    @param events: iterable of htcondor2 JobEvents read from the shared log
+    """
+    clusters = state["clusters"]
 
-    # clusters dict to store mapping of event cluster to test and associated procs
-    clusters = {}
-    event_log = JobEventLog(shared_log)
     # loop through all events in shared event log, and filter for submit, execute, termination,
     # and abortion events
-    for event in event_log.events(0):
+    for event in events:
         # submit event: add test info to related dicts
         if event.type is JobEventType.SUBMIT:
-            log_notes = event["LogNotes"]
-            if ":" in log_notes:
-                testname, resource, sample_num = log_notes.split(":")[1].split(",")
+            # jobs resubmitted by --retry carry their attempt number as a 4th field
+            notes = watcher.parse_log_notes(event["LogNotes"])
+            if notes is not None:
+                testname, resource, sample_num, attempt = notes
 
                 # add info to clusters to utilize for future execute, term, and abort events
-                if event.cluster not in clusters:
-                    clusters[event.cluster] = {
-                        "testname": testname,
-                        "known": True,
-                        "procs": {event.proc: resource},
+                cluster_info = clusters.get(event.cluster)
+                if cluster_info is None:
+                    cluster_info = {
+                        "testname": sys.intern(testname),
+                        "known": testname in state["expected_tests"],
+                        "resources": array("L"),
+                        "states": bytearray(),
+                        "samples": array("L"),
+                        "attempts": array("H"),
+                        "submit_times": array("d"),
+                        "execute_times": array("d"),
+                        "end_times": array("d"),
                     }
-                else:
-                    clusters[event.cluster]["procs"][event.proc] = resource
-
-                if testname in expected_tests.keys():
-                    expected_tests[testname]["submitted_resources"].append(resource)
-                else:
-                    unknown_tests[testname]["submitted_resources"].append(resource)
-                    clusters[event.cluster]["known"] = False
+                    clusters[event.cluster] = cluster_info
+
+                # procs of a cluster are numbered from 0, so grow the arrays up to this proc
+                missing = event.proc + 1 - len(cluster_info["resources"])
+                if missing > 0:
+                    cluster_info["resources"].extend([NO_RESOURCE] * missing)
+                    cluster_info["states"].extend([NO_STATE] * missing)
+                    cluster_info["samples"].extend([0] * missing)
+                    cluster_info["attempts"].extend([0] * missing)
+                    cluster_info["submit_times"].extend([0.0] * missing)
+                    cluster_info["execute_times"].extend([0.0] * missing)
+                    cluster_info["end_times"].extend([0.0] * missing)
+                cluster_info["resources"][event.proc] = get_resource_id(state, resource)
+                cluster_info["samples"][event.proc] = sample_num
+                cluster_info["attempts"][event.proc] = attempt
+                cluster_info["submit_times"][event.proc] = event.timestamp
+
+                record_job_state(state, cluster_info, event.proc, SUBMITTED)
             else:
                 print("Error: Non-exerciser test found in shared log")
                 sys.exit(1)
-        # execute event: update executed_resources field in test subdict
+        # execute event: count the job as executed. the queue wait is measured up to the first
+        # execution, and the runtime from the latest one
         elif event.type is JobEventType.EXECUTE:
-            testname = clusters[event.cluster]["testname"]
-            resource = clusters[event.cluster]["procs"][event.proc]
-            known = clusters[event.cluster]["known"]
-
-            if known:
-                expected_tests[testname]["executed_resources"].append(resource)
-            else:
-                unknown_tests[testname]["executed_resources"].append(resource)
-        # termination event: determine test success or failure, then update related field
+            cluster_info = clusters[event.cluster]
+            record_job_state(state, cluster_info, event.proc, EXECUTED)
+            machine = get_execute_machine(event)
+            if machine is not None:
+                resource_id = cluster_info["resources"][event.proc]
+                machines = state["resource_machines"].get(resource_id)
+                if machines is None:
+                    machines = set()
+                    state["resource_machines"][resource_id] = machines
+                machines.add(sys.intern(machine))
+            if cluster_info["execute_times"][event.proc] == 0:
+                queue_wait = event.timestamp - cluster_info["submit_times"][event.proc]
+                record_latency(state, cluster_info, event.proc, "queue", queue_wait)
+            cluster_info["execute_times"][event.proc] = event.timestamp
+        # termination event: determine test success or failure, then update related counter
         elif event.type is JobEventType.JOB_TERMINATED:
-            testname = clusters[event.cluster]["testname"]
-            resource = clusters[event.cluster]["procs"][event.proc]
-            known = clusters[event.cluster]["known"]
-
-            if event["ReturnValue"] == 0:
-                if known:
-                    expected_tests[testname]["succeeded_resources"].append(resource)
-                else:
-                    unknown_tests[testname]["succeeded_resources"].append(resource)
+            cluster_info = clusters[event.cluster]
+            if event.get("ReturnValue") == 0:
+                job_state = SUCCEEDED
             else:
-                if known:
-                    expected_tests[testname]["failed_resources"].append(resource)
-                else:
-                    unknown_tests[testname]["failed_resources"].append(resource)
-        # abort event: update aborted_resources field in test subdict
+                job_state = FAILED
+            record_job_state(state, cluster_info, event.proc, job_state)
+            cluster_info["end_times"][event.proc] = event.timestamp
+            if cluster_info["execute_times"][event.proc] > 0:
+                runtime = event.timestamp - cluster_info["execute_times"][event.proc]
+                record_latency(state, cluster_info, event.proc, "runtime", runtime)
+        # abort event: count the job as a system failure, unless the watcher removed it because
+        # its resource was already decided
         elif event.type is JobEventType.JOB_ABORTED:
-            testname = clusters[event.cluster]["testname"]
-            resource = clusters[event.cluster]["procs"][event.proc]
-            known = clusters[event.cluster]["known"]
+            cluster_info = clusters[event.cluster]
+            if str(event.get("Reason", "")).startswith(watcher.CANCEL_REASON):
+                record_job_state(state, cluster_info, event.proc, CANCELLED)
+                cluster_info["end_times"][event.proc] = event.timestamp
+                continue
+            record_job_state(state, cluster_info, event.proc, ABORTED)
+            cluster_info["end_times"][event.proc] = event.timestamp
+            time_to_abort = event.timestamp - cluster_info["submit_times"][event.proc]
+            record_latency(state, cluster_info, event.proc, "abort", time_to_abort)
 
-            if known:
-                expected_tests[testname]["aborted_resources"].append(resource)
-            else:
-                unknown_tests[testname]["aborted_resources"].append(resource)
 
-    print_status(expected_tests, unknown_tests, verbosity)
+def get_execute_machine(event) -> str:
+    """
+    Usage: find the machine a job executed on from its execute event
+    @param event: htcondor2 JobEvent of type EXECUTE
+    @return: the Machine the exerciser asks execute events to carry, falling back to the host
+             part of the slot name (slot1_1@glidein@host), or None if neither is there
+    """
+    machine = event.get("Machine")
+    if machine is not None:
+        return str(machine)
+    slot_name = event.get("SlotName")
+    if slot_name is not None and "@" in str(slot_name):
+        return str(slot_name).rsplit("@", 1)[1]
+    return None
 
 
-def print_status(expected_tests: dict, unknown_tests: dict, verbosity: int):
+def attach_outputs(state: dict, timestamp_dir: Path):
+    """
+    Usage: read the .out and .err files that are new or changed since the last pass, and attach
+           the verdict and error text of each sample dir to the job that wrote it
+    @param state: aggregated state of the exerciser run
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    """
+    outputs.scan_outputs(timestamp_dir, state["output_cache"])
+    samples = outputs.get_sample_outputs(state["output_cache"])
+
+    # a sample dir is shared by every job submitted for the same test, resource and sample, so
+    # its files are attached to the most recently submitted of them
+    job_outputs = {}
+    latest = {}
+    for cluster, proc, test, resource, sample, *_ in iter_jobs(state):
+        key = (test, resource, sample)
+        sample_outputs = samples.get(key)
+        if sample_outputs is None:
+            continue
+        previous = latest.get(key)
+        if previous is not None and previous > (cluster, proc):
+            continue
+        if previous is not None:
+            del job_outputs[previous]
+        latest[key] = (cluster, proc)
+        job_outputs[(cluster, proc)] = sample_outputs
+    state["job_outputs"] = job_outputs
+
+
+def iter_jobs(state: dict):
+    """
+    Usage: iterate through every job the aggregated state of a run knows about
+    @param state: aggregated state of the exerciser run
+    @return: generator of (cluster, proc, test, resource, sample, state, submit_time,
+             execute_time, end_time) tuples, with the state as a name from JOB_STATES
+    """
+    resources = state["resources"]
+    for cluster, cluster_info in state["clusters"].items():
+        for proc, resource_id in enumerate(cluster_info["resources"]):
+            if resource_id == NO_RESOURCE:
+                continue
+            yield (
+                cluster,
+                proc,
+                cluster_info["testname"],
+                resources[resource_id],
+                cluster_info["samples"][proc],
+                JOB_STATES[cluster_info["states"][proc]],
+                cluster_info["submit_times"][proc],
+                cluster_info["execute_times"][proc],
+                cluster_info["end_times"][proc],
+            )
+
+
+def get_final_jobs(state: dict) -> dict:
+    """
+    Usage: find the latest attempt at every (test, resource, sample) of a run, so that jobs
+           resubmitted by --retry replace the outcome of the attempts before them
+    @param state: aggregated state of the exerciser run
+    @return: dict of (test, resource, sample) -> (attempt, cluster, proc, state index)
+    """
+    resources = state["resources"]
+    final_jobs = {}
+    for cluster, cluster_info in state["clusters"].items():
+        for proc, resource_id in enumerate(cluster_info["resources"]):
+            if resource_id == NO_RESOURCE:
+                continue
+            key = (cluster_info["testname"], resources[resource_id], cluster_info["samples"][proc])
+            job = (cluster_info["attempts"][proc], cluster, proc, cluster_info["states"][proc])
+            previous = final_jobs.get(key)
+            if previous is None or job[:3] > previous[:3]:
+                final_jobs[key] = job
+    return final_jobs
+
+
+def parse_run_time(timestamp_dir: Path) -> datetime:
+    """
+    Usage: find the start time of a run from the name of its timestamp dir
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @return: datetime of the run, or None if the dir isn't named like a run
+    """
+    # runs are named YYYY-MM-DD_hh-mm-ss, followed by _N if several runs started in the same
+    # second. runs made by older versions of the exerciser are named YYYY-MM-DD_hh-mm
+    parts = Path(timestamp_dir).name.split("_")
+    if len(parts) < 2:
+        return None
+    for run_id_format in ("%Y-%m-%d_%H-%M-%S", "%Y-%m-%d_%H-%M"):
+        try:
+            return datetime.strptime(f"{parts[0]}_{parts[1]}", run_id_format)
+        except ValueError:
+            continue
+    return None
+
+
+def ingest_state(conn, timestamp_dir: Path, state: dict):
+    """
+    Usage: store the per-job outcomes of a run's aggregated state in the history store
+    @param conn: connection returned by history.open_history()
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param state: aggregated state of the run, up to date with its shared log
+    """
+    log_size = os.path.getsize(os.path.join(timestamp_dir, "shared_exerciser.log"))
+    run_time = parse_run_time(timestamp_dir)
+    history.ingest_run(
+        conn,
+        Path(timestamp_dir).name,
+        run_time.timestamp() if run_time is not None else 0,
+        log_size,
+        iter_jobs(state),
+    )
+
+
+def ingest_all(working_dir: Path):
+    """
+    Usage: ingest every run of a working dir whose shared log changed since its last ingest
+    @param working_dir: directory holding the timestamp dirs of exerciser runs
+    """
+    conn = history.open_history(working_dir)
+    ingested = 0
+    for timestamp_dir in sorted(working_dir.iterdir()):
+        shared_log = os.path.join(timestamp_dir, "shared_exerciser.log")
+        if timestamp_dir.name.startswith(".") or not os.path.exists(shared_log):
+            continue
+        if not history.needs_ingest(conn, timestamp_dir.name, os.path.getsize(shared_log)):
+            continue
+        ingest_state(conn, timestamp_dir, load_run(timestamp_dir))
+        ingested += 1
+    print(f"Ingested {ingested} runs into the history store")
+
+
+def load_checkpoint(timestamp_dir: Path, shared_log: str):
+    """
+    Usage: load the state saved by a previous monitor invocation for an exerciser run
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param shared_log: str path to the shared log of the exerciser run
+    @return: tuple of the aggregated state and the JobEventLog positioned where the state
+             left off, or None if there is no usable checkpoint
+    """
+    checkpoint_file = os.path.join(timestamp_dir, CHECKPOINT_FILE)
+    if not os.path.exists(checkpoint_file):
+        return None
+
+    try:
+        with open(checkpoint_file, "rb") as f:
+            checkpoint = pickle.load(f)
+    except Exception:
+        print(f"Warning: Unreadable monitor checkpoint {checkpoint_file}. Rebuilding from log")
+        return None
+
+    # the shared log only ever grows, so a different inode or a smaller size than when the
+    # checkpoint was written means the log was replaced and the checkpoint no longer applies
+    log_stat = os.stat(shared_log)
+    if (
+        checkpoint.get("version") != CHECKPOINT_VERSION
+        or checkpoint["log_inode"] != log_stat.st_ino
+        or checkpoint["log_size"] > log_stat.st_size
+    ):
+        print(f"Warning: Monitor checkpoint {checkpoint_file} is stale. Rebuilding from log")
+        return None
+
+    return (checkpoint["state"], checkpoint["event_log"])
+
+
+def save_checkpoint(timestamp_dir: Path, shared_log: str, state: dict, event_log: JobEventLog):
+    """
+    Usage: save the aggregated state and shared log position so the next invocation only has to
+           read new events
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param shared_log: str path to the shared log of the exerciser run
+    @param state: aggregated state of the exerciser run
+    @param event_log: JobEventLog that has been read up to the point the state reflects
+    """
+    checkpoint_file = os.path.join(timestamp_dir, CHECKPOINT_FILE)
+    log_stat = os.stat(shared_log)
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "log_inode": log_stat.st_ino,
+        "log_size": log_stat.st_size,
+        "state": state,
+        # JobEventLog objects pickle their current offset into the log
+        "event_log": event_log,
+    }
+
+    # write to a temp file first so an interrupted write never leaves a corrupt checkpoint
+    tmp_file = checkpoint_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            pickle.dump(checkpoint, f)
+        os.replace(tmp_file, checkpoint_file)
+    except OSError as err:
+        print(f"Warning: Could not save monitor checkpoint {checkpoint_file}: {err}")
+
+
+def print_status(state: dict, verbosity: int):
     """
     Usage: print the information gathered from the status method with a varying degree of verbosity
-    @param expected_tests: dict of information on expected tests (appeared in working dir)
-    @param unknown_tests: dict of info on unknown tests (appeared in shared log but not working dir)
+    @param state: aggregated state of the exerciser run, holding the expected tests (appeared in
+                  working dir) and unknown tests (appeared in shared log but not working dir)
     @param verbosity: int specifying level of verbosity with which to print status info
     """
-    # print expected tests
-    if len(expected_tests) > 0:
-        print(f"{len(expected_tests)} expected tests run.")
-        for test in expected_tests.keys():
-            num_submitted_jobs = len(expected_tests[test]["submitted_resources"])
-            num_executed_jobs = len(expected_tests[test]["executed_resources"])
-            num_succeeded_jobs = len(expected_tests[test]["succeeded_resources"])
-            num_failed_jobs = len(expected_tests[test]["failed_resources"])
-            num_aborted_jobs = len(expected_tests[test]["aborted_resources"])
+    for kind, tests in (("expected", state["expected_tests"]), ("unknown", state["unknown_tests"])):
+        if len(tests) > 0:
+            print(f"{len(tests)} {kind} tests run.")
+            for test in tests.keys():
+                print_test_status(test, tests[test], state["resources"], verbosity)
 
-            print(
-                f"{test} test: "
-                + f"{num_submitted_jobs} jobs submitted, "
-                + f"{num_executed_jobs} jobs began executing, "
-                + f"{num_succeeded_jobs} jobs passed, "
-                + f"{num_failed_jobs} jobs failed, "
-                + f"{num_aborted_jobs} system failures"
+
+def print_final_states(state: dict):
+    """
+    Usage: if any jobs of the run were resubmitted, print the outcome of each test counting only
+           the latest attempt at every (test, resource, sample)
+    @param state: aggregated state of the exerciser run
+    """
+    final_jobs = get_final_jobs(state)
+    retried = sum(1 for attempt, *_ in final_jobs.values() if attempt > 0)
+    if retried == 0:
+        return
+
+    print(f"{retried} samples were retried. Outcome of the latest attempt at each sample:")
+    finals = {}
+    for (test, resource, sample), (attempt, cluster, proc, job_state) in final_jobs.items():
+        counts = finals.setdefault(test, [0] * len(JOB_STATES))
+        counts[job_state] += 1
+    for test in sorted(finals.keys()):
+        counts = finals[test]
+        print(
+            f"\t{test} test: {sum(counts)} samples, "
+            + ", ".join(
+                f"{counts[index]} {JOB_STATES[index]}"
+                for index in range(len(JOB_STATES))
+                if counts[index] > 0
             )
-            if verbosity > 0:
-                print(
-                    f"\t{num_failed_jobs} jobs failed the test. List of failed job resources:"
-                )
-                for resource in expected_tests[test]["failed_resources"]:
-                    print(f"\t\t{resource}")
-                print(f"\t{num_aborted_jobs} system failures. List of sys fail resources:")
-                for resource in expected_tests[test]["aborted_resources"]:
-                    print(f"\t\t{resource}")
-
-    # print unknown tests
-    if len(unknown_tests) > 0:
-        print(f"{len(unknown_tests)} unknown tests run.")
-        for test in unknown_tests.keys():
-            num_submitted_jobs = len(unknown_tests[test]["submitted_resources"])
-            num_executed_jobs = len(unknown_tests[test]["executed_resources"])
-            num_succeeded_jobs = len(unknown_tests[test]["succeeded_resources"])
-            num_failed_jobs = len(unknown_tests[test]["failed_resources"])
-            num_aborted_jobs = len(unknown_tests[test]["aborted_resources"])
-            
+        )
+
+
+def print_test_status(test: str, test_dict: dict, resources: list, verbosity: int):
+    """
+    Usage: print the job counters of a single test, and with -v the failed and aborted resources
+    @param test: name of the test
+    @param test_dict: subdict of the test as created by new_test_dict()
+    @param resources: list of resource names, indexed by resource id
+    @param verbosity: int specifying level of verbosity with which to print status info
+    """
+    totals = test_dict["totals"]
+    print(
+        f"{test} test: "
+        + f"{totals[SUBMITTED]} jobs submitted, "
+        + f"{totals[EXECUTED]} jobs began executing, "
+        + f"{totals[SUCCEEDED]} jobs passed, "
+        + f"{totals[FAILED]} jobs failed, "
+        + f"{totals[ABORTED]} system failures"
+        + (f", {totals[CANCELLED]} cancelled (decided)" if totals[CANCELLED] > 0 else "")
+    )
+    if verbosity > 0:
+        print(f"\t{totals[FAILED]} jobs failed the test. List of failed job resources:")
+        print_resources(test_dict, resources, FAILED)
+        print(f"\t{totals[ABORTED]} system failures. List of sys fail resources:")
+        print_resources(test_dict, resources, ABORTED)
+
+
+def print_outputs(state: dict, verbosity: int):
+    """
+    Usage: summarize the verdicts found in the jobs' .out files, and with -vv print the error
+           text of every finished job that did not pass
+    @param state: aggregated state of the exerciser run
+    @param verbosity: int specifying level of verbosity with which to print output info
+    """
+    job_outputs = state["job_outputs"]
+    if len(job_outputs) == 0:
+        return
+
+    verdicts = {"success": 0, "failure": 0, None: 0}
+    disagreements = 0
+    for (cluster, proc), job_output in job_outputs.items():
+        verdicts[job_output["verdict"]] += 1
+        # the verdict printed by the test and the job's exit code should tell the same story
+        job_state = state["clusters"][cluster]["states"][proc]
+        if (job_output["verdict"] == "success" and job_state == FAILED) or (
+            job_output["verdict"] == "failure" and job_state == SUCCEEDED
+        ):
+            disagreements += 1
+    print(
+        f"Job outputs: {len(job_outputs)} jobs wrote output, {verdicts['success']} reported "
+        + f"success, {verdicts['failure']} reported failure, {verdicts[None]} reported no verdict, "
+        + f"{disagreements} verdicts disagree with the exit code"
+    )
+
+    # throughput of the tests that report the data they read, overall and with -v per resource
+    transfers = get_resource_transfers(state)
+    if len(transfers) > 0:
+        overall = {"jobs": 0, "bytes": 0, "seconds": 0.0}
+        for totals in transfers.values():
+            for field in overall:
+                overall[field] += totals[field]
+        print(f"Transfers: {format_transfer(overall)}")
+        if verbosity > 0:
+            for resource, totals in transfers.items():
+                print(f"\t{resource}: {format_transfer(totals)}")
+
+    if verbosity > 1:
+        resources = state["resources"]
+        for (cluster, proc), job_output in sorted(job_outputs.items()):
+            cluster_info = state["clusters"][cluster]
+            if job_output["error"] is None or cluster_info["states"][proc] not in (FAILED, ABORTED):
+                continue
+            last_line = job_output["error"].splitlines()[-1]
             print(
-                f"{test} test: "
-                + f"{num_submitted_jobs} jobs submitted, "
-                + f"{num_executed_jobs} jobs began executing, "
-                + f"{num_succeeded_jobs} jobs passed, "
-                + f"{num_failed_jobs} jobs failed, "
-                + f"{num_aborted_jobs} system failures"
+                f"\t{cluster_info['testname']} {resources[cluster_info['resources'][proc]]} "
+                + f"sample_{cluster_info['samples'][proc]:03} ({cluster}.{proc}): {last_line}"
             )
-            if verbosity > 0:
-                print(
-                    f"\t{num_failed_jobs} jobs failed the test. List of failed job resources:"
-                )
-                for resource in unknown_tests[test]["failed_resources"]:
-                    print(f"\t\t{resource}")
-                print(f"\t{num_aborted_jobs} system failures. List of sys fail resources:")
-                for resource in unknown_tests[test]["aborted_resources"]:
-                    print(f"\t\t{resource}")
+
+
+def get_resource_transfers(state: dict) -> dict:
+    """
+    Usage: sum the data the jobs of each resource reported reading in their .out files
+    @param state: aggregated state of the exerciser run
+    @return: dict of resource name -> {"jobs", "bytes", "seconds"}, sorted by resource. resources
+             without jobs that reported reading data are left out
+    """
+    resources = state["resources"]
+    clusters = state["clusters"]
+    transfers = {}
+    for (cluster, proc), job_output in state["job_outputs"].items():
+        if job_output["transfer"] is None:
+            continue
+        resource = resources[clusters[cluster]["resources"][proc]]
+        totals = transfers.setdefault(resource, {"jobs": 0, "bytes": 0, "seconds": 0.0})
+        totals["jobs"] += 1
+        totals["bytes"] += job_output["transfer"][0]
+        totals["seconds"] += job_output["transfer"][1]
+    return dict(sorted(transfers.items()))
+
+
+def format_transfer(totals: dict) -> str:
+    """
+    Usage: describe the data a set of jobs reported reading
+    @param totals: dict with the "jobs", "bytes" and "seconds" of the reads
+    """
+    mib = totals["bytes"] / 2**20
+    throughput = f"{mib / totals['seconds']:.1f} MiB/s" if totals["seconds"] > 0 else "-"
+    return f"{totals['jobs']} jobs read {mib:.1f} MiB at {throughput}"
+
+
+def print_triage(state: dict, verbosity: int, limit: int):
+    """
+    Usage: cluster the error text of every failed or aborted job and print the clusters
+    @param state: aggregated state of the exerciser run
+    @param verbosity: int specifying level of verbosity with which to print triage info
+    @param limit: maximum number of clusters to print
+    """
+    resources = state["resources"]
+    clusters = state["clusters"]
+    failures = (
+        (resources[clusters[cluster]["resources"][proc]], job_output["error"])
+        for (cluster, proc), job_output in state["job_outputs"].items()
+        if job_output["error"] is not None
+        and clusters[cluster]["states"][proc] in (FAILED, ABORTED)
+    )
+    triage.print_triage(triage.cluster_failures(failures), verbosity, limit)
+
+
+def print_resources(test_dict: dict, resources: list, job_state: int):
+    """
+    Usage: print every resource with at least one job of a test in job_state
+    @param test_dict: subdict of the test as created by new_test_dict()
+    @param resources: list of resource names, indexed by resource id
+    @param job_state: index into JOB_STATES of the state to list resources for
+    """
+    names = []
+    for resource_id, counters in test_dict["resources"].items():
+        if counters[job_state] > 0:
+            names.append((resources[resource_id], counters[job_state]))
+
+    for name, count in sorted(names):
+        print(f"\t\t{name}" + (f" ({count} jobs)" if count > 1 else ""))
+
+
+def print_coverage(timestamp_dir: Path, state: dict, verbosity: int, pool_snapshot: dict = None):
+    """
+    Usage: compare the resources that received jobs against the pool snapshot the run was planned
+           from, if the run kept one
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param state: aggregated state of the exerciser run
+    @param verbosity: int specifying level of verbosity with which to print coverage info
+    @param pool_snapshot: snapshot dict of the run, loaded from the run dir if not provided
+    """
+    if pool_snapshot is None:
+        pool_snapshot = snapshot.load_snapshot(
+            os.path.join(timestamp_dir, snapshot.RUN_SNAPSHOT_FILE)
+        )
+    print_machine_coverage(state, verbosity, pool_snapshot)
+    if pool_snapshot is None:
+        return
+
+    counts = snapshot.resource_counts(pool_snapshot)
+    submitted = set(state["resources"])
+    missing = sorted(name for name in counts.keys() if name not in submitted)
+    print(
+        f"Pool snapshot: {len(counts)} resources with {sum(counts.values())} slots, "
+        + f"{len(counts) - len(missing)} of them received jobs"
+    )
+    if verbosity > 0 and len(missing) > 0:
+        print(f"\t{len(missing)} resources received no jobs:")
+        for name in missing:
+            print(f"\t\t{name} ({counts[name]} slots)")
+
+
+def print_machine_coverage(state: dict, verbosity: int, pool_snapshot: dict = None):
+    """
+    Usage: print how many distinct machines the jobs of the run executed on, and with -v the
+           resources where several executions landed on the same machine
+    @param state: aggregated state of the exerciser run
+    @param verbosity: int specifying level of verbosity with which to print coverage info
+    @param pool_snapshot: snapshot dict of the run, or None if it didn't keep one
+    """
+    resource_machines = state["resource_machines"]
+    if len(resource_machines) == 0:
+        return
+
+    executions = {}
+    for tests in (state["expected_tests"], state["unknown_tests"]):
+        for test_dict in tests.values():
+            for resource_id, counters in test_dict["resources"].items():
+                executions[resource_id] = executions.get(resource_id, 0) + counters[EXECUTED]
+
+    reached = sum(len(machines) for machines in resource_machines.values())
+    known = ""
+    if pool_snapshot is not None:
+        num_machines = sum(
+            len(resource.get("machines", {})) for resource in pool_snapshot["resources"].values()
+        )
+        if num_machines > 0:
+            known = f", out of {num_machines} machines in the pool snapshot"
+    print(
+        f"Machines reached: {reached} distinct machines on {len(resource_machines)} resources "
+        + f"by {sum(executions.values())} job executions{known}"
+    )
+
+    if verbosity > 0:
+        doubled = sorted(
+            (state["resources"][resource_id], len(machines), executions.get(resource_id, 0))
+            for resource_id, machines in resource_machines.items()
+            if executions.get(resource_id, 0) > len(machines)
+        )
+        if len(doubled) > 0:
+            print(f"\t{len(doubled)} resources ran several jobs on the same machine:")
+            for resource, num_machines, num_executions in doubled:
+                print(f"\t\t{resource} ({num_executions} executions on {num_machines} machines)")
+
+
+def new_rollup_node() -> dict:
+    """
+    Usage: create an empty node of the hierarchy rollup
+    @return: dict with a job counter for every state in JOB_STATES, a sketch of each latency, the
+             number of resources with jobs below the node, and the child nodes by name
+    """
+    return {
+        "totals": array("Q", [0] * len(JOB_STATES)),
+        "latency": {metric: sketch.new_sketch() for metric in LATENCY_METRICS},
+        "resources": 0,
+        "children": {},
+    }
+
+
+def rollup_hierarchy(state: dict, hierarchy: dict) -> dict:
+    """
+    Usage: add up the job counters and latencies of every resource of a run into its site, its
+           institution, and the pool
+    @param state: aggregated state of the exerciser run
+    @param hierarchy: index returned by snapshot.build_hierarchy() for the run's snapshot
+    @return: rollup node of the pool, whose children are institutions, whose children are sites,
+             whose children are resources
+    """
+    resource_totals = {}
+    for tests in (state["expected_tests"], state["unknown_tests"]):
+        for test_dict in tests.values():
+            for resource_id, counters in test_dict["resources"].items():
+                totals = resource_totals.get(resource_id)
+                if totals is None:
+                    totals = array("Q", [0] * len(JOB_STATES))
+                    resource_totals[resource_id] = totals
+                for index in range(len(JOB_STATES)):
+                    totals[index] += counters[index]
+
+    pool = new_rollup_node()
+    unknown = (snapshot.UNKNOWN, snapshot.UNKNOWN)
+    for resource_id, totals in resource_totals.items():
+        resource = state["resources"][resource_id]
+        institution, site = hierarchy["resources"].get(resource, unknown)
+        resource_latency = state["resource_latency"].get(resource_id, {})
+
+        # the resource's node and every node above it, down from the pool
+        path = [pool]
+        for name in (institution, site, resource):
+            child = path[-1]["children"].get(name)
+            if child is None:
+                child = new_rollup_node()
+                path[-1]["children"][name] = child
+            path.append(child)
+
+        for node in path:
+            node["resources"] += 1
+            for index in range(len(JOB_STATES)):
+                node["totals"][index] += totals[index]
+            for metric, resource_sketch in resource_latency.items():
+                sketch.merge(node["latency"][metric], resource_sketch)
+    return pool
+
+
+def format_rollup_node(name: str, node: dict) -> str:
+    """
+    Usage: format the counters and latencies of a rollup node as a single line
+    @param name: label of the node
+    @param node: rollup node as created by new_rollup_node()
+    @return: str representation of the node
+    """
+    totals = node["totals"]
+    finished = totals[SUCCEEDED] + totals[FAILED] + totals[ABORTED]
+    pass_rate = f"{totals[SUCCEEDED] / finished:.0%}" if finished > 0 else "-"
+    queue = sketch.summarize(node["latency"]["queue"])["p90"]
+    runtime = sketch.summarize(node["latency"]["runtime"])["p90"]
+    # resources are the leaves of the rollup, there is nothing below them to count
+    resources = f"{node['resources']} resources, " if len(node["children"]) > 0 else ""
+    return (
+        f"{name}: {resources}{totals[SUBMITTED]} jobs submitted, "
+        + f"{totals[SUCCEEDED]} passed, {totals[FAILED]} failed, "
+        + f"{totals[ABORTED]} system failures, {pass_rate} pass rate, "
+        + f"p90 queue wait {format_duration(queue)}, p90 runtime {format_duration(runtime)}"
+    )
+
+
+def print_rollup(timestamp_dir: Path, state: dict, verbosity: int):
+    """
+    Usage: print the outcomes of the run rolled up the pool hierarchy, one line per institution
+           with the most failed and aborted jobs first. with -v the sites of each institution are
+           listed below it, and with -vv the resources of each site
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param state: aggregated state of the exerciser run
+    @param verbosity: int specifying level of verbosity with which to print rollup info
+    """
+    pool_snapshot = snapshot.load_snapshot(os.path.join(timestamp_dir, snapshot.RUN_SNAPSHOT_FILE))
+    if pool_snapshot is None:
+        print("No pool snapshot was kept for this run, cannot roll it up the pool hierarchy")
+        return
+
+    pool = rollup_hierarchy(state, snapshot.build_hierarchy(pool_snapshot))
+
+    def worst_first(children: dict) -> list:
+        return sorted(
+            children.items(),
+            key=lambda item: (-(item[1]["totals"][FAILED] + item[1]["totals"][ABORTED]), item[0]),
+        )
+
+    print("Hierarchy rollup:")
+    print("\t" + format_rollup_node("pool", pool))
+    for institution, institution_node in worst_first(pool["children"]):
+        print("\t" + format_rollup_node(f"institution {institution}", institution_node))
+        if verbosity < 1:
+            continue
+        for site, site_node in worst_first(institution_node["children"]):
+            print("\t\t" + format_rollup_node(f"site {site}", site_node))
+            if verbosity < 2:
+                continue
+            for resource, resource_node in worst_first(site_node["children"]):
+                print("\t\t\t" + format_rollup_node(resource, resource_node))
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Usage: format a number of seconds for the latency report, e.g. 1h05m or 42s
+    @param seconds: duration to format, or None
+    @return: str representation of the duration
+    """
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours > 0:
+        return f"{hours}h{minutes:02}m"
+    if minutes > 0:
+        return f"{minutes}m{seconds:02}s"
+    return f"{seconds}s"
+
+
+def format_latency(summary: dict) -> str:
+    """
+    Usage: format the summary of a latency sketch as p50 / p90 / p99 / max
+    @param summary: dict as returned by sketch.summarize()
+    @return: str representation of the distribution
+    """
+    return (
+        " / ".join(format_duration(summary[field]) for field in ("p50", "p90", "p99", "max"))
+        + f" ({summary['count']} jobs)"
+    )
+
+
+def print_latency(state: dict, slowest: int, rank_by: str):
+    """
+    Usage: print the latency distributions of each test and a ranked list of the slowest resources
+    @param state: aggregated state of the exerciser run
+    @param slowest: number of slowest resources to list
+    @param rank_by: latency metric (one of LATENCY_METRICS) to rank the resources by its p90
+    """
+    print("Latency (p50 / p90 / p99 / max):")
+    for tests in (state["expected_tests"], state["unknown_tests"]):
+        for test in tests.keys():
+            print(f"\t{test} test:")
+            for metric in LATENCY_METRICS:
+                summary = sketch.summarize(tests[test]["latency"][metric])
+                if summary["count"] > 0:
+                    print(f"\t\t{LATENCY_LABELS[metric]}: {format_latency(summary)}")
+
+    ranked = []
+    for resource_id, resource_latency in state["resource_latency"].items():
+        summary = sketch.summarize(resource_latency[rank_by])
+        if summary["count"] > 0:
+            ranked.append((summary["p90"], state["resources"][resource_id], summary))
+    ranked.sort(key=lambda entry: entry[0], reverse=True)
+
+    print(f"Slowest {min(slowest, len(ranked))} resources by p90 {LATENCY_LABELS[rank_by]}:")
+    for p90, resource, summary in ranked[:slowest]:
+        print(f"\t{resource}: {format_latency(summary)}")
 
 
 if __name__ == "__main__":
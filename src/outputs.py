@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: ingestion of the .out and .err files jobs write into results/<resource>/sample_XXX. the
+    trees are walked with os.scandir, one resource dir per worker thread, and the mtime and size of
+    every file read is cached, so later passes only read files that are new or have changed
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+OUTPUT_SUFFIXES = (".out", ".err")
+SCAN_WORKERS = 16
+
+# only the end of an .err file is kept as the error text of a job
+ERROR_TAIL_BYTES = 2048
+
+# lines printed by tests to report their verdict
+VERDICTS = {"Test Success": "success", "Test Failure": "failure"}
+
+# tests that move data print a line of key=value fields for every file they read, e.g.
+# "file=input size_bytes=1048576 read_seconds=0.012 throughput_MiBps=83.3 verdict=ok". the sizes
+# and read times of these lines are summed per job, so throughput can be aggregated per resource
+SIZE_FIELD = "size_bytes"
+SECONDS_FIELD = "read_seconds"
+# files a test wrote itself (e.g. to local scratch) also carry their write time. reading them back
+# measures local storage rather than transfer, so their lines are left out of the throughput
+WRITE_FIELD = "write_seconds"
+
+
+def scan_outputs(timestamp_dir: Path, cache: dict, workers: int = SCAN_WORKERS) -> int:
+    """
+    Usage: bring the cache of parsed output files up to date with the results dirs of a run
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @param cache: dict of path relative to the run -> (mtime_ns, size, test, resource, sample,
+                  suffix, parsed value), updated in place. files that no longer exist are dropped
+    @param workers: number of threads walking resource dirs in parallel
+    @return: number of files that were read in this pass
+    """
+    resource_dirs = []
+    for test_entry in os.scandir(timestamp_dir):
+        results_dir = os.path.join(test_entry.path, "results")
+        if not test_entry.is_dir() or not os.path.isdir(results_dir):
+            continue
+        for resource_entry in os.scandir(results_dir):
+            if resource_entry.is_dir():
+                resource_dirs.append((test_entry.name, resource_entry.name, resource_entry.path))
+
+    seen = set()
+    num_read = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(scan_resource_dir, test, resource, path, cache)
+            for test, resource, path in resource_dirs
+        ]
+        # workers only read the cache. updates are applied here, on the calling thread
+        for future in futures:
+            files, updates = future.result()
+            seen.update(files)
+            cache.update(updates)
+            num_read += len(updates)
+
+    for path in [path for path in cache if path not in seen]:
+        del cache[path]
+    return num_read
+
+
+def scan_resource_dir(test: str, resource: str, resource_path: str, cache: dict) -> tuple:
+    """
+    Usage: walk the sample dirs of one resource, reading the output files that are not cached
+    @param test: name of the test the results dir belongs to
+    @param resource: name of the resource dir
+    @param resource_path: str path to results/<resource> of the test
+    @param cache: dict of already parsed files, as passed to scan_outputs()
+    @return: tuple of the list of every output file found, and a dict of cache updates for the
+             files that were new or changed
+    """
+    files = []
+    updates = {}
+    for sample_entry in os.scandir(resource_path):
+        if not sample_entry.is_dir() or not sample_entry.name.startswith("sample_"):
+            continue
+        try:
+            sample = int(sample_entry.name[len("sample_") :])
+        except ValueError:
+            continue
+        for file_entry in os.scandir(sample_entry.path):
+            suffix = os.path.splitext(file_entry.name)[1]
+            if suffix not in OUTPUT_SUFFIXES or not file_entry.is_file():
+                continue
+            key = os.path.join(test, "results", resource, sample_entry.name, file_entry.name)
+            files.append(key)
+            stat = file_entry.stat()
+            cached = cache.get(key)
+            if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                continue
+            value = read_out(file_entry.path) if suffix == ".out" else read_error(file_entry.path)
+            updates[key] = (stat.st_mtime_ns, stat.st_size, test, resource, sample, suffix, value)
+    return (files, updates)
+
+
+def read_out(path: str) -> tuple:
+    """
+    Usage: find the verdict a test printed to its .out file, and the data it reported reading.
+           the last verdict line wins
+    @param path: str path to the .out file
+    @return: tuple of "success", "failure", or None if the test printed no verdict (yet), and
+             [bytes, seconds] summed over the files the test reported reading, or None if it
+             reported none. files the test wrote itself are not counted. None if the file
+             can't be read
+    """
+    verdict = None
+    transfer = None
+    try:
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                verdict = VERDICTS.get(line, verdict)
+                fields = parse_fields(line)
+                if fields is None or WRITE_FIELD in fields:
+                    continue
+                try:
+                    size = int(fields[SIZE_FIELD])
+                    seconds = float(fields[SECONDS_FIELD])
+                except (KeyError, ValueError):
+                    continue
+                if transfer is None:
+                    transfer = [0, 0.0]
+                transfer[0] += size
+                transfer[1] += seconds
+    except OSError:
+        return None
+    return (verdict, transfer)
+
+
+def parse_fields(line: str) -> dict:
+    """
+    Usage: split a line of whitespace separated key=value fields
+    @return: dict of the fields, or None if not every word of the line is a field
+    """
+    fields = {}
+    for word in line.split():
+        key, sep, value = word.partition("=")
+        if sep == "" or key == "":
+            return None
+        fields[key] = value
+    return fields if len(fields) > 0 else None
+
+
+def read_error(path: str) -> str:
+    """
+    Usage: read the end of a .err file
+    @param path: str path to the .err file
+    @return: the last ERROR_TAIL_BYTES of the file with surrounding whitespace removed, or None if
+             the file is empty
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - ERROR_TAIL_BYTES))
+            text = f.read().decode(errors="replace").strip()
+    except OSError:
+        return None
+    return text if len(text) > 0 else None
+
+
+def get_sample_outputs(cache: dict) -> dict:
+    """
+    Usage: combine the parsed .out and .err files of each sample
+    @param cache: dict of parsed files, as filled in by scan_outputs()
+    @return: dict of (test, resource, sample) -> {"verdict", "error", "transfer"}, where transfer
+             is the [bytes, seconds] of data the test reported reading, or None
+    """
+    samples = {}
+    for mtime_ns, size, test, resource, sample, suffix, value in cache.values():
+        outputs = samples.get((test, resource, sample))
+        if outputs is None:
+            outputs = {"verdict": None, "error": None, "transfer": None}
+            samples[(test, resource, sample)] = outputs
+        if value is None:
+            continue
+        if suffix == ".out":
+            outputs["verdict"], outputs["transfer"] = value
+        elif outputs["error"] is None:
+            outputs["error"] = value
+        else:
+            # a sample with several .err files keeps the text of all of them
+            outputs["error"] += "\n" + value
+    return samples
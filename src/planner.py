@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: cost planning of exerciser runs. works out how many jobs a run submits, what they request,
+    and how many input bytes they transfer, before anything is submitted, and finds the largest
+    sample size that keeps a run within a budget
+"""
+
+import htcondor2
+from math import ceil
+from pathlib import Path
+import os
+import re
+import metrics
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$", re.I)
+MACRO_PATTERN = re.compile(r"\$\((\w+)\)")
+
+# units HTCondor assumes for request_memory and request_disk values given without one
+MEMORY_UNIT = 1024**2
+DISK_UNIT = 1024
+
+# the sample size is never scaled below this when fitting a run into a budget
+MIN_SAMPLE = 1e-6
+
+
+def parse_size(value: str, default_unit: int = 1) -> int:
+    """
+    Usage: parse a size such as "512", "1GB" or "2.5 G"
+    @param value: size as written in a submit file or on the command line
+    @param default_unit: number of bytes a value without a unit counts in
+    @return: size in bytes, or None if the value isn't a plain size (e.g. an expression)
+    """
+    match = SIZE_PATTERN.match(str(value))
+    if match is None:
+        return None
+    number, unit = match.groups()
+    multiplier = SIZE_UNITS[unit.upper()] if unit != "" else default_unit
+    return int(float(number) * multiplier)
+
+
+def count_jobs(resources: dict, sample_percent: float) -> int:
+    """
+    Usage: count the jobs one test is submitted as, without generating them
+    @param resources: dict of resource names to the number of slots they have
+    @param sample_percent: percent of machines to send tests to in each resource
+    @return: total number of jobs for one test
+    """
+    return sum(ceil(resource_size * sample_percent) for resource_size in resources.values())
+
+
+def get_job_costs(test_dir: Path) -> dict:
+    """
+    Usage: read what a single job of a test requests and transfers from its submit file
+    @param test_dir: dir of the test in the tests dir
+    @return: dict with the requested "cpus", "memory" and "disk" (bytes, None if not a plain
+             value), the "input_bytes" of the inputs whose size is known, and the number of
+             "unknown_inputs" (URLs, macros, and missing files)
+    """
+    sub_files = [item for item in test_dir.iterdir() if item.suffix == ".sub"]
+    with open(sub_files[0], "r") as f:
+        job = htcondor2.Submit(f.read())
+
+    cpus = job.get("request_cpus")
+    costs = {
+        "cpus": int(cpus) if cpus is not None and str(cpus).strip().isdigit() else None,
+        "memory": parse_size(job.get("request_memory", ""), MEMORY_UNIT),
+        "disk": parse_size(job.get("request_disk", ""), DISK_UNIT),
+        "input_bytes": 0,
+        "unknown_inputs": 0,
+    }
+
+    inputs = [
+        name.strip() for name in str(job.get("transfer_input_files", "")).split(",") if name.strip()
+    ]
+    executable = job.get("executable")
+    if executable is not None and str(job.get("transfer_executable", "true")).lower() not in (
+        "false",
+        "no",
+    ):
+        inputs.append(str(executable))
+
+    for name in inputs:
+        # expand macros defined in the submit file itself, e.g. probe_input of probe_transfer
+        name = MACRO_PATTERN.sub(lambda match: str(job.get(match.group(1), match.group(0))), name)
+        path = os.path.join(test_dir, name)
+        if "://" in name or "$(" in name or not os.path.exists(path):
+            costs["unknown_inputs"] += 1
+        elif os.path.isdir(path):
+            costs["input_bytes"] += metrics.dir_size(path)
+        else:
+            costs["input_bytes"] += os.path.getsize(path)
+    return costs
+
+
+def plan_run(test_dirs: list, resources: dict, sample_percent: float) -> dict:
+    """
+    Usage: compute the cost of a run, per test and in total
+    @param test_dirs: list of the dirs of the tests to run
+    @param resources: dict of resource names to the number of slots they have
+    @param sample_percent: percent of machines to send tests to in each resource
+    @return: dict with the "sample" size, the number of "resources", the per "tests" costs (each
+             with the per job costs, the number of "jobs" and their totals) and the "total" of all
+             tests
+    """
+    jobs = count_jobs(resources, sample_percent)
+    plan = {"sample": sample_percent, "resources": len(resources), "tests": {}}
+    total = {"jobs": 0, "cpus": 0, "memory": 0, "disk": 0, "input_bytes": 0, "unknown_inputs": 0}
+    for test_dir in test_dirs:
+        per_job = get_job_costs(test_dir)
+        test_plan = {"jobs": jobs, "per_job": per_job}
+        for field in ("cpus", "memory", "disk", "input_bytes"):
+            test_plan[field] = per_job[field] * jobs if per_job[field] is not None else None
+            total[field] += test_plan[field] or 0
+        test_plan["unknown_inputs"] = per_job["unknown_inputs"] * jobs
+        total["jobs"] += jobs
+        total["unknown_inputs"] += test_plan["unknown_inputs"]
+        plan["tests"][test_dir.name] = test_plan
+    plan["total"] = total
+    return plan
+
+
+def fit_sample(
+    test_dirs: list,
+    resources: dict,
+    sample_percent: float,
+    max_jobs: int = None,
+    max_transfer_bytes: int = None,
+) -> float:
+    """
+    Usage: find the largest sample size up to sample_percent whose run stays within the budget
+    @param test_dirs: list of the dirs of the tests to run
+    @param resources: dict of resource names to the number of slots they have
+    @param sample_percent: requested sample size
+    @param max_jobs: largest number of jobs the run may submit, or None for no limit
+    @param max_transfer_bytes: largest number of input bytes the run may transfer, or None
+    @return: sample size to run with, or None if even the smallest run (one job per resource)
+             exceeds the budget
+    """
+    input_bytes = sum(get_job_costs(test_dir)["input_bytes"] for test_dir in test_dirs)
+
+    def fits(sample: float) -> bool:
+        jobs = count_jobs(resources, sample)
+        if max_jobs is not None and jobs * len(test_dirs) > max_jobs:
+            return False
+        if max_transfer_bytes is not None and jobs * input_bytes > max_transfer_bytes:
+            return False
+        return True
+
+    if fits(sample_percent):
+        return sample_percent
+    if not fits(MIN_SAMPLE):
+        return None
+
+    # job counts only grow with the sample size, so the largest fitting size can be bisected
+    low, high = MIN_SAMPLE, sample_percent
+    for _ in range(60):
+        middle = (low + high) / 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def format_size(num_bytes: int) -> str:
+    """
+    Usage: format a number of bytes with a binary unit
+    """
+    if num_bytes is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if num_bytes < 1024 or unit == "TiB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+
+def print_plan(plan: dict):
+    """
+    Usage: print a plan returned by plan_run()
+    """
+    print(
+        f"Run plan for {len(plan['tests'])} tests on {plan['resources']} resources at a sample "
+        + f"size of {plan['sample']:.4g}:"
+    )
+    rows = list(plan["tests"].items()) + [("total", plan["total"])]
+    for name, costs in rows:
+        cpus = costs["cpus"] if costs["cpus"] is not None else "-"
+        print(
+            f"\t{name}: {costs['jobs']} jobs, {cpus} cpus, {format_size(costs['memory'])} memory, "
+            + f"{format_size(costs['disk'])} disk, {format_size(costs['input_bytes'])} input "
+            + "transfer"
+            + (
+                f" (plus {costs['unknown_inputs']} inputs of unknown size)"
+                if costs["unknown_inputs"] > 0
+                else ""
+            )
+        )
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: collection of the results written by the performance probe tests. every probe job writes
+    PROBE_RESULTS_FILE into its sample dir, and the results are aggregated per resource so that
+    resources which work but perform poorly compared to the rest of the pool stand out
+"""
+
+import json
+import os
+from pathlib import Path
+from statistics import median
+
+PROBE_RESULTS_FILE = "probe_results.json"
+
+# resources whose median for a metric falls below this fraction of the pool median are flagged
+DEFAULT_THRESHOLD = 0.5
+
+
+def collect_probe_results(timestamp_dir: Path) -> dict:
+    """
+    Usage: walk results/<resource>/sample_XXX of every test of a run and read the probe results
+    @param timestamp_dir: Path object to the root dir of an exerciser run
+    @return: dict of probe name -> metric name -> resource -> list of values, one per sample
+    """
+    results = {}
+    for test_entry in os.scandir(timestamp_dir):
+        results_dir = os.path.join(test_entry.path, "results")
+        if not test_entry.is_dir() or not os.path.isdir(results_dir):
+            continue
+        for resource_entry in os.scandir(results_dir):
+            if not resource_entry.is_dir():
+                continue
+            for sample_entry in os.scandir(resource_entry.path):
+                probe = read_probe_file(os.path.join(sample_entry.path, PROBE_RESULTS_FILE))
+                if probe is None:
+                    continue
+                probe_metrics = results.setdefault(probe["probe"], {})
+                for metric, value in probe["metrics"].items():
+                    probe_metrics.setdefault(metric, {}).setdefault(
+                        resource_entry.name, []
+                    ).append(value)
+    return results
+
+
+def read_probe_file(path: str) -> dict:
+    """
+    Usage: read the results file of one probe job
+    @param path: path to the results file
+    @return: dict with the probe name and its metrics, or None if the job has not written a
+             (valid) results file
+    """
+    try:
+        with open(path, "r") as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(probe, dict) or "probe" not in probe or "metrics" not in probe:
+        return None
+    # drop metrics the probe could not measure on this resource
+    probe["metrics"] = {
+        metric: value
+        for metric, value in probe["metrics"].items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    return probe
+
+
+def aggregate_probe_results(results: dict, threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    Usage: reduce the collected probe results to per resource medians, and compare each one
+           against the pool. every probe metric is reported so that higher is better
+    @param results: dict returned by collect_probe_results()
+    @param threshold: fraction of the pool median below which a resource is flagged
+    @return: dict of probe name -> metric name -> {"pool_median", "resources": {resource:
+             {"samples", "median", "min", "relative", "flagged"}}}
+    """
+    report = {}
+    for probe, probe_metrics in results.items():
+        for metric, resources in probe_metrics.items():
+            medians = {resource: median(values) for resource, values in resources.items()}
+            pool_median = median(medians.values())
+            report.setdefault(probe, {})[metric] = {
+                "pool_median": pool_median,
+                "resources": {
+                    resource: {
+                        "samples": len(resources[resource]),
+                        "median": medians[resource],
+                        "min": min(resources[resource]),
+                        "relative": medians[resource] / pool_median if pool_median > 0 else None,
+                        "flagged": pool_median > 0
+                        and medians[resource] < threshold * pool_median,
+                    }
+                    for resource in resources
+                },
+            }
+    return report
+
+
+def print_probe_report(report: dict, verbosity: int, threshold: float = DEFAULT_THRESHOLD):
+    """
+    Usage: print the aggregated probe results
+    @param report: dict returned by aggregate_probe_results()
+    @param verbosity: flagged resources are always listed. at verbosity 1 and up every resource
+                      is listed, slowest first
+    @param threshold: fraction of the pool median below which a resource was flagged
+    """
+    if len(report) == 0:
+        print("No probe results found")
+        return
+
+    print(f"Probe results (resources below {threshold:.0%} of the pool median are flagged):")
+    for probe in sorted(report.keys()):
+        for metric in sorted(report[probe].keys()):
+            entry = report[probe][metric]
+            resources = entry["resources"]
+            flagged = [resource for resource in resources if resources[resource]["flagged"]]
+            print(
+                f"\t{probe} {metric}: pool median {entry['pool_median']:.1f} over "
+                + f"{len(resources)} resources, {len(flagged)} flagged"
+            )
+            listed = resources.keys() if verbosity > 0 else flagged
+            for resource in sorted(listed, key=lambda resource: resources[resource]["median"]):
+                result = resources[resource]
+                relative = f"{result['relative']:.0%}" if result["relative"] is not None else "-"
+                print(
+                    f"\t\t{'*' if result['flagged'] else ' '} {resource}: median "
+                    + f"{result['median']:.1f} ({relative} of pool), min {result['min']:.1f}, "
+                    + f"{result['samples']} samples"
+                )
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: retention of exerciser runs. keeps an index of the run dirs of a working dir with their
+    dates and sizes, picks the runs a retention policy drops, and deletes them in the background
+    with a bounded pool of threads
+"""
+
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import metrics
+import monitor
+import snapshot
+import staging
+
+# index of the run dirs of a working dir. hidden, so it is never mistaken for a run
+RUN_INDEX_FILE = ".run_index.json"
+RUN_INDEX_VERSION = 1
+
+# runs being deleted are first moved here, which is instant, so they disappear from the working
+# dir before their (possibly huge) trees are removed
+TRASH_DIR = ".trash"
+
+# depth below a run dir at which its tree is split into separately deleted pieces, which is
+# run/test/results/resource
+DELETE_DEPTH = 3
+
+
+def load_index(working_dir: Path) -> dict:
+    """
+    Usage: read the run index of a working dir
+    @param working_dir: directory for storing info on exerciser runs
+    @return: dict of run names to their index entries, empty if there is no usable index
+    """
+    try:
+        with open(os.path.join(working_dir, RUN_INDEX_FILE), "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != RUN_INDEX_VERSION:
+        return {}
+    return index["runs"]
+
+
+def save_index(working_dir: Path, runs: dict):
+    """
+    Usage: write the run index of a working dir
+    @param working_dir: directory for storing info on exerciser runs
+    @param runs: dict of run names to their index entries
+    """
+    metrics.write_atomic(
+        os.path.join(working_dir, RUN_INDEX_FILE),
+        json.dumps({"version": RUN_INDEX_VERSION, "runs": runs}, separators=(",", ":")),
+    )
+
+
+def get_log_stamp(run_dir: str) -> list:
+    """
+    Usage: identify the state of a run by the size and mtime of its shared log, which grows as
+           long as its jobs keep writing results
+    @return: [size, mtime] of the shared log, or None if the run has none
+    """
+    try:
+        log_stat = os.stat(os.path.join(run_dir, "shared_exerciser.log"))
+    except OSError:
+        return None
+    return [log_stat.st_size, log_stat.st_mtime_ns]
+
+
+def index_runs(working_dir: Path, workers: int = 8) -> dict:
+    """
+    Usage: bring the run index of a working dir up to date. the size of a run is only measured
+           again if its shared log changed since it was indexed, and the measuring is spread over
+           a pool of threads. entries that aren't run dirs are skipped with a warning
+    @param working_dir: directory for storing info on exerciser runs
+    @param workers: number of run dirs measured at the same time
+    @return: dict of run names to dicts with the run's start "time" (unix time), its "size" in
+             bytes, and the "log" stamp it was measured at
+    """
+    old_runs = load_index(working_dir)
+    runs = {}
+    to_measure = []
+    for entry in os.scandir(working_dir):
+        # hidden entries hold the test store, snapshots, indexes and trash, not runs
+        if entry.name.startswith("."):
+            continue
+        run_time = monitor.parse_run_time(entry.name)
+        if not entry.is_dir(follow_symlinks=False) or run_time is None:
+            print(f"Warning: Skipping {entry.name} in working directory, not an exerciser run")
+            continue
+
+        log_stamp = get_log_stamp(entry.path)
+        old_run = old_runs.get(entry.name)
+        if old_run is not None and log_stamp is not None and old_run["log"] == log_stamp:
+            runs[entry.name] = old_run
+        else:
+            runs[entry.name] = {"time": run_time.timestamp(), "size": 0, "log": log_stamp}
+            to_measure.append(entry.name)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sizes = pool.map(
+            metrics.dir_size, [os.path.join(working_dir, name) for name in to_measure]
+        )
+        for name, size in zip(to_measure, sizes):
+            runs[name]["size"] = size
+
+    runs = dict(sorted(runs.items(), key=lambda item: (item[1]["time"], item[0])))
+    save_index(working_dir, runs)
+    return runs
+
+
+def select_expired(runs: dict, policy: dict, now: float = None) -> list:
+    """
+    Usage: pick the runs a retention policy drops
+    @param runs: run index as returned by index_runs()
+    @param policy: dict with any of "all" (drop every run), "before" (drop runs started before this
+                   datetime), "keep_last" (keep the newest this many runs), "keep_daily" (keep the
+                   newest run of each of the last this many days), and "max_size" (drop the
+                   oldest runs until the rest take up at most this many bytes). runs kept by
+                   keep_last or keep_daily are not dropped by all or before, but may be dropped by
+                   max_size. max_size never drops the newest run
+    @param now: unix time the policy is applied at. defaults to the current time
+    @return: list of the names of the runs to delete, oldest first
+    """
+    names = list(runs.keys())
+
+    # runs started before the cutoff date are candidates for deletion. without a cutoff, every
+    # run is a candidate of the keep rules
+    has_keep_rules = policy.get("keep_last") is not None or policy.get("keep_daily") is not None
+    expired = set()
+    if policy.get("all"):
+        expired.update(names)
+    elif policy.get("before") is not None:
+        cutoff = policy["before"].timestamp()
+        expired.update(name for name in names if runs[name]["time"] < cutoff)
+    elif has_keep_rules:
+        expired.update(names)
+
+    if has_keep_rules:
+        kept = set()
+        if policy.get("keep_last") is not None:
+            kept.update(names[max(len(names) - policy["keep_last"], 0) :])
+        if policy.get("keep_daily") is not None:
+            now = now if now is not None else time.time()
+            first_day = datetime.fromtimestamp(now).date() - timedelta(days=policy["keep_daily"])
+            days = set()
+            for name in reversed(names):
+                day = datetime.fromtimestamp(runs[name]["time"]).date()
+                if day > first_day and day not in days:
+                    days.add(day)
+                    kept.add(name)
+        expired -= kept
+
+    if policy.get("max_size") is not None:
+        remaining = [name for name in names if name not in expired]
+        total = sum(runs[name]["size"] for name in remaining)
+        for name in remaining[:-1]:
+            if total <= policy["max_size"]:
+                break
+            expired.add(name)
+            total -= runs[name]["size"]
+
+    return [name for name in names if name in expired]
+
+
+def split_tree(path: str) -> list:
+    """
+    Usage: list the subtrees DELETE_DEPTH levels below a dir, which can be deleted in parallel.
+           deleting them separately is much faster than a single rmtree on network filesystems
+    @param path: dir to split
+    @return: list of str paths to the subtrees
+    """
+    subtrees = []
+
+    def collect(dir_path: str, depth: int):
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if depth == DELETE_DEPTH:
+                    subtrees.append(entry.path)
+                else:
+                    collect(entry.path, depth + 1)
+
+    collect(path, 1)
+    return subtrees
+
+
+def delete_worker(subtrees: queue.Queue):
+    """
+    Usage: delete subtrees from a queue until it is empty
+    """
+    while True:
+        try:
+            subtree = subtrees.get_nowait()
+        except queue.Empty:
+            return
+        shutil.rmtree(subtree, ignore_errors=True)
+
+
+def flush_trash(working_dir: Path, workers: int, expired: list = None):
+    """
+    Usage: delete every run in the trash of a working dir, then remove the test store blobs no
+           remaining run links to
+    @param working_dir: directory for storing info on exerciser runs
+    @param workers: number of subtrees deleted at the same time
+    @param expired: index entries of the runs that were moved to the trash, to report on
+    """
+    start = time.monotonic()
+    trash_dir = os.path.join(working_dir, TRASH_DIR)
+    runs = [entry.path for entry in os.scandir(trash_dir)]
+
+    # plain threads rather than an executor, since this runs in the background and executors
+    # refuse new work once the main thread has finished
+    subtrees = queue.Queue()
+    for run in runs:
+        for subtree in split_tree(run):
+            subtrees.put(subtree)
+    threads = [threading.Thread(target=delete_worker, args=(subtrees,)) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for run in runs:
+        shutil.rmtree(run, ignore_errors=True)
+
+    # blobs in the test store are shared by run dirs, and are only removed once no remaining
+    # run dir links to them
+    staging.collect_garbage(working_dir)
+    if expired:
+        freed = sum(run["size"] for run in expired)
+        print(
+            f"Flushed {len(expired)} runs, freeing {freed / 2**20:.1f} MiB, "
+            + f"in {time.monotonic() - start:.2f}s"
+        )
+
+
+def start_flush(working_dir: Path, policy: dict, workers: int = 8) -> threading.Thread:
+    """
+    Usage: apply a retention policy to a working dir. the expired runs are moved into the trash
+           right away, and deleted by a background thread, so a new run can be submitted while
+           they are removed. trash left behind by an interrupted flush is deleted along with them.
+           cached snapshots are deleted by the all and before rules of the policy
+    @param working_dir: directory for storing info on exerciser runs
+    @param policy: retention policy as described by select_expired()
+    @param workers: number of run dirs measured, and subtrees deleted, at the same time
+    @return: the (non-daemon, so the program waits for it before exiting) deleting thread
+    """
+    runs = index_runs(working_dir, workers)
+    expired = select_expired(runs, policy)
+    print(f"Flushing {len(expired)} of {len(runs)} runs from the working directory")
+
+    trash_dir = os.path.join(working_dir, TRASH_DIR)
+    os.makedirs(trash_dir, exist_ok=True)
+    expired_runs = []
+    for name in expired:
+        os.replace(
+            os.path.join(working_dir, name), os.path.join(trash_dir, f"{name}.{os.getpid()}")
+        )
+        expired_runs.append(runs.pop(name))
+    save_index(working_dir, runs)
+
+    # cached snapshots are hidden, so they aren't in the run index. they follow the date rules of
+    # the policy, while their number is already bounded by the snapshot cache itself
+    if policy.get("all"):
+        pruned = snapshot.prune_snapshots(working_dir, keep=0)
+    elif policy.get("before") is not None:
+        pruned = snapshot.prune_snapshots(working_dir, before=policy["before"])
+    else:
+        pruned = 0
+    if pruned > 0:
+        print(f"Deleted {pruned} cached snapshots")
+
+    thread = threading.Thread(target=flush_trash, args=(working_dir, workers, expired_runs))
+    thread.start()
+    return thread
+
+
+def print_runs(runs: dict):
+    """
+    Usage: print the run index of a working dir, oldest run first
+    @param runs: run index as returned by index_runs()
+    """
+    total = sum(run["size"] for run in runs.values())
+    print(f"{len(runs)} runs taking up {total / 2**20:.1f} MiB:")
+    for name, run in runs.items():
+        started = datetime.fromtimestamp(run["time"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\t{name}: started {started}, {run['size'] / 2**20:.1f} MiB")
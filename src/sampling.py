@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: placement of the samples of a run. within each resource, samples are spread over distinct
+    machines (or glideins, for slots that don't advertise a machine) from the run's pool snapshot,
+    instead of letting several of them land on the same host
+"""
+
+import random
+from math import ceil
+import snapshot
+
+# placement of samples that aren't pinned to a machine
+UNPINNED = "true"
+
+
+def get_targets(resource: dict) -> tuple:
+    """
+    Usage: find the machines a resource's samples can be spread over
+    @param resource: entry of a snapshot's resources dict
+    @return: tuple of the slot attribute identifying a target, and the sorted list of targets. the
+             list is empty if the snapshot doesn't tell the resource's machines or glideins apart
+    """
+    machines = resource.get("machines", {})
+    if len(machines) > 0:
+        return (snapshot.MACHINE_ATTR, sorted(machines.keys()))
+    glideins = [name for name in resource.get("glideins", {}) if name != snapshot.UNKNOWN]
+    return (snapshot.GLIDEIN_ATTR, sorted(glideins))
+
+
+def quote(value: str) -> str:
+    """
+    Usage: quote a str as a ClassAd string literal
+    """
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def plan_placements(pool_snapshot: dict, sample_percent: float, seed: str, grace: int) -> dict:
+    """
+    Usage: pick a distinct machine for every sample of every resource, as far as the resource has
+           machines to go around. which machines are picked is random, but the same for the same
+           seed, so every test of a run is placed on the same machines
+    @param pool_snapshot: snapshot dict the run is planned from
+    @param sample_percent: percent of machines to send tests to in each resource
+    @param seed: str seeding the choice of machines, e.g. the name of the run
+    @param grace: number of seconds a pinned sample waits for its machine before it may run on any
+                  machine of its resource. glideins come and go, so the machine may be gone by
+                  the time the job is matched
+    @return: dict of resource names to a list of one placement expression per sample. samples
+             beyond the number of distinct machines are not pinned
+    """
+    rng = random.Random(seed)
+    placements = {}
+    for name, resource in sorted(pool_snapshot["resources"].items()):
+        sample_size = ceil(resource["count"] * sample_percent)
+        attr, targets = get_targets(resource)
+        chosen = rng.sample(targets, min(sample_size, len(targets)))
+        placements[name] = [
+            f"(TARGET.{attr} == {quote(target)} || time() - MY.QDate > {grace})"
+            for target in chosen
+        ] + [UNPINNED] * (sample_size - len(chosen))
+    return placements
+
+
+def count_pinned(placements: dict) -> int:
+    """
+    Usage: count the samples of one test that were pinned to a distinct machine
+    @param placements: dict returned by plan_placements()
+    """
+    return sum(
+        1 for resource in placements.values() for placement in resource if placement != UNPINNED
+    )
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: streaming quantile sketch used for latency distributions. values are counted in
+    logarithmically sized buckets, so a sketch answers any quantile within RELATIVE_ACCURACY of the
+    true value while its size depends only on the range of the values, not on how many were added.
+    sketches are plain dicts, so they pickle into monitor checkpoints and merge across runs
+"""
+
+import math
+
+# quantiles are answered within this fraction of the true value
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+
+def new_sketch() -> dict:
+    """
+    Usage: create an empty sketch
+    @return: dict with the number of values added, the largest value, the number of values that
+             were 0 (or less), and the bucket index -> count map of the positive values
+    """
+    return {"count": 0, "max": 0.0, "zero": 0, "buckets": {}}
+
+
+def add(sketch: dict, value: float):
+    """
+    Usage: add a value to a sketch
+    @param sketch: sketch dict as returned by new_sketch()
+    @param value: value to add. values at or below 0 are counted as 0
+    """
+    sketch["count"] += 1
+    if value <= 0:
+        sketch["zero"] += 1
+        return
+    if value > sketch["max"]:
+        sketch["max"] = value
+    index = math.ceil(math.log(value) / LOG_GAMMA)
+    buckets = sketch["buckets"]
+    buckets[index] = buckets.get(index, 0) + 1
+
+
+def merge(into: dict, other: dict):
+    """
+    Usage: add every value counted by other into a sketch
+    @param into: sketch dict that is updated
+    @param other: sketch dict to merge in
+    """
+    into["count"] += other["count"]
+    into["zero"] += other["zero"]
+    into["max"] = max(into["max"], other["max"])
+    buckets = into["buckets"]
+    for index, count in other["buckets"].items():
+        buckets[index] = buckets.get(index, 0) + count
+
+
+def quantile(sketch: dict, q: float) -> float:
+    """
+    Usage: estimate a quantile of the values added to a sketch
+    @param sketch: sketch dict as returned by new_sketch()
+    @param q: quantile between 0 and 1, e.g. 0.9 for the 90th percentile
+    @return: estimated value, or None if the sketch is empty
+    """
+    if sketch["count"] == 0:
+        return None
+
+    rank = q * (sketch["count"] - 1)
+    seen = sketch["zero"]
+    if rank < seen:
+        return 0.0
+    for index in sorted(sketch["buckets"].keys()):
+        seen += sketch["buckets"][index]
+        if rank < seen:
+            # middle of the bucket, in the sense that minimizes the relative error
+            return min(2 * GAMMA**index / (GAMMA + 1), sketch["max"])
+    return sketch["max"]
+
+
+def summarize(sketch: dict) -> dict:
+    """
+    Usage: reduce a sketch to the numbers that are reported
+    @param sketch: sketch dict as returned by new_sketch()
+    @return: dict with count, p50, p90, p99 and max
+    """
+    return {
+        "count": sketch["count"],
+        "p50": quantile(sketch, 0.5),
+        "p90": quantile(sketch, 0.9),
+        "p99": quantile(sketch, 0.99),
+        "max": sketch["max"] if sketch["count"] > 0 else None,
+    }
@@ -0,0 +1,570 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: snapshots of the resources visible in the pool, cached on disk so that runs, --snapshot and
+    the monitor can share one collector query and compare the pool over time
+"""
+
+import htcondor2
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_COLLECTOR = "cm-1.ospool.osg-htc.org"
+# seconds to wait for any collector of a pool to answer a query
+DEFAULT_COLLECTOR_TIMEOUT = 30
+# collector specs with this prefix answer from a JSON file of ads, standing in for a live collector
+FILE_PREFIX = "file:"
+RESOURCE_ATTR = "GLIDEIN_ResourceName"
+
+# every snapshot also records where each resource sits in the pool hierarchy: the site and
+# institution it belongs to, and the machines its slots run on. slots that don't advertise their
+# machine are counted by the glidein they belong to instead
+SITE_ATTR = "GLIDEIN_Site"
+INSTITUTION_ATTR = "OSG_INSTITUTION_ID"
+MACHINE_ATTR = "Machine"
+GLIDEIN_ATTR = "GLIDEIN_MASTER_NAME"
+HIERARCHY_ATTRS = (SITE_ATTR, INSTITUTION_ATTR, MACHINE_ATTR, GLIDEIN_ATTR)
+UNKNOWN = "(unknown)"
+
+# cached snapshots live in a hidden dir of the working dir, and every run keeps a copy of the
+# snapshot it was planned from in its timestamp dir
+SNAPSHOT_DIR = ".snapshots"
+RUN_SNAPSHOT_FILE = "resource_snapshot.json.gz"
+SNAPSHOT_VERSION = 2
+# cached snapshots are named after the time they were taken
+SNAPSHOT_NAME_FORMAT = "%Y-%m-%d_%H-%M-%S"
+# newest cached snapshots kept when a new one is saved. older ones are deleted, runs still have
+# their own copy
+SNAPSHOT_CACHE_SIZE = 100
+# snapshots of older versions can still be read, they just lack the hierarchy
+READABLE_VERSIONS = (1, SNAPSHOT_VERSION)
+
+
+class PoolCollector:
+    """
+    Usage: htcondor2.Collector for a named host, remembering the host so snapshots can record
+        which collector they came from
+    """
+
+    def __init__(self, host: str):
+        self.name = host
+        self.collector = htcondor2.Collector(host)
+
+    def query(self, ad_type=None, constraint=None, projection=None) -> list:
+        """
+        Usage: query the collector, same as htcondor2.Collector.query()
+        """
+        return self.collector.query(ad_type=ad_type, constraint=constraint, projection=projection)
+
+
+class FileCollector:
+    """
+    Usage: local stand-in for htcondor2.Collector that answers queries from a JSON file holding a
+        list of ads, so snapshots (and collector failover) can be tried without a real collector.
+        the file is read on every query, so a missing or broken file fails like a down collector
+    """
+
+    def __init__(self, ads_file: Path):
+        self.name = f"{FILE_PREFIX}{os.path.abspath(ads_file)}"
+        self.ads_file = ads_file
+
+    def query(self, ad_type=None, constraint=None, projection=None) -> list:
+        """
+        Usage: return the stored ads, limited to the projected attributes. the constraint is not
+            evaluated, callers filter the ads they get back themselves
+        """
+        with open(self.ads_file, "r") as f:
+            ads = json.load(f)
+        if not projection:
+            return [dict(ad) for ad in ads]
+        return [{attr: ad[attr] for attr in projection if attr in ad} for ad in ads]
+
+
+class MultiCollector:
+    """
+    Usage: queries the collectors of one or more pools at the same time. each pool is answered by
+        the first of its collectors to return without an error, even if it returns no ads, and
+        the answers of every pool are merged. pools without an answer within the timeout are
+        skipped with a warning. which collector answered each pool, and how long it took, is kept
+        in answers
+    """
+
+    def __init__(self, pools: list, timeout: float = DEFAULT_COLLECTOR_TIMEOUT):
+        """
+        @param pools: list of (pool name, list of collectors) tuples. the collectors of a pool are
+                      replicas of each other, e.g. the central managers of a high availability pool
+        @param timeout: seconds to wait for an answer for every pool
+        """
+        self.pools = pools
+        self.timeout = timeout
+        self.name = ";".join(
+            ",".join(collector.name for collector in collectors) for _, collectors in pools
+        )
+        self.answers = []
+        self.failures = []
+        # collectors whose query hasn't returned yet. a hung collector isn't queried again until
+        # it returns, so repeated queries (e.g. by the daemon) never pile up threads on it
+        self.busy = set()
+        self.lock = threading.Lock()
+
+    def query_worker(self, results: queue.Queue, pool: str, collector, kwargs: dict):
+        """
+        Usage: query one collector, putting (pool, collector name, seconds, ads, error) on a queue
+        """
+        start = time.monotonic()
+        try:
+            ads = collector.query(**kwargs)
+            error = None
+        except Exception as err:
+            ads = None
+            error = str(err) or type(err).__name__
+        finally:
+            with self.lock:
+                self.busy.discard(collector)
+        results.put((pool, collector.name, time.monotonic() - start, ads, error))
+
+    def query(self, ad_type=None, constraint=None, projection=None) -> list:
+        """
+        Usage: query every collector, same as htcondor2.Collector.query()
+        @return: merged list of the ads of every pool that answered. raises RuntimeError if every
+                 collector failed or timed out
+        """
+        kwargs = {"ad_type": ad_type, "constraint": constraint, "projection": projection}
+        results = queue.Queue()
+        self.answers = []
+        self.failures = []
+
+        # daemon threads, so a collector that never answers doesn't keep the exerciser alive
+        pending = {}
+        for pool, collectors in self.pools:
+            pending[pool] = 0
+            for collector in collectors:
+                with self.lock:
+                    in_flight = collector in self.busy
+                    self.busy.add(collector)
+                if in_flight:
+                    error = "still answering an earlier query"
+                    self.failures.append(
+                        {"pool": pool, "collector": collector.name, "error": error}
+                    )
+                    print(f"Warning: Collector {collector.name} of pool {pool} is {error}")
+                    continue
+                threading.Thread(
+                    target=self.query_worker,
+                    args=(results, pool, collector, kwargs),
+                    daemon=True,
+                ).start()
+                pending[pool] += 1
+            if pending[pool] == 0:
+                del pending[pool]
+                print(f"Warning: No collector of pool {pool} can be queried, skipping it")
+
+        answered = {}
+        deadline = time.monotonic() + self.timeout
+        while len(pending) > 0:
+            try:
+                pool, name, seconds, ads, error = results.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except queue.Empty:
+                break
+            # a slower replica of a pool that was already answered
+            if pool not in pending:
+                continue
+            if error is None:
+                answered[pool] = ads
+                del pending[pool]
+                self.answers.append(
+                    {"pool": pool, "collector": name, "seconds": seconds, "ads": len(ads)}
+                )
+                continue
+
+            self.failures.append({"pool": pool, "collector": name, "error": error})
+            print(f"Warning: Collector {name} of pool {pool} failed: {error}")
+            pending[pool] -= 1
+            if pending[pool] == 0:
+                del pending[pool]
+                print(f"Warning: No collector of pool {pool} answered, skipping it")
+
+        for pool in pending:
+            error = f"no answer within {self.timeout}s"
+            self.failures.append({"pool": pool, "collector": None, "error": error})
+            print(f"Warning: No collector of pool {pool} answered in {self.timeout}s, skipping it")
+
+        if len(answered) == 0:
+            raise RuntimeError(f"No collector answered for any of the {len(self.pools)} pools")
+        return [ad for pool, _ in self.pools for ad in answered.get(pool, [])]
+
+
+def make_collector(spec: str):
+    """
+    Usage: create the collector for one host, or a FileCollector for a spec starting with file:
+    """
+    if spec.startswith(FILE_PREFIX):
+        return FileCollector(spec[len(FILE_PREFIX) :])
+    return PoolCollector(spec)
+
+
+def get_collector(collector_specs: list = None, timeout: float = DEFAULT_COLLECTOR_TIMEOUT):
+    """
+    Usage: create the collector to query for resources
+    @param collector_specs: list of pools to query, each given as [name=]host[,host...] where the
+                            hosts are collectors of the same pool, tried at the same time. a host
+                            of file:path answers from a JSON file of ads. defaults to the OSPool
+                            central manager
+    @param timeout: seconds to wait for an answer for every pool
+    @return: MultiCollector
+    """
+    pools = []
+    for spec in collector_specs or [DEFAULT_COLLECTOR]:
+        named = "=" in spec and not spec.startswith(FILE_PREFIX)
+        pool, hosts = spec.split("=", 1) if named else ("", spec)
+        hosts = [host.strip() for host in hosts.split(",") if host.strip() != ""]
+        if len(hosts) == 0:
+            print(f"Error: Collector {spec} lists no hosts")
+            sys.exit(1)
+        pool = pool.strip() or hosts[0]
+        if pool in (name for name, _ in pools):
+            print(f"Error: Pool {pool} is given more than once")
+            sys.exit(1)
+        pools.append((pool, [make_collector(host) for host in hosts]))
+    return MultiCollector(pools, timeout)
+
+
+def take_snapshot(collector, attrs: list = None) -> dict:
+    """
+    Usage: query the collector for the resources currently in the pool
+    @param collector: collector as returned by get_collector(), or a stand-in with the same query
+                      method
+    @param attrs: extra slot attributes to project, summarized per resource
+    @return: snapshot dict. its resources field maps every unique GLIDEIN_ResourceName to the
+             number of slots it has, the site and institution it belongs to, the number of slots
+             on each of its machines (and on each glidein, for slots without a machine), and for
+             each extra attribute the number of slots with each value of it. its answers field
+             lists which collector answered for each pool and how long it took, and its failures
+             field the collectors that didn't
+    """
+    attrs = sorted(set(attrs or []) - {RESOURCE_ATTR} - set(HIERARCHY_ATTRS))
+    start = time.monotonic()
+    ads = collector.query(
+        ad_type=htcondor2.AdTypes.StartDaemon,
+        constraint=f"!isUndefined({RESOURCE_ATTR})",
+        projection=[RESOURCE_ATTR] + list(HIERARCHY_ATTRS) + attrs,
+    )
+
+    resources = {}
+    # resource -> (site, institution) -> number of slots advertising them
+    placements = {}
+    for ad in ads:
+        name = ad.get(RESOURCE_ATTR)
+        if name is None:
+            continue
+        name = str(name)
+        resource = resources.get(name)
+        if resource is None:
+            resource = {
+                "count": 0,
+                "machines": {},
+                "glideins": {},
+                "attrs": {attr: {} for attr in attrs},
+            }
+            resources[name] = resource
+            placements[name] = {}
+        resource["count"] += 1
+        if MACHINE_ATTR in ad:
+            machine = str(ad[MACHINE_ATTR])
+            resource["machines"][machine] = resource["machines"].get(machine, 0) + 1
+        else:
+            glidein = str(ad[GLIDEIN_ATTR]) if GLIDEIN_ATTR in ad else UNKNOWN
+            resource["glideins"][glidein] = resource["glideins"].get(glidein, 0) + 1
+        placement = (
+            str(ad[SITE_ATTR]) if SITE_ATTR in ad else UNKNOWN,
+            str(ad[INSTITUTION_ATTR]) if INSTITUTION_ATTR in ad else UNKNOWN,
+        )
+        placements[name][placement] = placements[name].get(placement, 0) + 1
+        for attr in attrs:
+            value = str(ad[attr]) if attr in ad else ""
+            resource["attrs"][attr][value] = resource["attrs"][attr].get(value, 0) + 1
+
+    # a resource belongs to a single site. if its slots disagree, go with the majority
+    for name, resource in resources.items():
+        resource["site"], resource["institution"] = max(
+            placements[name].items(), key=lambda item: item[1]
+        )[0]
+
+    # which collector answered for each pool, and how long it took
+    collector_name = getattr(collector, "name", DEFAULT_COLLECTOR)
+    answers = getattr(collector, "answers", None)
+    if answers is None:
+        seconds = time.monotonic() - start
+        answers = [{"pool": collector_name, "collector": collector_name}]
+        answers[0].update({"seconds": seconds, "ads": len(ads)})
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "time": time.time(),
+        "collector": collector_name,
+        "answers": answers,
+        "failures": getattr(collector, "failures", []),
+        "attrs": attrs,
+        "resources": resources,
+    }
+
+
+def save_snapshot(snapshot: dict, path: Path):
+    """
+    Usage: write a snapshot to disk as gzipped JSON
+    @param snapshot: snapshot dict as returned by take_snapshot()
+    @param path: file to write
+    """
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt") as f:
+        json.dump(snapshot, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: Path) -> dict:
+    """
+    Usage: read a snapshot written by save_snapshot()
+    @param path: file to read
+    @return: snapshot dict, or None if the file is missing or unreadable
+    """
+    try:
+        with gzip.open(path, "rt") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") not in READABLE_VERSIONS:
+        return None
+    return snapshot
+
+
+def iter_cached_snapshots(working_dir: Path):
+    """
+    Usage: iterate through the cached snapshots of a working dir, newest first
+    @param working_dir: directory for storing info on exerciser runs
+    @return: generator of paths to snapshot files
+    """
+    snapshot_dir = os.path.join(working_dir, SNAPSHOT_DIR)
+    if not os.path.exists(snapshot_dir):
+        return
+    for name in sorted(os.listdir(snapshot_dir), reverse=True):
+        if name.endswith(".json.gz"):
+            yield os.path.join(snapshot_dir, name)
+
+
+def get_snapshot(working_dir: Path, ttl: int, collector=None, attrs: list = None) -> dict:
+    """
+    Usage: reuse the newest cached snapshot if it is younger than ttl seconds and holds every
+           requested attribute, otherwise query the collector and cache the result
+    @param working_dir: directory for storing info on exerciser runs
+    @param ttl: max age in seconds of a cached snapshot that may be reused. 0 always queries
+    @param collector: collector to query, as returned by get_collector()
+    @param attrs: extra slot attributes the snapshot must hold
+    @return: snapshot dict as returned by take_snapshot()
+    """
+    if collector is None:
+        collector = get_collector()
+    collector_name = getattr(collector, "name", DEFAULT_COLLECTOR)
+
+    if ttl > 0:
+        for path in iter_cached_snapshots(working_dir):
+            snapshot = load_snapshot(path)
+            if snapshot is None or snapshot["collector"] != collector_name:
+                continue
+            if snapshot["version"] != SNAPSHOT_VERSION:
+                continue
+            if time.time() - snapshot["time"] > ttl:
+                break
+            if set(attrs or []) <= set(snapshot["attrs"]) | {RESOURCE_ATTR}:
+                return snapshot
+
+    snapshot = take_snapshot(collector, attrs)
+    snapshot_dir = os.path.join(working_dir, SNAPSHOT_DIR)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = datetime.fromtimestamp(snapshot["time"]).strftime(SNAPSHOT_NAME_FORMAT)
+    save_snapshot(snapshot, os.path.join(snapshot_dir, f"{name}.json.gz"))
+    prune_snapshots(working_dir, SNAPSHOT_CACHE_SIZE)
+    return snapshot
+
+
+def prune_snapshots(working_dir: Path, keep: int = None, before: datetime = None) -> int:
+    """
+    Usage: delete cached snapshots of a working dir, newest kept first
+    @param working_dir: directory for storing info on exerciser runs
+    @param keep: number of newest snapshots to keep, or None for no limit
+    @param before: also delete snapshots taken before this datetime, if provided
+    @return: number of snapshots deleted
+    """
+    removed = 0
+    for index, path in enumerate(iter_cached_snapshots(working_dir)):
+        expired = keep is not None and index >= keep
+        if not expired and before is not None:
+            try:
+                taken = datetime.strptime(
+                    os.path.basename(path)[: -len(".json.gz")], SNAPSHOT_NAME_FORMAT
+                )
+            except ValueError:
+                continue
+            expired = taken < before
+        if not expired:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed += 1
+    return removed
+
+
+def resource_counts(snapshot: dict) -> dict:
+    """
+    Usage: reduce a snapshot to the number of slots per resource
+    @param snapshot: snapshot dict as returned by take_snapshot()
+    @return: dictionary whose keys are the names of all unique GLIDEIN_ResourceName s in the
+             snapshot, and whose values are their slot counts
+    """
+    return {name: resource["count"] for name, resource in snapshot["resources"].items()}
+
+
+def build_hierarchy(snapshot: dict) -> dict:
+    """
+    Usage: index the resources of a snapshot by the levels of the pool hierarchy
+    @param snapshot: snapshot dict as returned by take_snapshot()
+    @return: dict with the (institution, site) of every resource under "resources", and the
+             resources, slot count and machine count of every site under "sites", keyed by
+             (institution, site). resources of snapshots without hierarchy are placed at an
+             unknown site and institution
+    """
+    index = {"resources": {}, "sites": {}}
+    for name, resource in snapshot["resources"].items():
+        key = (resource.get("institution", UNKNOWN), resource.get("site", UNKNOWN))
+        index["resources"][name] = key
+        site = index["sites"].get(key)
+        if site is None:
+            site = {"resources": [], "slots": 0, "machines": 0}
+            index["sites"][key] = site
+        site["resources"].append(name)
+        site["slots"] += resource["count"]
+        site["machines"] += len(resource.get("machines", {}))
+    return index
+
+
+def find_snapshot(working_dir: Path, ref: str) -> dict:
+    """
+    Usage: load a snapshot by reference, exiting if it can't be found
+    @param working_dir: directory for storing info on exerciser runs
+    @param ref: path to a snapshot file, the timestamp of an exerciser run, the name of a cached
+                snapshot, or "latest" for the newest cached snapshot
+    @return: snapshot dict
+    """
+    if ref == "latest":
+        candidates = list(iter_cached_snapshots(working_dir))[:1]
+    else:
+        candidates = [
+            ref,
+            os.path.join(working_dir, ref, RUN_SNAPSHOT_FILE),
+            os.path.join(working_dir, SNAPSHOT_DIR, ref),
+            os.path.join(working_dir, SNAPSHOT_DIR, f"{ref}.json.gz"),
+        ]
+
+    for path in candidates:
+        if os.path.isfile(path):
+            snapshot = load_snapshot(path)
+            if snapshot is not None:
+                return snapshot
+    print(f"Error: Could not find a snapshot for '{ref}'")
+    sys.exit(1)
+
+
+def diff_snapshots(old: dict, new: dict) -> dict:
+    """
+    Usage: compare the resources of two snapshots
+    @param old: earlier snapshot dict
+    @param new: later snapshot dict
+    @return: dict with the resources that appeared (name -> count), disappeared (name -> count),
+             and changed size (name -> (old count, new count))
+    """
+    old_counts = resource_counts(old)
+    new_counts = resource_counts(new)
+    return {
+        "appeared": {
+            name: count for name, count in new_counts.items() if name not in old_counts
+        },
+        "disappeared": {
+            name: count for name, count in old_counts.items() if name not in new_counts
+        },
+        "changed": {
+            name: (old_counts[name], count)
+            for name, count in new_counts.items()
+            if name in old_counts and old_counts[name] != count
+        },
+    }
+
+
+def print_snapshot(snapshot: dict):
+    """
+    Usage: print every resource in a snapshot with its slot count, and how many of its slots have
+           each value of the snapshot's extra attributes
+    @param snapshot: snapshot dict as returned by take_snapshot()
+    """
+    taken = datetime.fromtimestamp(snapshot["time"]).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"Snapshot of {snapshot['collector']} taken at {taken}")
+    for answer in snapshot.get("answers", []):
+        print(
+            f"Pool {answer['pool']} answered by {answer['collector']} in "
+            + f"{answer['seconds']:.2f}s ({answer['ads']} slots)"
+        )
+    for failure in snapshot.get("failures", []):
+        collector = failure["collector"] or "every collector"
+        print(f"Pool {failure['pool']}: {collector} failed: {failure['error']}")
+    for name, count in sorted(resource_counts(snapshot).items()):
+        print(f"{name} ({count} slots)")
+        for attr, values in sorted(snapshot["resources"][name]["attrs"].items()):
+            summary = ", ".join(
+                f"{value or 'undefined'}: {slots}"
+                for value, slots in sorted(values.items(), key=lambda item: -item[1])
+            )
+            print(f"\t{attr}: {summary}")
+
+
+def print_diff(old: dict, new: dict):
+    """
+    Usage: print the differences between two snapshots
+    @param old: earlier snapshot dict
+    @param new: later snapshot dict
+    """
+    diff = diff_snapshots(old, new)
+    for label, snapshot in (("Old", old), ("New", new)):
+        taken = datetime.fromtimestamp(snapshot["time"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{label} snapshot: {len(snapshot['resources'])} resources, taken at {taken}")
+
+    print(f"{len(diff['appeared'])} resources appeared:")
+    for name, count in sorted(diff["appeared"].items()):
+        print(f"\t+ {name} ({count} slots)")
+    print(f"{len(diff['disappeared'])} resources disappeared:")
+    for name, count in sorted(diff["disappeared"].items()):
+        print(f"\t- {name} ({count} slots)")
+    print(f"{len(diff['changed'])} resources changed size:")
+    for name, (old_count, new_count) in sorted(diff["changed"].items()):
+        print(f"\t~ {name} ({old_count} -> {new_count} slots)")
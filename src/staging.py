@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: content-addressed store of test input files, used to stage tests into execute dirs with
+    hardlinks (or reflinks) instead of full copies
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import time
+from pathlib import Path
+
+# name of the store dir inside the working dir. hidden so it is never mistaken for a run dir
+STORE_DIR = ".test_store"
+# blobs are read in chunks of this many bytes when they are hashed
+HASH_CHUNK_SIZE = 1024 * 1024
+# ioctl request code for cloning a file on filesystems that support reflinks (linux FICLONE)
+FICLONE = 0x40049409
+
+# blobs are written to a temp file first. temp files younger than this many seconds may still be
+# being written, by a run staging while an earlier flush collects garbage in the background
+TMP_BLOB_GRACE = 3600
+
+# errors from os.link that mean the link can't be made here, rather than that something is wrong
+LINK_FALLBACK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES)
+
+
+def open_store(working_dir: Path) -> dict:
+    """
+    Usage: open (creating if needed) the content-addressed test store in the working dir
+    @param working_dir: directory for storing info on exerciser runs
+    @return: dict describing the store: its dir, its index of already hashed source files, and a
+             lock guarding the index so tests can be staged from several threads
+    """
+    store_dir = os.path.join(working_dir, STORE_DIR)
+    os.makedirs(os.path.join(store_dir, "blobs"), exist_ok=True)
+
+    # the index maps the absolute path of a source file to the size, mtime and hash it had when
+    # it was last added, so unchanged files don't have to be hashed again
+    index = {}
+    index_file = os.path.join(store_dir, "index.json")
+    if os.path.exists(index_file):
+        try:
+            with open(index_file, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            print(f"Warning: Unreadable test store index {index_file}. Rehashing test files")
+
+    return {"dir": store_dir, "index": index, "lock": threading.Lock()}
+
+
+def save_store(store: dict):
+    """
+    Usage: write the index of the store back to disk
+    @param store: store dict as returned by open_store()
+    """
+    index_file = os.path.join(store["dir"], "index.json")
+    tmp_file = index_file + ".tmp"
+    with store["lock"]:
+        with open(tmp_file, "w") as f:
+            json.dump(store["index"], f)
+    os.replace(tmp_file, index_file)
+
+
+def hash_file(path: Path) -> str:
+    """
+    Usage: compute the sha256 of a file without reading it into memory all at once
+    @param path: file to hash
+    @return: hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_file(store: dict, src: Path) -> str:
+    """
+    Usage: make sure the contents of src are in the store
+    @param store: store dict as returned by open_store()
+    @param src: source file from a test dir
+    @return: str path to the read-only blob holding the contents of src
+    """
+    src = os.path.abspath(src)
+    src_stat = os.stat(src)
+    executable = bool(src_stat.st_mode & stat.S_IXUSR)
+
+    with store["lock"]:
+        entry = store["index"].get(src)
+    if entry is not None and entry[0] == src_stat.st_size and entry[1] == src_stat.st_mtime_ns:
+        file_hash = entry[2]
+    else:
+        file_hash = hash_file(src)
+        with store["lock"]:
+            store["index"][src] = [src_stat.st_size, src_stat.st_mtime_ns, file_hash]
+
+    # blobs are shared through hardlinks, which share permissions, so executable and plain
+    # copies of the same contents are kept as separate blobs
+    blob = os.path.join(
+        store["dir"], "blobs", file_hash[:2], file_hash + (".x" if executable else "")
+    )
+    if not os.path.exists(blob):
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        tmp_blob = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+        clone_or_copy(src, tmp_blob)
+        # blobs are never modified in place, since every execute dir linking to them would see it
+        os.chmod(tmp_blob, 0o555 if executable else 0o444)
+        os.replace(tmp_blob, blob)
+
+    return blob
+
+
+def clone_or_copy(src: Path, dst: Path):
+    """
+    Usage: copy src to dst, sharing the data blocks with a reflink if the filesystem supports it
+    @param src: file to copy
+    @param dst: path of the new file
+    """
+    try:
+        import fcntl
+
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        shutil.copystat(src, dst)
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+
+
+def stage_file(store: dict, src: Path, dst_dir: Path) -> str:
+    """
+    Usage: place a test file into an execute dir by linking it to its blob in the store. falls
+           back to a reflink or a plain copy when a hardlink can't be made (e.g. across
+           filesystems)
+    @param store: store dict as returned by open_store()
+    @param src: source file from a test dir
+    @param dst_dir: dir to place the file in, under the same name as src
+    @return: str path to the staged file
+    """
+    blob = add_file(store, src)
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    try:
+        try:
+            os.link(blob, dst)
+        except FileNotFoundError:
+            # the blob was garbage collected between adding and linking it, so add it again
+            blob = add_file(store, src)
+            os.link(blob, dst)
+    except OSError as err:
+        if err.errno not in LINK_FALLBACK_ERRNOS:
+            raise
+        clone_or_copy(blob, dst)
+        os.chmod(dst, os.stat(src).st_mode & 0o777)
+    return dst
+
+
+def stage_tree(store: dict, src: Path, dst: Path):
+    """
+    Usage: recreate a dir tree from a test dir in an execute dir, staging every file in it
+    @param store: store dict as returned by open_store()
+    @param src: source dir from a test dir
+    @param dst: path of the new dir
+    """
+    os.makedirs(dst)
+    for item in Path(src).iterdir():
+        if item.is_dir():
+            stage_tree(store, item, os.path.join(dst, item.name))
+        else:
+            stage_file(store, item, dst)
+
+
+def collect_garbage(working_dir: Path) -> int:
+    """
+    Usage: remove blobs that no execute dir refers to anymore. the link count of a blob is its
+           reference count: the store holds one link, and every execute dir staged from it holds
+           one more, so it is only safe to remove blobs whose link count has dropped to 1
+    @param working_dir: directory for storing info on exerciser runs
+    @return: number of blobs removed
+    """
+    blobs_dir = os.path.join(working_dir, STORE_DIR, "blobs")
+    if not os.path.exists(blobs_dir):
+        return 0
+
+    removed = 0
+    for prefix in os.scandir(blobs_dir):
+        if not prefix.is_dir(follow_symlinks=False):
+            continue
+        for blob in os.scandir(prefix.path):
+            blob_stat = blob.stat(follow_symlinks=False)
+            if blob.name.endswith(".tmp") and time.time() - blob_stat.st_ctime < TMP_BLOB_GRACE:
+                continue
+            if blob_stat.st_nlink <= 1:
+                os.remove(blob.path)
+                removed += 1
+    return removed
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: triage of failed jobs by their error text. each text is normalized by replacing the parts
+    that differ from node to node (paths, hostnames, addresses, numbers) with placeholders, and
+    identical normalized texts share a signature. signatures whose word sets are at least
+    NEAR_DUPLICATE_SIMILARITY similar are merged, so messages that differ in a word or two end up
+    in the same cluster. candidates for merging are found with minhash banding, so signatures are
+    never compared all against all
+"""
+
+import hashlib
+import re
+
+# one alternation, so every text is scanned once. at each position the first alternative that
+# matches wins, so e.g. a path is replaced before the numbers inside it
+NORMALIZE_PATTERN = re.compile(
+    r"(?P<uuid>\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b)"
+    + r"|(?P<ip>\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b)"
+    + r"|(?P<path>(?:\b[A-Za-z]:)?(?:/[\w.+@%-]+)+/?)"
+    + r"|(?P<host>\b[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}\b)"
+    + r"|(?P<hex>\b0[xX][0-9a-fA-F]+\b|\b[0-9a-fA-F]{16,}\b)"
+    + r"|(?P<n>\d+(?:\.\d+)?)"
+    + r"|(?P<space>[ \t]+)"
+    + r"|(?P<newline>\s*\n\s*)"
+)
+REPLACEMENTS = {
+    "uuid": "<uuid>",
+    "ip": "<ip>",
+    "path": "<path>",
+    "host": "<host>",
+    "hex": "<hex>",
+    "n": "<n>",
+    "space": " ",
+    "newline": "\n",
+}
+
+# signatures whose word sets have at least this jaccard similarity are merged
+NEAR_DUPLICATE_SIMILARITY = 0.8
+# minhash parameters. with 8 bands of 2 rows, two signatures with a similarity of 0.8 share a
+# band, and so get compared, with a probability above 99.9%
+MINHASH_BANDS = 8
+MINHASH_ROWS = 2
+MINHASH_PRIME = (1 << 61) - 1
+# limit on the clusters each signature is compared against within one band
+MAX_REPRESENTATIVES = 32
+MINHASH_PARAMS = [
+    (
+        int.from_bytes(hashlib.blake2b(b"a%d" % i, digest_size=8).digest(), "big") | 1,
+        int.from_bytes(hashlib.blake2b(b"b%d" % i, digest_size=8).digest(), "big"),
+    )
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def normalize_error(text: str) -> str:
+    """
+    Usage: strip the node specific parts of an error text
+    @param text: error text of a job, e.g. the end of its .err file
+    @return: normalized text
+    """
+    return NORMALIZE_PATTERN.sub(lambda match: REPLACEMENTS[match.lastgroup], text).strip()
+
+
+def minhash(words: set, word_hashes: dict) -> list:
+    """
+    Usage: compute the minhash of a set of words. the chance that two sets agree on any one value
+           equals their jaccard similarity
+    @param words: set of words of a normalized error text
+    @param word_hashes: dict of word -> hash shared between calls, so each word is hashed once
+    @return: list of MINHASH_BANDS * MINHASH_ROWS ints
+    """
+    hashes = []
+    for word in words:
+        value = word_hashes.get(word)
+        if value is None:
+            value = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "big")
+            word_hashes[word] = value
+        hashes.append(value)
+    if len(hashes) == 0:
+        hashes.append(0)
+    return [min((a * h + b) % MINHASH_PRIME for h in hashes) for a, b in MINHASH_PARAMS]
+
+
+def similarity(first: set, second: set) -> float:
+    """
+    Usage: jaccard similarity of two word sets
+    """
+    union = len(first | second)
+    return len(first & second) / union if union > 0 else 1.0
+
+
+def cluster_failures(failures) -> list:
+    """
+    Usage: group failed jobs by the signature of their error text, merging near duplicates
+    @param failures: iterable of (resource, error text) tuples, one per failed job
+    @return: list of cluster dicts with the signature, a representative normalized message, the
+             number of jobs, the resource -> job count dict, and the number of distinct signatures
+             merged into it, largest cluster first
+    """
+    # identical error texts are common when a problem hits the whole pool, so each distinct text
+    # is normalized only once
+    normalized = {}
+    signatures = {}
+    for resource, text in failures:
+        message = normalized.get(text)
+        if message is None:
+            message = normalize_error(text)
+            normalized[text] = message
+        signature = hashlib.sha1(message.encode()).hexdigest()[:12]
+        entry = signatures.get(signature)
+        if entry is None:
+            entry = {"message": message, "jobs": 0, "resources": {}}
+            signatures[signature] = entry
+        entry["jobs"] += 1
+        entry["resources"][resource] = entry["resources"].get(resource, 0) + 1
+
+    # union find over the distinct signatures, only comparing signatures that share a band
+    parents = {signature: signature for signature in signatures}
+
+    def find(signature):
+        while parents[signature] != signature:
+            parents[signature] = parents[parents[signature]]
+            signature = parents[signature]
+        return signature
+
+    # signatures that only differ in word order or repeated words are merged right away, and
+    # only one of them takes part in the near duplicate search
+    words = {}
+    word_sets = {}
+    for signature, entry in signatures.items():
+        word_set = frozenset(entry["message"].split())
+        first = word_sets.get(word_set)
+        if first is None:
+            word_sets[word_set] = signature
+            words[signature] = word_set
+        else:
+            parents[signature] = first
+
+    bands = {}
+    word_hashes = {}
+    for signature, word_set in words.items():
+        values = minhash(word_set, word_hashes)
+        for band in range(MINHASH_BANDS):
+            key = (band, tuple(values[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS]))
+            bands.setdefault(key, []).append(signature)
+
+    # each signature is compared against one representative of every cluster already seen in
+    # the band, so a band holding many variants of one message costs linear, not quadratic, time.
+    # bands shared by many unrelated messages stop taking new representatives at MAX_REPRESENTATIVES
+    for members in bands.values():
+        representatives = []
+        for signature in members:
+            for representative in representatives:
+                if find(representative) == find(signature):
+                    break
+                if similarity(words[signature], words[representative]) >= NEAR_DUPLICATE_SIMILARITY:
+                    parents[find(signature)] = find(representative)
+                    break
+            else:
+                if len(representatives) < MAX_REPRESENTATIVES:
+                    representatives.append(signature)
+
+    clusters = {}
+    for signature, entry in signatures.items():
+        root = find(signature)
+        cluster = clusters.get(root)
+        if cluster is None:
+            cluster = {
+                "signature": root,
+                "message": None,
+                "jobs": 0,
+                "resources": {},
+                "variants": 0,
+            }
+            clusters[root] = cluster
+        # the most common variant represents the cluster
+        if cluster["message"] is None or entry["jobs"] > cluster["top_jobs"]:
+            cluster["message"] = entry["message"]
+            cluster["top_jobs"] = entry["jobs"]
+        cluster["jobs"] += entry["jobs"]
+        cluster["variants"] += 1
+        for resource, count in entry["resources"].items():
+            cluster["resources"][resource] = cluster["resources"].get(resource, 0) + count
+
+    for cluster in clusters.values():
+        del cluster["top_jobs"]
+    return sorted(clusters.values(), key=lambda cluster: (-cluster["jobs"], cluster["signature"]))
+
+
+def print_triage(clusters: list, verbosity: int, limit: int):
+    """
+    Usage: print failure clusters, largest first
+    @param clusters: list returned by cluster_failures()
+    @param verbosity: at verbosity 0 only the first few resources of each cluster are listed, and
+                      at 1 and up all of them
+    @param limit: maximum number of clusters to print
+    """
+    if len(clusters) == 0:
+        print("Failure triage: no failed jobs with error output")
+        return
+
+    total = sum(cluster["jobs"] for cluster in clusters)
+    print(f"Failure triage: {total} failed jobs with error output in {len(clusters)} clusters")
+    for cluster in clusters[:limit]:
+        resources = sorted(cluster["resources"].items(), key=lambda item: (-item[1], item[0]))
+        print(
+            f"\t[{cluster['signature']}] {cluster['jobs']} jobs on {len(resources)} resources"
+            + (f", {cluster['variants']} variants" if cluster["variants"] > 1 else "")
+        )
+        # the last lines of a traceback or error dump usually name the actual problem
+        for line in cluster["message"].splitlines()[-3:]:
+            print(f"\t\t| {line}")
+        listed = resources if verbosity > 0 else resources[:5]
+        for resource, count in listed:
+            print(f"\t\t{resource}" + (f" ({count} jobs)" if count > 1 else ""))
+        if len(listed) < len(resources):
+            print(f"\t\t... and {len(resources) - len(listed)} more resources")
+    if len(clusters) > limit:
+        print(f"\t... and {len(clusters) - limit} more clusters")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# Copyright 2024 HTCondor Team, Computer Sciences Department,
+# University of Wisconsin-Madison, WI.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Usage: early cancellation of the remaining samples of a resource. follows the shared log of a
+    run, and once a test has clearly failed or clearly passed on a resource, removes that test's
+    jobs which are still idle on the resource instead of leaving them in the queue until
+    periodic_remove gives up on them
+"""
+
+import htcondor2
+from htcondor2 import JobEventLog
+from htcondor2 import JobEventType
+from datetime import datetime
+from pathlib import Path
+import json
+import os
+import sampling
+
+# submit notes of every exerciser job: this prefix, then "test,resource,sample,attempt". notes
+# written before --retry existed lack the attempt
+LOG_NOTES_PREFIX = "exerciser_info"
+
+# every removal is done with a reason starting with this text, so the abort events it causes can
+# be told apart from system failures
+CANCEL_REASON = "EXERCISER cancelled (decided)"
+
+# every removal is also recorded in this file of the run's timestamp dir, one JSON object per line
+CANCEL_LOG_FILE = "cancellations.jsonl"
+
+
+def watch_run(timestamp_dir: Path, policy: dict, schedd: htcondor2.Schedd = None):
+    """
+    Usage: follow the shared log of a run until every job in it has finished, cancelling the idle
+           jobs of each test and resource as soon as its outcome is decided
+    @param timestamp_dir: top level dir of the exerciser run
+    @param policy: dict with the "failures" and "successes" thresholds (None to never decide on
+                   that outcome) and the "interval" in seconds between checks of the shared log
+    @param schedd: schedd the run's jobs were submitted to. the local schedd if not provided
+    """
+    if schedd is None:
+        schedd = htcondor2.Schedd()
+    run_id = os.path.basename(os.path.normpath(timestamp_dir))
+    event_log = JobEventLog(os.path.join(timestamp_dir, "shared_exerciser.log"))
+
+    # (cluster, proc) -> (test, resource) of every job that hasn't finished yet
+    pending = {}
+    # (test, resource) -> [jobs passed, jobs failed or aborted]
+    outcomes = {}
+    decided = set()
+
+    print(f"Watching run {run_id} for resources with a decided outcome")
+    try:
+        while True:
+            for event in event_log.events(policy["interval"]):
+                if event.type is JobEventType.SUBMIT:
+                    notes = parse_log_notes(event.get("LogNotes", ""))
+                    if notes is not None:
+                        pending[(event.cluster, event.proc)] = notes[:2]
+                    continue
+                if event.type not in (JobEventType.JOB_TERMINATED, JobEventType.JOB_ABORTED):
+                    continue
+                job = pending.pop((event.cluster, event.proc), None)
+                if job is None or job in decided:
+                    continue
+                # jobs removed by an earlier cancellation decide nothing
+                if event.type is JobEventType.JOB_ABORTED and str(
+                    event.get("Reason", "")
+                ).startswith(CANCEL_REASON):
+                    continue
+
+                counts = outcomes.setdefault(job, [0, 0])
+                if event.type is JobEventType.JOB_TERMINATED and event.get("ReturnValue") == 0:
+                    counts[0] += 1
+                else:
+                    counts[1] += 1
+
+                decision = decide(counts, policy)
+                if decision is not None:
+                    decided.add(job)
+                    cancel_jobs(schedd, timestamp_dir, run_id, job[0], job[1], decision, counts)
+
+            # the log has been read to its end. with no job left unfinished, including when the
+            # run had no exerciser jobs at all, there is nothing left to decide
+            if len(pending) == 0:
+                print(f"Every job of run {run_id} has finished")
+                return
+    except KeyboardInterrupt:
+        print(f"Stopped watching run {run_id}")
+
+
+def parse_log_notes(log_notes: str) -> tuple:
+    """
+    Usage: read the submit notes of an exerciser job, "exerciser_info:test,resource,sample,attempt".
+           the resource name comes from the pool and may itself hold commas and colons, so the
+           test is split off from the left and the sample and attempt from the right. e.g.
+           "exerciser_info:checksum,RES,A:1,3,0" is ("checksum", "RES,A:1", 3, 0). notes without
+           the attempt are read as attempt 0, as long as their resource has no commas
+    @param log_notes: LogNotes of a submit event
+    @return: (test, resource, sample, attempt), or None if the notes aren't those of an exerciser
+             job
+    """
+    prefix, _, fields = log_notes.partition(":")
+    if prefix != LOG_NOTES_PREFIX or fields.count(",") < 2:
+        return None
+    test, fields = fields.split(",", 1)
+    if fields.count(",") == 1:
+        resource, sample = fields.split(",")
+        attempt = "0"
+    else:
+        resource, sample, attempt = fields.rsplit(",", 2)
+    try:
+        return (test, resource, int(sample), int(attempt) if attempt != "" else 0)
+    except ValueError:
+        return None
+
+
+def decide(counts: list, policy: dict) -> str:
+    """
+    Usage: check whether the outcome of a test on a resource is decided
+    @param counts: [jobs passed, jobs failed or aborted] of the test on the resource
+    @param policy: dict with the "failures" and "successes" thresholds
+    @return: "failed" or "passed" once a threshold is reached, otherwise None
+    """
+    if policy["failures"] is not None and counts[1] >= policy["failures"]:
+        return "failed"
+    if policy["successes"] is not None and counts[0] >= policy["successes"]:
+        return "passed"
+    return None
+
+
+def cancel_jobs(
+    schedd: htcondor2.Schedd,
+    timestamp_dir: Path,
+    run_id: str,
+    test: str,
+    resource: str,
+    decision: str,
+    counts: list,
+):
+    """
+    Usage: remove the idle jobs of a test on a resource, and record the removal
+    @param schedd: schedd the run's jobs were submitted to
+    @param timestamp_dir: top level dir of the exerciser run
+    @param run_id: name of the run's timestamp dir
+    @param test: name of the test
+    @param resource: GLIDEIN_ResourceName the jobs target
+    @param decision: "failed" or "passed"
+    @param counts: [jobs passed, jobs failed or aborted] the decision was made on
+    """
+    # the test and resource names come from the log and the pool, so they are quoted rather than
+    # trusted to be free of quotes
+    constraint = (
+        f"EXERCISER_Job == true && JobStatus == 1 && EXERCISER_Run == {sampling.quote(run_id)} && "
+        + f"EXERCISER_TestName == {sampling.quote(test)} && "
+        + f"EXERCISER_ResourceName == {sampling.quote(resource)}"
+    )
+    reason = f"{CANCEL_REASON}: {decision} after {counts[0]} passed and {counts[1]} failed"
+    result = schedd.act(htcondor2.JobAction.Remove, constraint, reason=reason)
+    removed = result.get("TotalSuccess", 0) if result is not None else 0
+
+    with open(os.path.join(timestamp_dir, CANCEL_LOG_FILE), "a") as f:
+        f.write(
+            json.dumps(
+                {
+                    "time": datetime.now().isoformat(timespec="seconds"),
+                    "test": test,
+                    "resource": resource,
+                    "decision": decision,
+                    "passed": counts[0],
+                    "failed": counts[1],
+                    "removed": removed,
+                }
+            )
+            + "\n"
+        )
+    print(
+        f"Cancelled {removed} idle {test} jobs on {resource}: {decision} after {counts[0]} "
+        + f"passed and {counts[1]} failed"
+    )